@@ -0,0 +1,205 @@
+"""Compare clean_python_code against the previous line-by-line implementation
+on large model responses.
+
+Usage:
+    python benchmarks/bench_clean_python_code.py [--tests 1000] [--runs 5]
+"""
+
+import argparse
+import ast
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from helper import clean_python_code  # noqa: E402
+
+HEADER = """import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent / "../src"))
+
+from inventory import *
+import pytest
+
+
+@pytest.fixture
+def store():
+    return Store(capacity=10)
+"""
+
+TEST_TEMPLATE = '''
+
+@pytest.mark.parametrize("amount,expected", [(1, 9), (5, 5)])
+def test_remove_{index}(store, amount, expected):
+    """Removing items must reduce the stock; it's checked for {index} too."""
+    store.add("item_{index}", 10)
+    store.remove("item_{index}", amount)
+    result = store.stock(
+        "item_{index}",
+    )
+    assert result == expected
+'''
+
+PROSE = "Here's the next group of tests, they're validated against the store:\n"
+
+
+# The implementation before the tokenize-based rewrite, kept for comparison
+def legacy_clean_python_code(text: str) -> str:
+    """Cleans a string containing Python code mixed with natural language,
+    preserving only valid Python code, blank lines, comments, and docstrings.
+
+    Args:
+        text (str): Input text containing Python code and natural language
+
+    Returns:
+        str: Cleaned text with natural language removed
+    """
+
+    def try_parse_line(line: str) -> bool:
+        """Check if a single line could be part of valid Python code."""
+        stripped = line.strip()
+        if not stripped:
+            return True
+
+        if any(
+            [
+                stripped.startswith("#"),
+                stripped.startswith(('"""', "'''")),
+                stripped.startswith(("import ", "from ")),
+                stripped.startswith(("def ", "class ")),
+                stripped.startswith("@"),
+                stripped.startswith(
+                    ("if ", "elif ", "else:", "try:", "except", "finally:")
+                ),
+                stripped.startswith(("while ", "for ")),
+                stripped.startswith(("return ", "yield ", "raise ")),
+                stripped in ("pass", "break", "continue"),
+                stripped.startswith("print("),
+                "=" in stripped,
+            ]
+        ):
+            return True
+
+        if line.startswith((" ", "\t")):
+            return True
+
+        try:
+            ast.parse(stripped, mode="eval")
+            return True
+        except:
+            pass
+
+        return False
+
+    lines = text.split("\n")
+    result_lines = []
+    in_multiline_string = False
+
+    for line in lines:
+        stripped = line.strip()
+        if stripped.count('"""') % 2 == 1 or stripped.count("'''") % 2 == 1:
+            in_multiline_string = not in_multiline_string
+
+        if not stripped or in_multiline_string or try_parse_line(line):
+            result_lines.append(line)
+
+    result = "\n".join(result_lines)
+
+    try:
+        ast.parse(result)
+        return result
+    except:
+        final_lines = []
+        current_block: List[str] = []
+
+        for line in result.split("\n"):
+            if not line.strip():
+                if current_block:
+                    try:
+                        ast.parse("\n".join(current_block))
+                        final_lines.extend(current_block)
+                        final_lines.append(line)
+                    except:
+                        pass
+                    current_block = []
+                else:
+                    final_lines.append(line)
+            else:
+                current_block.append(line)
+
+        if current_block:
+            try:
+                ast.parse("\n".join(current_block))
+                final_lines.extend(current_block)
+            except:
+                pass
+
+        return "\n".join(final_lines)
+
+
+def _responses(tests: int) -> Dict[str, str]:
+    bodies = [TEST_TEMPLATE.format(index=index) for index in range(tests)]
+    code = HEADER + "".join(bodies)
+    with_prose = HEADER + "".join(
+        (PROSE if index % 50 == 0 else "") + body for index, body in enumerate(bodies)
+    )
+    # Calls split over several lines end with a closing bracket at column 0
+    multiline_calls = code.replace(
+        '"amount,expected", [(1, 9), (5, 5)])', '"amount,expected", [\n    (1, 9),\n])'
+    )
+    return {
+        "valid code": code,
+        "multi-line decorators": multiline_calls,
+        "fenced code with prose": f"Here's the test module:\n```python\n{code}```\n"
+        "It covers every method of the store.",
+        "prose between tests": with_prose,
+        "truncated response": code[: len(code) - 80],
+    }
+
+
+def _count_tests(code: str) -> int:
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return -1
+    return sum(
+        isinstance(node, ast.FunctionDef) and node.name.startswith("test_")
+        for node in tree.body
+    )
+
+
+def _time(clean: Callable[[str], str], text: str, runs: int) -> List[float]:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        clean(text)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tests", type=int, default=1000)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{args.tests} tests per response, best of {args.runs} runs")
+    for name, text in _responses(args.tests).items():
+        legacy = min(_time(legacy_clean_python_code, text, args.runs))
+        current = min(_time(clean_python_code, text, args.runs))
+        print(f"{name} ({len(text.splitlines())} lines)")
+        print(
+            f"  legacy:  {legacy * 1000:9.1f} ms, "
+            f"{_count_tests(legacy_clean_python_code(text))} tests kept"
+        )
+        print(
+            f"  current: {current * 1000:9.1f} ms, "
+            f"{_count_tests(clean_python_code(text))} tests kept"
+        )
+        print(f"  speedup: {legacy / current:9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
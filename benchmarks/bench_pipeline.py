@@ -0,0 +1,222 @@
+"""Measure the throughput of the whole pipeline with a scripted chat model.
+
+Synthetic packages are generated for every size, and the pipeline of
+``main`` runs against them with ``ScriptedChatModel`` in place of Bedrock,
+so discovery, the agent loop, validation, cleaning and writing are measured
+without calling a model provider.
+
+Usage:
+    python benchmarks/bench_pipeline.py [--sizes 10 100 1000] [--latency 0.0]
+        [--failing-drafts 0] [--json results.json]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from langchain_core.messages import AIMessage  # noqa: E402
+
+from fake_model import ScriptedChatModel  # noqa: E402
+from main import _parse_args, _run_settings  # noqa: E402
+from metrics import get_stage_timer  # noqa: E402
+from pipeline import run_pipeline  # noqa: E402
+
+MODULE_TEMPLATE = '''
+class Basket{index}:
+    """Collect prices and compute totals."""
+
+    def __init__(self, discount=0.0):
+        self.discount = discount
+        self.prices = []
+
+    def add(self, price):
+        if price < 0:
+            raise ValueError("price must not be negative")
+        self.prices.append(price)
+
+    def total(self):
+        return round(sum(self.prices) * (1 - self.discount), 2)
+
+
+def scale_{index}(values, factor):
+    return [value * factor for value in values]
+
+
+def clamp_{index}(number, low, high):
+    return max(low, min(number, high))
+'''
+
+TEST_TEMPLATE = """import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent / "{relative_path}"))
+
+from {module_name} import *
+import pytest
+
+
+@pytest.fixture
+def basket():
+    return Basket{index}(discount=0.1)
+
+
+def test_total(basket):
+    basket.add(10.0)
+    basket.add(5.0)
+    assert basket.total() == {expected_total}
+
+
+def test_add_negative(basket):
+    with pytest.raises(ValueError):
+        basket.add(-1)
+
+
+@pytest.mark.parametrize("number,expected", [(-1, 0), (5, 5), (11, 10)])
+def test_clamp(number, expected):
+    assert clamp_{index}(number, 0, 10) == expected
+
+
+def test_scale():
+    assert scale_{index}([1, 2], 3) == [3, 6]
+"""
+
+
+def _module_name(index: int) -> str:
+    return f"shop_{index:04d}"
+
+
+def _write_package(source_dir: Path, size: int) -> None:
+    source_dir.mkdir(parents=True)
+    for index in range(size):
+        (source_dir / f"{_module_name(index)}.py").write_text(
+            MODULE_TEMPLATE.format(index=index)
+        )
+
+
+def _scripts(size: int, failing_drafts: int) -> Dict[str, List[AIMessage]]:
+    """Script every conversation as failing drafts, a passing draft and the
+    final test module."""
+    scripts = {}
+    for index in range(size):
+        module_name = _module_name(index)
+        drafts = [
+            TEST_TEMPLATE.format(
+                relative_path="../src",
+                module_name=module_name,
+                index=index,
+                expected_total=13.5 if draft == failing_drafts else 15.0,
+            )
+            for draft in range(failing_drafts + 1)
+        ]
+        turns = [
+            AIMessage(
+                content="",
+                tool_calls=[
+                    {
+                        "name": "validate_tests",
+                        "args": {"test_code": draft, "module_name": module_name},
+                        "id": f"call_{number}",
+                    }
+                ],
+            )
+            for number, draft in enumerate(drafts)
+        ]
+        turns.append(AIMessage(content=drafts[-1]))
+        scripts[f"written for {module_name},"] = turns
+    return scripts
+
+
+def _percentile(values: List[float], percentile: float) -> float:
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[int(percentile) - 1]
+
+
+def _run(size: int, latency: float, failing_drafts: int) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory() as root:
+        source_dir = Path(root) / "src"
+        test_dir = Path(root) / "tests"
+        _write_package(source_dir, size)
+        test_dir.mkdir()
+
+        chat_model = ScriptedChatModel(
+            scripts=_scripts(size, failing_drafts), latency=latency
+        )
+        args = _parse_args(
+            [
+                "--no-cache",
+                "--cache-dir",
+                str(Path(root) / "cache"),
+                "--state-dir",
+                str(Path(root) / "state"),
+                "--split-threshold",
+                "0",
+                "--quiet",
+            ]
+        )
+        get_stage_timer().reset()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = run_pipeline(
+                _run_settings(args), str(source_dir), str(test_dir), chat_model
+            )
+        wall = time.perf_counter() - start
+
+    durations = [record["seconds"] for record in result["records"].values()]
+    return {
+        "modules": size,
+        "wall_seconds": wall,
+        "modules_per_minute": size / wall * 60,
+        "p50_seconds": _percentile(durations, 50),
+        "p95_seconds": _percentile(durations, 95),
+        "passed": result["statuses"]["passed"],
+        "errors": len(result["errors"]),
+        "stages": get_stage_timer().totals(),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Seconds per model call."
+    )
+    parser.add_argument(
+        "--failing-drafts",
+        type=int,
+        default=0,
+        help="Number of failing drafts the agent validates before the passing one.",
+    )
+    parser.add_argument("--json", help="Also write the results to this JSON file.")
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        result = _run(size, args.latency, args.failing_drafts)
+        results.append(result)
+        print(f"{size} modules ({result['passed']} passed, {result['errors']} errors)")
+        print(f"  wall time:       {result['wall_seconds']:8.2f} s")
+        print(f"  modules/min:     {result['modules_per_minute']:8.1f}")
+        print(f"  p50 per module:  {result['p50_seconds'] * 1000:8.1f} ms")
+        print(f"  p95 per module:  {result['p95_seconds'] * 1000:8.1f} ms")
+        for name, total in sorted(result["stages"].items()):
+            print(
+                f"  {name + ':':<16} {total['seconds']:8.2f} s "
+                f"in {total['count']} calls (summed over threads)"
+            )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
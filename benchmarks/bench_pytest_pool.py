@@ -0,0 +1,98 @@
+"""Compare test runs in fresh pytest processes against the warm worker pool.
+
+Usage:
+    python benchmarks/bench_pytest_pool.py [--runs 20]
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+from pathlib import Path
+from typing import List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from pytest_pool import POOL_ENV, get_pytest_pool  # noqa: E402
+from validation import _run_pytest, sandbox  # noqa: E402
+
+SOURCE_CODE = """
+import decimal
+import fractions
+import json
+import statistics
+
+
+def mean_as_fraction(values):
+    return fractions.Fraction(statistics.mean(values)).limit_denominator()
+
+
+def to_json(values):
+    return json.dumps([str(decimal.Decimal(v)) for v in values])
+"""
+
+TEST_CODE = """
+import json
+
+import pytest
+
+from source import *
+
+
+@pytest.mark.parametrize("values,expected", [([1, 2, 3], 2), ([1, 2], 1.5)])
+def test_mean_as_fraction(values, expected):
+    assert mean_as_fraction(values) == expected
+
+
+def test_to_json():
+    assert json.loads(to_json([1, 2])) == ["1", "2"]
+
+
+def test_failure_is_reported():
+    assert to_json([]) == "[ ]"
+"""
+
+_DURATION = re.compile(r" in \d+\.\d+s")
+
+
+def _time_runs(runs: int, use_pool: bool) -> Tuple[List[float], str]:
+    os.environ[POOL_ENV] = "1" if use_pool else "0"
+    timings = []
+    output = ""
+    for _ in range(runs):
+        with sandbox(SOURCE_CODE, TEST_CODE) as sandbox_dir:
+            start = time.perf_counter()
+            result = _run_pytest(sandbox_dir, ["-v", "--tb=short"])
+            timings.append(time.perf_counter() - start)
+            # Normalize the parts of the output that differ between runs
+            output = _DURATION.sub(
+                "", result.stdout.replace(str(sandbox_dir), "<sandbox>")
+            )
+            output += f"\nreturncode={result.returncode}"
+    return timings, output
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    subprocess_timings, subprocess_output = _time_runs(args.runs, use_pool=False)
+    # The first pool run starts the worker, which is reported separately
+    warmup_timings, _ = _time_runs(1, use_pool=True)
+    pool_timings, pool_output = _time_runs(args.runs, use_pool=True)
+    get_pytest_pool().close()
+
+    subprocess_mean = sum(subprocess_timings) / len(subprocess_timings)
+    pool_mean = sum(pool_timings) / len(pool_timings)
+    print(f"runs per mode:        {args.runs}")
+    print(f"fresh process (mean): {subprocess_mean * 1000:8.1f} ms")
+    print(f"pool warmup:          {warmup_timings[0] * 1000:8.1f} ms")
+    print(f"warm pool (mean):     {pool_mean * 1000:8.1f} ms")
+    print(f"speedup:              {subprocess_mean / pool_mean:8.2f}x")
+    print(f"identical output:     {subprocess_output == pool_output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Measure the startup time of the command line in runs that do not call a
+model.
+
+Every scenario runs in a fresh interpreter with ``-X importtime``. The wall
+time, the time spent importing modules and the slowest top-level imports are
+reported. Importing the agent runtime is measured separately, as the cost
+that runs calling a model still pay when the first agent is created.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 5] [--top 5] [--json results.json]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+SRC_DIR = Path(__file__).resolve().parents[1] / "src"
+
+MODULE_TEMPLATE = '''
+def scale_{index}(values, factor):
+    """Multiply every value by the factor."""
+    return [value * factor for value in values]
+'''
+
+
+def _parse_importtime(stderr: str) -> Tuple[float, List[Tuple[str, float]]]:
+    """Get the total import time and the cumulative time of every top-level
+    import, in seconds, from the ``-X importtime`` output."""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        if not name.startswith(" ") or name.startswith("  "):
+            continue  # Nested import, already part of its parent
+        imports.append((name.strip(), int(cumulative) / 1e6))
+    return sum(seconds for _, seconds in imports), imports
+
+
+def _run(command: List[str], stdin: str, runs: int) -> Dict[str, Any]:
+    env = {k: v for k, v in os.environ.items() if k != "PYTHONPATH"}
+    walls, import_totals = [], []
+    imports: List[Tuple[str, float]] = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", *command],
+            cwd=SRC_DIR,
+            input=stdin,
+            capture_output=True,
+            text=True,
+            check=False,
+            env=env,
+        )
+        walls.append(time.perf_counter() - start)
+        if result.returncode != 0:
+            raise RuntimeError(f"{' '.join(command)} failed:\n{result.stderr[-2000:]}")
+        total, imports = _parse_importtime(result.stderr)
+        import_totals.append(total)
+    return {
+        "wall_seconds": statistics.median(walls),
+        "import_seconds": statistics.median(import_totals),
+        "imports": sorted(imports, key=lambda item: item[1], reverse=True),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="Runs per scenario.")
+    parser.add_argument(
+        "--top", type=int, default=5, help="Number of slowest imports to show."
+    )
+    parser.add_argument("--json", help="Also write the results to this JSON file.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        source_dir = Path(root) / "src"
+        test_dir = Path(root) / "tests"
+        source_dir.mkdir()
+        test_dir.mkdir()
+        for index in range(20):
+            (source_dir / f"scale_{index:02d}.py").write_text(
+                MODULE_TEMPLATE.format(index=index)
+            )
+        paths = f"{source_dir}\n{test_dir}\n"
+        cache_dir = str(Path(root) / "cache")
+
+        scenarios = {
+            "--help": (["main.py", "--help"], ""),
+            "--list-modules": (
+                ["main.py", "--list-modules", "--cache-dir", cache_dir],
+                paths,
+            ),
+            "--cache-only": (
+                ["main.py", "--cache-only", "--quiet", "--cache-dir", cache_dir],
+                paths,
+            ),
+            "agent runtime": (["-c", "import agent"], ""),
+        }
+        results = {}
+        for name, (command, stdin) in scenarios.items():
+            result = _run(command, stdin, args.runs)
+            results[name] = result
+            print(f"{name}")
+            print(f"  wall time:    {result['wall_seconds'] * 1000:8.1f} ms")
+            print(f"  import time:  {result['import_seconds'] * 1000:8.1f} ms")
+            for module, seconds in result["imports"][: args.top]:
+                print(f"    {module:<28} {seconds * 1000:8.1f} ms")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,465 @@
+"""Runtime of the test-writing agent.
+
+This is the only part of the pipeline besides the model backends that needs
+langchain and langgraph, so it is imported when the first agent is created.
+
+With a checkpointer, every step of a conversation is stored under a thread of
+the run, so a restarted run continues unfinished conversations where they
+stopped and reuses finished ones without calling the model again. Model calls
+can be rate limited, and throttled calls are retried within the conversation.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import Runnable
+from langgraph.prebuilt import create_react_agent
+
+from budget import current_budget
+from helper import clean_python_code, record_validation
+from metrics import ModuleRecord, get_stage_timer, stage
+from prompts import cached_system_prompt, system_prompt
+from rate_limit import ModelRateLimiter
+from tools import validation_tools
+
+TOKEN_USAGE_KEYS = ("input", "output", "cache_read", "cache_creation")
+# Name langgraph gives to graphs created without a name
+DEFAULT_GRAPH_NAME = "LangGraph"
+
+_progress_enabled = True
+_run_id: Optional[str] = None
+_coverage_target = 0.0
+
+
+def _message_tokens(message: BaseMessage) -> int:
+    """Get the input and output tokens a model reported for its answer."""
+    usage = getattr(message, "usage_metadata", None) or {}
+    return usage.get("input_tokens", 0) + usage.get("output_tokens", 0)
+
+
+class RateLimitedChatModel(BaseChatModel):
+    """Chat model that calls another one within the limits of a rate limiter.
+
+    Throttled calls are retried with backoff inside the model call, so the
+    conversation of the agent continues where it was instead of failing.
+
+    Args:
+        model (Runnable): The chat model, possibly with bound tools
+        limiter (ModelRateLimiter): Limits shared by all calls to the backend
+    """
+
+    model: Runnable
+    limiter: ModelRateLimiter
+
+    @property
+    def _llm_type(self) -> str:
+        return "rate_limited"
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any) -> "RateLimitedChatModel":
+        return RateLimitedChatModel(
+            model=self.model.bind_tools(tools, **kwargs), limiter=self.limiter
+        )
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        # About four characters per token, corrected by the reported usage
+        estimated_tokens = sum(len(str(message.content)) for message in messages) // 4
+        message = self.limiter.call(
+            lambda: self.model.invoke(messages, stop=stop, **kwargs),
+            estimated_tokens=estimated_tokens,
+            used_tokens=_message_tokens,
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+def sqlite_checkpointer(path: str) -> Optional[Any]:
+    """Create a checkpointer storing the agent conversations in a SQLite
+    database, or None if langgraph-checkpoint-sqlite is not installed.
+
+    Args:
+        path (str): Path to the database file
+
+    Returns:
+        Optional[Any]: The checkpointer
+    """
+    try:
+        from langgraph.checkpoint.sqlite import SqliteSaver
+    except ImportError:
+        print(
+            "Warning: langgraph-checkpoint-sqlite is not installed, unfinished "
+            "agent conversations cannot be resumed"
+        )
+        return None
+    return SqliteSaver(sqlite3.connect(path, check_same_thread=False))
+
+
+def create_agent(
+    chat_model: BaseChatModel,
+    prompt_caching: bool = False,
+    checkpointer: Optional[Any] = None,
+    name: Optional[str] = None,
+    rate_limiter: Optional[ModelRateLimiter] = None,
+) -> Any:
+    """Create the ReAct agent graph that writes and validates tests.
+
+    Args:
+        chat_model (BaseChatModel): Chat model of the agent
+        prompt_caching (bool): Mark the system prompt for Bedrock prompt caching
+        checkpointer (Optional[Any]): Checkpointer storing the conversations,
+            see ``sqlite_checkpointer``
+        name (Optional[str]): Name of the graph, which keeps the conversations
+            of agents with different models sharing a checkpointer apart
+        rate_limiter (Optional[ModelRateLimiter]): Limits of the model calls,
+            which also retries throttled calls
+
+    Returns:
+        Any: The compiled agent graph
+    """
+    if rate_limiter is not None:
+        chat_model = RateLimitedChatModel(model=chat_model, limiter=rate_limiter)
+    return create_react_agent(
+        chat_model,
+        tools=validation_tools,
+        state_modifier=cached_system_prompt if prompt_caching else system_prompt,
+        checkpointer=checkpointer,
+        **({"name": name} if name else {}),
+    )
+
+
+def set_run_id(run_id: Optional[str]) -> None:
+    """Set the run the conversations of ``run_agent`` are checkpointed under."""
+    global _run_id
+    _run_id = run_id
+
+
+def thread_id(module_name: str, prompt: str, agent_name: Optional[str] = None) -> str:
+    """Get the checkpoint thread of a conversation of the current run. The
+    prompt contains the source code, so a changed module starts a new
+    conversation."""
+    digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+    if agent_name:
+        return f"{_run_id}:{agent_name}:{module_name}:{digest}"
+    return f"{_run_id}:{module_name}:{digest}"
+
+
+def _agent_name(graph: Any) -> Optional[str]:
+    """Get the name given to ``create_agent``, None for the default name."""
+    name = getattr(graph, "name", None)
+    return name if name and name != DEFAULT_GRAPH_NAME else None
+
+
+def token_usage(messages: Iterable[BaseMessage]) -> Dict[str, int]:
+    """Sum the token usage reported by the model over the messages of a
+    conversation.
+
+    Args:
+        messages (Iterable[BaseMessage]): Messages of the agent state
+
+    Returns:
+        Dict[str, int]: Number of input, output, cache read and cache creation
+        tokens
+    """
+    usage = {key: 0 for key in TOKEN_USAGE_KEYS}
+    for message in messages:
+        if not isinstance(message, AIMessage) or not message.usage_metadata:
+            continue
+        usage["input"] += message.usage_metadata.get("input_tokens", 0)
+        usage["output"] += message.usage_metadata.get("output_tokens", 0)
+        details = message.usage_metadata.get("input_token_details") or {}
+        usage["cache_read"] += details.get("cache_read", 0) or 0
+        usage["cache_creation"] += details.get("cache_creation", 0) or 0
+    return usage
+
+
+def _validation_result(message: ToolMessage) -> Optional[Dict[str, Any]]:
+    """Get the validation result of a validate_tests message, or None if the
+    tool failed."""
+    if message.name != "validate_tests" or not isinstance(message.content, str):
+        return None
+    try:
+        result = json.loads(message.content)
+    except ValueError:
+        return None
+    return result if isinstance(result, dict) and "passed" in result else None
+
+
+def record_agent_messages(record: ModuleRecord, messages: List[BaseMessage]) -> None:
+    """Add the model calls, tool calls, tokens and validation runs of an agent
+    conversation to a module record.
+
+    Args:
+        record (ModuleRecord): The record of the module
+        messages (List[BaseMessage]): Messages of the agent state
+    """
+    usage = token_usage(messages)
+    record["input_tokens"] += usage["input"]
+    record["output_tokens"] += usage["output"]
+    record["cache_read_tokens"] += usage["cache_read"]
+    record["cache_creation_tokens"] += usage["cache_creation"]
+
+    passed = []
+    for message in messages:
+        if isinstance(message, AIMessage):
+            record["model_calls"] += 1
+            record["tool_calls"] += len(message.tool_calls)
+        elif isinstance(message, ToolMessage):
+            result = _validation_result(message)
+            if result is not None:
+                record_validation(record, result)
+                passed.append(result["passed"])
+    # A failed validation followed by another one is an attempt to fix the tests
+    record["repair_iterations"] += sum(1 for ok in passed[:-1] if not ok)
+
+
+def set_coverage_target(percent: float) -> None:
+    """Stop the agent as soon as its tests pass and cover this percentage of
+    the source code, 0 to always wait for its final answer."""
+    global _coverage_target
+    _coverage_target = percent
+
+
+def _latest_validation(messages: List[BaseMessage]) -> Optional[Dict[str, Any]]:
+    """Get the result of the latest validation of a conversation, if any."""
+    for message in reversed(messages):
+        if isinstance(message, ToolMessage):
+            result = _validation_result(message)
+            if result is not None:
+                return result
+    return None
+
+
+def _meets_coverage_target(messages: List[BaseMessage]) -> bool:
+    """Check if the latest validation of a conversation passed and met the
+    coverage target."""
+    if not _coverage_target:
+        return False
+    result = _latest_validation(messages)
+    if result is None:
+        return False
+    coverage = result.get("coverage")
+    return bool(
+        result["passed"] and coverage and coverage["percent"] >= _coverage_target
+    )
+
+
+def set_progress(enabled: bool) -> None:
+    """Switch the progress lines of ``run_agent`` on or off."""
+    global _progress_enabled
+    _progress_enabled = enabled
+
+
+def _progress_line(module_name: str, message: BaseMessage) -> Optional[str]:
+    if isinstance(message, AIMessage):
+        if message.tool_calls:
+            calls = ", ".join(call["name"] for call in message.tool_calls)
+            return f"[{module_name}] model calls {calls}"
+        lines = str(message.content).count("\n") + 1
+        return f"[{module_name}] model answered with {lines} lines"
+    if isinstance(message, ToolMessage):
+        result = _validation_result(message)
+        if result is None:
+            return (
+                f"[{module_name}] {message.name} failed: {str(message.content)[:200]}"
+            )
+        counts = ", ".join(
+            f"{count} {outcome}"
+            for outcome, count in result["summary"].items()
+            if count
+        )
+        coverage = result.get("coverage")
+        covered = f", {coverage['percent']:.0f}% covered" if coverage else ""
+        reused = f" ({result['reused']} reused)" if result.get("reused") else ""
+        return (
+            f"[{module_name}] {message.name}: {counts or 'no tests'}{reused}{covered} "
+            f"in {result['duration']:.2f} s"
+        )
+    return None
+
+
+def _budget_allows_next_step(
+    budget: Any, messages: List[BaseMessage], new_messages: List[BaseMessage]
+) -> bool:
+    """Charge the messages of the last step to the budget and check if it
+    allows the step the agent takes next."""
+    budget.charge(
+        model_turns=sum(isinstance(m, AIMessage) for m in new_messages),
+        validation_runs=sum(
+            isinstance(m, ToolMessage) and m.name == "validate_tests"
+            for m in new_messages
+        ),
+    )
+    last = messages[-1] if messages else None
+    if isinstance(last, AIMessage):
+        # Either the final answer, or tool calls the tools step runs next
+        return not last.tool_calls or budget.allows("validation")
+    return budget.allows("model")
+
+
+def run_agent(
+    graph: Any,
+    prompt: str,
+    record: Optional[ModuleRecord] = None,
+    cancel: Optional[threading.Event] = None,
+    stop_when_passed: bool = False,
+) -> List[BaseMessage]:
+    """Run the agent on a prompt, print a progress line for every model turn
+    and tool result, and add the run to the record of the module.
+
+    If the graph has a checkpointer, a conversation of the same run and prompt
+    that was interrupted is continued, and a finished one is returned as is.
+
+    The agent is stopped before a step the budget of the module does not
+    allow any more, or as soon as its tests pass and meet the coverage
+    target, so the conversation may end without a final answer; see
+    ``final_test_code``. It is also stopped after the step in which the
+    cancel event is set, or in which its tests pass if ``stop_when_passed``.
+
+    Args:
+        graph (Any): The compiled ReAct agent graph
+        prompt (str): The user prompt
+        record (Optional[ModuleRecord]): The record of the module
+        cancel (Optional[threading.Event]): Event that stops the agent, e.g.
+            when another candidate for the module already passed
+        stop_when_passed (bool): Whether to stop as soon as a validation passes
+
+    Returns:
+        List[BaseMessage]: Messages of the final agent state
+    """
+    module_name = record["module"] if record is not None else "agent"
+    budget = current_budget()
+    messages: List[BaseMessage] = []
+    config: Dict[str, Any] = {}
+    if budget is not None and budget.recursion_limit():
+        config["recursion_limit"] = budget.recursion_limit()
+    graph_input: Optional[Dict[str, Any]] = {"messages": [("user", prompt)]}
+    if getattr(graph, "checkpointer", None) is not None and _run_id:
+        config["configurable"] = {
+            "thread_id": thread_id(module_name, prompt, _agent_name(graph))
+        }
+        snapshot = graph.get_state(config)
+        messages = list(snapshot.values.get("messages", []))
+        if messages:
+            if _progress_enabled:
+                print(f"[{module_name}] resuming after {len(messages)} messages")
+            if not snapshot.next:
+                return messages
+            graph_input = None
+    resumed = len(messages)
+    # The units and repairs of a module may have used up its budget already
+    if budget is not None and not _budget_allows_next_step(budget, messages, []):
+        if _progress_enabled:
+            print(f"[{module_name}] not started, out of {budget.exhausted_by}")
+        return messages
+
+    timer = get_stage_timer()
+    with stage("agent"):
+        step_start = time.perf_counter()
+        for state in graph.stream(graph_input, config or None, stream_mode="values"):
+            new_messages = state["messages"][len(messages) :]
+            messages = state["messages"]
+            # Every step of the graph is either a model call or tool calls
+            if new_messages and isinstance(new_messages[-1], AIMessage):
+                timer.add("model", time.perf_counter() - step_start, step_start)
+            if _progress_enabled:
+                for message in new_messages:
+                    line = _progress_line(module_name, message)
+                    if line:
+                        print(line)
+            if budget is not None and not _budget_allows_next_step(
+                budget, messages, new_messages
+            ):
+                if _progress_enabled:
+                    print(f"[{module_name}] stopped, out of {budget.exhausted_by}")
+                break
+            if new_messages and _meets_coverage_target(new_messages):
+                if _progress_enabled:
+                    print(
+                        f"[{module_name}] stopped, coverage meets the target of "
+                        f"{_coverage_target:g}%"
+                    )
+                break
+            if cancel is not None and cancel.is_set():
+                if _progress_enabled:
+                    print(f"[{module_name}] cancelled")
+                break
+            if stop_when_passed and new_messages:
+                result = _latest_validation(new_messages)
+                if result is not None and result["passed"]:
+                    break
+            step_start = time.perf_counter()
+    if record is not None:
+        # Messages of an earlier run were already paid for and recorded
+        record_agent_messages(record, messages[resumed:])
+    return messages
+
+
+def is_finished(messages: List[BaseMessage]) -> bool:
+    """Check if a conversation ended with the final answer of the agent."""
+    return bool(messages) and (
+        isinstance(messages[-1], AIMessage) and not messages[-1].tool_calls
+    )
+
+
+def draft_rank(result: Dict[str, Any]) -> Tuple[bool, float, int]:
+    """Rank a validated draft: a passing draft is better than a failing one, a
+    passing draft with more coverage is better than one with less, and
+    otherwise the draft with more passing tests is better."""
+    coverage = result.get("coverage")
+    return (
+        bool(result["passed"]),
+        coverage["percent"] if coverage and result["passed"] else 0.0,
+        result["summary"].get("passed", 0),
+    )
+
+
+def best_draft(messages: List[BaseMessage]) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """Find the best validated draft in a conversation by ``draft_rank``,
+    the latest one of equally good drafts.
+
+    Args:
+        messages (List[BaseMessage]): Messages of the agent state
+
+    Returns:
+        Optional[Tuple[str, Dict[str, Any]]]: The test code of the draft and its
+        validation result, or None if no draft was validated
+    """
+    drafts: Dict[str, str] = {}
+    best: Optional[Tuple[str, Dict[str, Any]]] = None
+    best_rank: Tuple[bool, float, int] = (False, -1.0, -1)
+    for message in messages:
+        if isinstance(message, AIMessage):
+            for call in message.tool_calls:
+                if call["name"] == "validate_tests" and call.get("id"):
+                    drafts[call["id"]] = call["args"].get("test_code", "")
+        elif isinstance(message, ToolMessage) and message.tool_call_id in drafts:
+            result = _validation_result(message)
+            if result is None:
+                continue
+            rank = draft_rank(result)
+            if rank >= best_rank:
+                best = (drafts[message.tool_call_id], result)
+                best_rank = rank
+    return best
+
+
+def final_test_code(messages: List[BaseMessage]) -> str:
+    """Get the test code of a conversation, which is the final answer of the
+    agent, or the best validated draft if the agent was stopped by its
+    budget. An empty string is returned if there is neither."""
+    if is_finished(messages):
+        return clean_python_code(messages[-1].content)
+    draft = best_draft(messages)
+    return clean_python_code(draft[0]) if draft is not None else ""
@@ -0,0 +1,109 @@
+import json
+import os
+import sqlite3
+from typing import Dict, Iterable, List, TypedDict
+
+# Increase whenever CodeAnalyzer or the skip rules change, so cached
+# results computed by an older version are not used anymore
+ANALYSIS_VERSION = 2
+
+DEFAULT_ANALYSIS_CACHE_FILE = "analysis.sqlite"
+
+
+class FileAnalysis(TypedDict):
+    path: str
+    mtime_ns: int
+    size: int
+    content_hash: str
+    skip: bool
+    import_names: List[str]
+    imported_modules: List[str]
+
+
+class AnalysisCache:
+    """On-disk store of per-file analysis results in a single SQLite file.
+
+    An entry is keyed by the file path and is valid as long as the file's
+    modification time and size, or else its content hash, are unchanged.
+
+    Args:
+        db_path (str): Path to the SQLite database file
+    """
+
+    def __init__(self, db_path: str) -> None:
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(db_path)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("""CREATE TABLE IF NOT EXISTS analyses (
+                path TEXT PRIMARY KEY,
+                mtime_ns INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                content_hash TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                skip INTEGER NOT NULL,
+                import_names TEXT NOT NULL,
+                imported_modules TEXT NOT NULL
+            )""")
+        self._connection.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, paths: Iterable[str]) -> Dict[str, FileAnalysis]:
+        """Load the cached analyses of the given files.
+
+        Entries written by another analysis version are ignored.
+
+        Args:
+            paths (Iterable[str]): Paths of the files
+
+        Returns:
+            Dict[str, FileAnalysis]: The cached analyses by path
+        """
+        wanted = set(paths)
+        cursor = self._connection.execute(
+            "SELECT path, mtime_ns, size, content_hash, skip, import_names, "
+            "imported_modules FROM analyses WHERE version = ?",
+            (ANALYSIS_VERSION,),
+        )
+        return {
+            row[0]: {
+                "path": row[0],
+                "mtime_ns": row[1],
+                "size": row[2],
+                "content_hash": row[3],
+                "skip": bool(row[4]),
+                "import_names": json.loads(row[5]),
+                "imported_modules": json.loads(row[6]),
+            }
+            for row in cursor
+            if row[0] in wanted
+        }
+
+    def store(self, analyses: Iterable[FileAnalysis]) -> None:
+        """Store analyses in a single transaction.
+
+        Args:
+            analyses (Iterable[FileAnalysis]): The analyses to store
+        """
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO analyses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        analysis["path"],
+                        analysis["mtime_ns"],
+                        analysis["size"],
+                        analysis["content_hash"],
+                        ANALYSIS_VERSION,
+                        int(analysis["skip"]),
+                        json.dumps(analysis["import_names"]),
+                        json.dumps(analysis["imported_modules"]),
+                    )
+                    for analysis in analyses
+                ],
+            )
+
+    def close(self) -> None:
+        self._connection.close()
@@ -0,0 +1,110 @@
+"""Budget of the agent runs of a module.
+
+A module may use a limited number of model turns and validation runs, and
+must be finished before a wall-clock deadline. The budget of the module being
+processed is set with ``budget_scope``, like the module of the metrics, so
+the agent runs of the units and repairs of a module share it. When the budget
+runs out, the agent is stopped before its next step and the best draft it
+validated is used instead of its final answer.
+"""
+
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+DEFAULT_MAX_MODEL_TURNS = 12
+DEFAULT_MAX_VALIDATION_RUNS = 8
+DEFAULT_MODULE_DEADLINE = 900.0
+
+_current_budget: contextvars.ContextVar[Optional["ModuleBudget"]] = (
+    contextvars.ContextVar("current_budget", default=None)
+)
+
+
+class ModuleBudget:
+    """Thread-safe budget of a module, where a limit of 0 means unlimited.
+
+    Args:
+        max_model_turns (int): Maximum number of model turns
+        max_validation_runs (int): Maximum number of validation runs of the agent
+        deadline (float): Seconds from now after which no agent step is started
+    """
+
+    def __init__(
+        self,
+        max_model_turns: int = DEFAULT_MAX_MODEL_TURNS,
+        max_validation_runs: int = DEFAULT_MAX_VALIDATION_RUNS,
+        deadline: float = DEFAULT_MODULE_DEADLINE,
+    ) -> None:
+        self.max_model_turns = max_model_turns
+        self.max_validation_runs = max_validation_runs
+        self.deadline = time.monotonic() + deadline if deadline else None
+        self.model_turns = 0
+        self.validation_runs = 0
+        self.exhausted_by: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def scale(self, factor: int) -> None:
+        """Multiply the turn and validation limits, e.g. by the number of units
+        of a split module, which each need about as much as a small module."""
+        with self._lock:
+            self.max_model_turns *= factor
+            self.max_validation_runs *= factor
+
+    def charge(self, model_turns: int = 0, validation_runs: int = 0) -> None:
+        with self._lock:
+            self.model_turns += model_turns
+            self.validation_runs += validation_runs
+
+    def allows(self, step: str) -> bool:
+        """Check if the budget allows another step of the agent, and remember
+        what exhausted it otherwise.
+
+        Args:
+            step (str): "model" for a model turn, "validation" for tool calls
+
+        Returns:
+            bool: Whether the step may run
+        """
+        with self._lock:
+            if self.deadline is not None and time.monotonic() >= self.deadline:
+                self.exhausted_by = "deadline"
+            elif (
+                step == "model"
+                and self.max_model_turns
+                and self.model_turns >= self.max_model_turns
+            ):
+                self.exhausted_by = "model turns"
+            elif (
+                step == "validation"
+                and self.max_validation_runs
+                and self.validation_runs >= self.max_validation_runs
+            ):
+                self.exhausted_by = "validation runs"
+            else:
+                return True
+            return False
+
+    def recursion_limit(self) -> Optional[int]:
+        """Get a langgraph recursion limit that lets a conversation use all of
+        the model turns, or None for the default."""
+        if not self.max_model_turns:
+            return None
+        # Every model turn is followed by at most one tool step
+        return 2 * self.max_model_turns + 5
+
+
+@contextmanager
+def budget_scope(budget: Optional[ModuleBudget]) -> Iterator[None]:
+    """Make a budget the budget of the agent runs started in this context."""
+    token = _current_budget.set(budget)
+    try:
+        yield
+    finally:
+        _current_budget.reset(token)
+
+
+def current_budget() -> Optional[ModuleBudget]:
+    return _current_budget.get()
@@ -0,0 +1,136 @@
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+DEFAULT_CACHE_DIR = ".minerva_cache"
+DEFAULT_MAX_ENTRIES = 10000
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+def cache_key(*parts: str) -> str:
+    """Hash the given parts into a cache key.
+
+    Every part is prefixed with its length, so different splits of the same
+    text produce different keys.
+
+    Args:
+        *parts (str): Everything the cached result depends on
+
+    Returns:
+        str: The hex digest of the parts
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        encoded = part.encode("utf-8")
+        digest.update(len(encoded).to_bytes(8, "big"))
+        digest.update(encoded)
+    return digest.hexdigest()
+
+
+class GenerationCache:
+    """Content-addressed on-disk cache of validated test modules.
+
+    Entries are stored as one file per key. Reading an entry refreshes its
+    modification time, and the least recently used entries are evicted once
+    the cache holds more than ``max_entries`` entries or ``max_bytes`` bytes.
+    The cache directory is scanned once, on the first write, and later reads
+    and writes keep the number, sizes and order of the entries up to date.
+
+    Args:
+        cache_dir (str): Directory of the cache
+        max_entries (int): Maximum number of entries
+        max_bytes (int): Maximum total size of all entries in bytes
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = DEFAULT_CACHE_DIR,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+    ) -> None:
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # Size of every entry, the least recently used first
+        self._entries: Optional["OrderedDict[Path, int]"] = None
+        self._total_bytes = 0
+
+    def _entry_path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.py"
+
+    def get(self, key: str) -> Optional[str]:
+        """Get the cached test module for a key.
+
+        Args:
+            key (str): Key created by :func:`cache_key`
+
+        Returns:
+            Optional[str]: The cached test module, or None on a cache miss
+        """
+        entry_path = self._entry_path(key)
+        try:
+            content = entry_path.read_text(encoding="utf-8")
+            os.utime(entry_path)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+            if self._entries is not None and entry_path in self._entries:
+                self._entries.move_to_end(entry_path)
+        return content
+
+    def put(self, key: str, content: str) -> None:
+        """Store a validated test module and evict old entries if the cache
+        is full.
+
+        Args:
+            key (str): Key created by :func:`cache_key`
+            content (str): The validated test module
+        """
+        entry_path = self._entry_path(key)
+        entry_path.parent.mkdir(exist_ok=True)
+        # Write to a temporary file first, so readers never see partial entries
+        encoded = content.encode("utf-8")
+        fd, tmp_path = tempfile.mkstemp(dir=entry_path.parent, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(encoded)
+        os.replace(tmp_path, entry_path)
+
+        with self._lock:
+            entries = self._load_entries()
+            self._total_bytes += len(encoded) - entries.pop(entry_path, 0)
+            entries[entry_path] = len(encoded)
+            self._evict(entries)
+
+    def _load_entries(self) -> "OrderedDict[Path, int]":
+        if self._entries is None:
+            stats: List[Tuple[float, int, Path]] = []
+            for entry_path in self.cache_dir.glob("*/*.py"):
+                try:
+                    stat = entry_path.stat()
+                except OSError:
+                    continue
+                stats.append((stat.st_mtime, stat.st_size, entry_path))
+            stats.sort()
+            self._entries = OrderedDict((path, size) for _, size, path in stats)
+            self._total_bytes = sum(size for _, size, _ in stats)
+        return self._entries
+
+    def _evict(self, entries: "OrderedDict[Path, int]") -> None:
+        while entries and (
+            len(entries) > self.max_entries or self._total_bytes > self.max_bytes
+        ):
+            entry_path, size = entries.popitem(last=False)
+            entry_path.unlink(missing_ok=True)
+            self._total_bytes -= size
@@ -0,0 +1,254 @@
+import ast
+import re
+from typing import Dict, List, Optional, Set, Tuple, TypedDict, Union
+
+DEFAULT_SPLIT_THRESHOLD_LINES = 600
+DEFAULT_MAX_UNIT_LINES = 250
+
+_DefinitionNode = Union[ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef]
+_DEFINITION_TYPES = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+
+
+class GenerationUnit(TypedDict):
+    names: List[str]
+    code: str
+    summary: str
+
+
+def _first_line(node: ast.stmt) -> int:
+    if isinstance(node, _DEFINITION_TYPES):
+        return min([node.lineno, *(d.lineno for d in node.decorator_list)])
+    return node.lineno
+
+
+def _segment(lines: List[str], node: ast.stmt) -> str:
+    return "".join(lines[_first_line(node) - 1 : node.end_lineno])
+
+
+def _definitions(tree: ast.Module) -> Dict[str, _DefinitionNode]:
+    """Get the top-level functions and classes of a module by their names."""
+    return {
+        node.name: node for node in tree.body if isinstance(node, _DEFINITION_TYPES)
+    }
+
+
+def _signature(node: Union[ast.FunctionDef, ast.AsyncFunctionDef]) -> str:
+    """Render a function without its body, but with the first line of its
+    docstring."""
+    stub = ast.FunctionDef(
+        name=node.name,
+        args=node.args,
+        body=[ast.Expr(ast.Constant(...))],
+        decorator_list=node.decorator_list,
+        returns=node.returns,
+        type_params=getattr(node, "type_params", []),
+        lineno=node.lineno,
+    )
+    signature = ast.unparse(stub)
+    if isinstance(node, ast.AsyncFunctionDef):
+        signature = signature.replace("def ", "async def ", 1)
+    docstring = ast.get_docstring(node)
+    if docstring:
+        summary = docstring.strip().splitlines()[0].replace('"""', "'''")
+        signature = signature.replace(":\n    ...", f':\n    """{summary}"""', 1)
+    return signature
+
+
+def _summarize_definition(node: _DefinitionNode) -> str:
+    if not isinstance(node, ast.ClassDef):
+        return _signature(node)
+
+    header = ast.unparse(
+        ast.ClassDef(
+            name=node.name,
+            bases=node.bases,
+            keywords=node.keywords,
+            body=[ast.Pass()],
+            decorator_list=node.decorator_list,
+            type_params=getattr(node, "type_params", []),
+        )
+    ).rsplit("\n", 1)[0]
+    members = []
+    for child in node.body:
+        if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            members.append(_signature(child))
+        elif isinstance(child, (ast.Assign, ast.AnnAssign)):
+            members.append(ast.unparse(child))
+    body = "\n".join(members) or "..."
+    return header + "\n" + "\n".join(f"    {line}" for line in body.splitlines())
+
+
+def signature_summary(source_code: str, exclude: Optional[Set[str]] = None) -> str:
+    """Summarize a module by its imports, module-level assignments and the
+    signatures of its functions and classes.
+
+    Args:
+        source_code (str): Source code of the module
+        exclude (Optional[Set[str]]): Names of top-level definitions to leave out
+
+    Returns:
+        str: Python-like summary of the module
+    """
+    exclude = exclude or set()
+    tree = ast.parse(source_code)
+    parts = []
+    for node in tree.body:
+        if isinstance(node, _DEFINITION_TYPES):
+            if node.name not in exclude:
+                parts.append(_summarize_definition(node))
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            parts.append(ast.unparse(node))
+        elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+            text = ast.unparse(node)
+            parts.append(text if len(text) <= 120 else text[:117] + "...")
+    return "\n".join(parts)
+
+
+def should_split(source_code: str, threshold_lines: int) -> bool:
+    """Check if a module is large enough to be split into generation units."""
+    return threshold_lines > 0 and source_code.count("\n") + 1 > threshold_lines
+
+
+def split_module(
+    source_code: str, max_unit_lines: int = DEFAULT_MAX_UNIT_LINES
+) -> List[GenerationUnit]:
+    """Split a module into groups of consecutive top-level functions and
+    classes.
+
+    A group is closed as soon as adding the next definition would exceed
+    ``max_unit_lines``, so a definition larger than that forms a unit of its
+    own. Every unit comes with a signature summary of the rest of the module.
+
+    Args:
+        source_code (str): Source code of the module
+        max_unit_lines (int): Maximum number of lines per unit
+
+    Returns:
+        List[GenerationUnit]: The names, code and summary of every unit
+    """
+    tree = ast.parse(source_code)
+    lines = source_code.splitlines(keepends=True)
+    definitions = [node for node in tree.body if isinstance(node, _DEFINITION_TYPES)]
+
+    groups: List[List[_DefinitionNode]] = []
+    group_lines = 0
+    for node in definitions:
+        node_lines = (node.end_lineno or node.lineno) - _first_line(node) + 1
+        if groups and group_lines + node_lines <= max_unit_lines:
+            groups[-1].append(node)
+            group_lines += node_lines
+        else:
+            groups.append([node])
+            group_lines = node_lines
+
+    units: List[GenerationUnit] = []
+    for group in groups:
+        names = [node.name for node in group]
+        units.append(
+            {
+                "names": names,
+                "code": "\n\n".join(_segment(lines, node) for node in group),
+                "summary": signature_summary(source_code, exclude=set(names)),
+            }
+        )
+    return units
+
+
+_DEFINITION_NAME = re.compile(rb"(?:async\s+)?(?:def|class)\s+")
+
+
+def _rename_identifiers(code: str, renames: Dict[str, str]) -> str:
+    """Rename variables, parameters and definitions in code.
+
+    Only ``ast.Name`` and ``ast.arg`` nodes and the names of function and
+    class definitions are renamed, so attributes, keyword arguments, strings
+    and comments with the same names are kept.
+    """
+    tree = ast.parse(code)
+    lines = [line.encode("utf-8") for line in code.splitlines(keepends=True)]
+    # Column offsets of the AST are offsets in the UTF-8 encoded line
+    replacements: List[Tuple[int, int, int, str]] = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and node.id in renames:
+            name, row, start = node.id, node.lineno, node.col_offset
+        elif isinstance(node, ast.arg) and node.arg in renames:
+            name, row, start = node.arg, node.lineno, node.col_offset
+        elif isinstance(node, _DEFINITION_TYPES) and node.name in renames:
+            keyword = _DEFINITION_NAME.match(lines[node.lineno - 1], node.col_offset)
+            if keyword is None:
+                continue
+            name, row, start = node.name, node.lineno, keyword.end()
+        else:
+            continue
+        replacements.append((row, start, start + len(name.encode("utf-8")), name))
+    for row, start, end, name in sorted(replacements, reverse=True):
+        line = lines[row - 1]
+        lines[row - 1] = line[:start] + renames[name].encode("utf-8") + line[end:]
+    return b"".join(lines).decode("utf-8")
+
+
+def merge_test_fragments(fragments: List[str]) -> str:
+    """Merge test modules generated for the units of one module into one
+    test module.
+
+    Imports and other module-level statements are deduplicated. Definitions
+    that are identical in several fragments are kept once, and conflicting
+    definitions are renamed together with their uses in their fragment.
+
+    Args:
+        fragments (List[str]): The test modules of the units
+
+    Returns:
+        str: The merged test module
+    """
+    header: List[str] = []
+    definitions: List[str] = []
+    seen_statements: Set[str] = set()
+    defined: Dict[str, str] = {}
+
+    for fragment in fragments:
+        try:
+            tree = ast.parse(fragment)
+        except SyntaxError:
+            continue
+
+        renames: Dict[str, str] = {}
+        duplicates: Set[str] = set()
+        for node in tree.body:
+            if not isinstance(node, _DEFINITION_TYPES):
+                continue
+            normalized = ast.unparse(node)
+            if node.name not in defined:
+                continue
+            if defined[node.name] == normalized:
+                duplicates.add(node.name)
+                continue
+            suffix = 2
+            while f"{node.name}_{suffix}" in defined:
+                suffix += 1
+            renames[node.name] = f"{node.name}_{suffix}"
+
+        if renames:
+            fragment = _rename_identifiers(fragment, renames)
+            tree = ast.parse(fragment)
+        lines = fragment.splitlines(keepends=True)
+        if lines and not lines[-1].endswith("\n"):
+            lines[-1] += "\n"
+
+        for node in tree.body:
+            if isinstance(node, _DEFINITION_TYPES):
+                if node.name in duplicates:
+                    continue
+                defined[node.name] = ast.unparse(node)
+                definitions.append(_segment(lines, node))
+                continue
+
+            normalized = ast.unparse(node)
+            if normalized in seen_statements:
+                continue
+            seen_statements.add(normalized)
+            header.append(_segment(lines, node))
+
+    # The header keeps the order of first appearance, since the path setup
+    # must run before the module under test is imported
+    return "".join(header) + "".join(f"\n\n{definition}" for definition in definitions)
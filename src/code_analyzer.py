@@ -13,7 +13,11 @@ class CodeAnalyzer(ast.NodeVisitor):
         self.has_file_operations: bool = False
         self.decorator_count: int = 0
         self.import_names: Set[str] = set()
+        self.imported_modules: Set[str] = set()
         self.has_testable_code: bool = False
+        self.function_count: int = 0
+        self.class_count: int = 0
+        self.branch_count: int = 0
 
     def visit_Call(self, node: ast.Call) -> None:
         if isinstance(node.func, ast.Attribute):
@@ -41,14 +45,30 @@ class CodeAnalyzer(ast.NodeVisitor):
     def visit_Import(self, node: ast.Import) -> None:
         for name in node.names:
             self.import_names.add(name.name.split(".")[0])
+            self.imported_modules.add(name.name)
         self.generic_visit(node)
 
     def visit_ImportFrom(self, node: ast.ImportFrom) -> None:
         if node.module:
             self.import_names.add(node.module.split(".")[0])
+        elif node.level:
+            # ``from . import name`` imports sibling modules by name
+            for name in node.names:
+                self.import_names.add(name.name)
+
+        # Relative imports keep their leading dots, and imported names are
+        # recorded as possible submodules
+        module = "." * node.level + (node.module or "")
+        if node.module:
+            self.imported_modules.add(module)
+        for name in node.names:
+            if name.name != "*":
+                separator = "." if node.module else ""
+                self.imported_modules.add(f"{module}{separator}{name.name}")
         self.generic_visit(node)
 
     def visit_FunctionDef(self, node: ast.FunctionDef) -> None:
+        self.function_count += 1
         if not any(
             d.id == "abstractmethod"
             for d in node.decorator_list
@@ -58,7 +78,12 @@ class CodeAnalyzer(ast.NodeVisitor):
         self.decorator_count += len(node.decorator_list)
         self.generic_visit(node)
 
+    def visit_AsyncFunctionDef(self, node: ast.AsyncFunctionDef) -> None:
+        self.function_count += 1
+        self.generic_visit(node)
+
     def visit_ClassDef(self, node: ast.ClassDef) -> None:
+        self.class_count += 1
         if not any(
             d.id == "abstractmethod"
             for d in node.decorator_list
@@ -67,3 +92,16 @@ class CodeAnalyzer(ast.NodeVisitor):
             self.has_testable_code = True
         self.decorator_count += len(node.decorator_list)
         self.generic_visit(node)
+
+    def _visit_branch(self, node: ast.AST) -> None:
+        self.branch_count += 1
+        self.generic_visit(node)
+
+    # Every branch is another path the tests have to cover
+    visit_If = _visit_branch
+    visit_IfExp = _visit_branch
+    visit_For = _visit_branch
+    visit_AsyncFor = _visit_branch
+    visit_While = _visit_branch
+    visit_ExceptHandler = _visit_branch
+    visit_match_case = _visit_branch
@@ -0,0 +1,212 @@
+"""Scripted chat model that replays recorded agent turns without calling a
+model provider, for benchmarks and offline runs of the pipeline. It can
+throttle calls on purpose, like a provider enforcing its rate limits."""
+
+import json
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Sequence
+
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import Field, PrivateAttr
+
+from rate_limit import ThrottlingError
+
+
+def _first_human_message(messages: Sequence[BaseMessage]) -> str:
+    for message in messages:
+        if isinstance(message, HumanMessage):
+            if isinstance(message.content, str):
+                return message.content
+            return "".join(
+                block.get("text", "") if isinstance(block, dict) else block
+                for block in message.content
+            )
+    return ""
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class ScriptedChatModel(BaseChatModel):
+    """Chat model that answers every conversation with a recorded script.
+
+    A script is the list of AI messages of one conversation, typically
+    validate_tests calls followed by the final test module. The script of a
+    conversation is the one whose key is the longest key contained in the
+    first user message, or ``default_script`` if no key matches. A
+    conversation starts over when the model is called without AI messages in
+    its input, so the same script can be replayed any number of times.
+
+    Args:
+        scripts (Dict[str, List[AIMessage]]): Scripts by key
+        default_script (List[AIMessage]): Script of conversations without a
+            matching key
+        latency (float): Seconds every model call takes
+        max_calls_per_second (float): Calls beyond this rate are throttled,
+            0 for no limit
+        max_concurrent_calls (int): Calls beyond this number of concurrent
+            calls are throttled, 0 for no limit
+    """
+
+    scripts: Dict[str, List[AIMessage]] = Field(default_factory=dict)
+    default_script: List[AIMessage] = Field(default_factory=list)
+    latency: float = 0.0
+    max_calls_per_second: float = 0.0
+    max_concurrent_calls: int = 0
+    throttled_calls: int = 0
+
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _turns: Dict[str, int] = PrivateAttr(default_factory=dict)
+    _call_times: deque = PrivateAttr(default_factory=deque)
+    _in_flight: int = PrivateAttr(default=0)
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any) -> "ScriptedChatModel":
+        # The tool calls are part of the scripts, so the tools are not needed
+        return self
+
+    def _script(self, first_message: str) -> List[AIMessage]:
+        matches = [key for key in self.scripts if key in first_message]
+        if not matches:
+            return self.default_script
+        return self.scripts[max(matches, key=len)]
+
+    def _next_turn(self, messages: List[BaseMessage]) -> int:
+        conversation = _first_human_message(messages)
+        with self._lock:
+            if not any(isinstance(message, AIMessage) for message in messages):
+                self._turns[conversation] = 0
+            turn = self._turns.get(conversation, 0)
+            self._turns[conversation] = turn + 1
+        return turn
+
+    def _admit(self) -> None:
+        """Start a call, or throttle it if it exceeds the limits."""
+        now = time.monotonic()
+        with self._lock:
+            while self._call_times and now - self._call_times[0] >= 1.0:
+                self._call_times.popleft()
+            if (
+                self.max_calls_per_second
+                and len(self._call_times) >= self.max_calls_per_second
+            ) or (
+                self.max_concurrent_calls
+                and self._in_flight >= self.max_concurrent_calls
+            ):
+                self.throttled_calls += 1
+                raise ThrottlingError(
+                    "ThrottlingException: Too many requests, please wait before "
+                    "trying your request again."
+                )
+            self._call_times.append(now)
+            self._in_flight += 1
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        self._admit()
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+        script = self._script(_first_human_message(messages))
+        turn = self._next_turn(messages)
+        if turn >= len(script):
+            raise ValueError(
+                f"The script has no turn {turn + 1}, it only has {len(script)} turns"
+            )
+
+        recorded = script[turn]
+        tool_calls = [
+            {**tool_call, "id": tool_call.get("id") or f"call_{turn}_{index}"}
+            for index, tool_call in enumerate(recorded.tool_calls)
+        ]
+        input_tokens = sum(
+            _estimate_tokens(str(message.content)) for message in messages
+        )
+        output_tokens = _estimate_tokens(
+            str(recorded.content) + json.dumps([call["args"] for call in tool_calls])
+        )
+        message = AIMessage(
+            content=recorded.content,
+            tool_calls=tool_calls,
+            usage_metadata={
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens,
+            },
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+def script_from_messages(messages: Sequence[BaseMessage]) -> List[AIMessage]:
+    """Record the AI messages of a finished conversation as a script.
+
+    Args:
+        messages (Sequence[BaseMessage]): Messages of the agent state
+
+    Returns:
+        List[AIMessage]: The content and tool calls of every AI message
+    """
+    return [
+        AIMessage(content=message.content, tool_calls=message.tool_calls)
+        for message in messages
+        if isinstance(message, AIMessage)
+    ]
+
+
+def save_scripts(path: str, scripts: Dict[str, List[AIMessage]]) -> None:
+    """Write scripts to a JSON file.
+
+    Args:
+        path (str): Path to the JSON file
+        scripts (Dict[str, List[AIMessage]]): Scripts by key
+    """
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                key: [
+                    {"content": message.content, "tool_calls": message.tool_calls}
+                    for message in script
+                ]
+                for key, script in scripts.items()
+            },
+            f,
+            indent=2,
+        )
+
+
+def load_scripts(path: str) -> Dict[str, List[AIMessage]]:
+    """Read scripts written by ``save_scripts``.
+
+    Args:
+        path (str): Path to the JSON file
+
+    Returns:
+        Dict[str, List[AIMessage]]: Scripts by key
+    """
+    with open(path, encoding="utf-8") as f:
+        recorded = json.load(f)
+    return {
+        key: [
+            AIMessage(content=turn["content"], tool_calls=turn.get("tool_calls", []))
+            for turn in script
+        ]
+        for key, script in recorded.items()
+    }
@@ -1,137 +1,489 @@
 import ast
+import hashlib
 import os
+import re
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Dict
+from typing import Dict, List, Optional, Pattern, Tuple, TypedDict
 
+from analysis_cache import AnalysisCache, FileAnalysis
 from code_analyzer import CodeAnalyzer
-
-
-def _should_skip_file(file_path: Path) -> bool:
-    """Determine if a file should be skipped for test generation.
+from metrics import timed
+
+_SKIP_PATTERNS = {
+    "patterns": [
+        "constant",
+        "const",
+        "value",
+        "setting",
+        "config",
+        "version",
+        "type",
+        "enum",
+        "exception",
+        "error",
+        "__init__",
+        "interface",
+        "stub",
+        "helper",
+        "util",
+        "mock",
+        "fake",
+    ],
+    "content_markers": [
+        "typing.",
+        "@dataclass",
+        "enum.",
+        "logging.",
+        "@abstractmethod",
+        "@interface",
+        "Protocol",
+        "TypeVar",
+        "@overload",
+    ],
+    "external_deps": {
+        "requests",
+        "aiohttp",
+        "httpx",
+        "sqlalchemy",
+        "django",
+        "flask",
+        "fastapi",
+        "boto3",
+        "azure",
+        "google.cloud",
+        "pymongo",
+        "redis",
+        "celery",
+        "kafka",
+        "rabbitmq",
+        "pika",
+    },
+}
+
+_EXCLUDED_DIRS = {"__pycache__", "node_modules", "site-packages", "venv", "env"}
+
+# Below this number of files, starting a process pool costs more than it saves
+_PROCESS_POOL_THRESHOLD = 64
+
+
+class ModuleInfo(TypedDict):
+    path: str
+    # Empty for skipped modules, which do not need tests
+    source: str
+    content_hash: str
+    skipped: bool
+    import_names: List[str]
+    imported_modules: List[str]
+
+
+def _is_skipped_name(file_name: str) -> bool:
+    """Check if the file name alone marks a file that does not need tests."""
+    stem = file_name.rsplit(".", 1)[0].lower()
+    return any(pattern in stem for pattern in _SKIP_PATTERNS["patterns"])
+
+
+def _should_skip_source(content: str, analyzer: CodeAnalyzer) -> bool:
+    """Determine if analyzed source code should be skipped for test generation.
 
     Args:
-        file_path (Path): Path to the Python file to analyze
+        content (str): Source code of the Python file
+        analyzer (CodeAnalyzer): Analyzer that visited the parsed source code
 
     Returns:
         bool: True if the file should be skipped, False otherwise
     """
-    skip_patterns = {
-        "patterns": [
-            "constant",
-            "const",
-            "value",
-            "setting",
-            "config",
-            "version",
-            "type",
-            "enum",
-            "exception",
-            "error",
-            "__init__",
-            "interface",
-            "stub",
-            "helper",
-            "util",
-            "mock",
-            "fake",
-        ],
-        "content_markers": [
-            "typing.",
-            "@dataclass",
-            "enum.",
-            "logging.",
-            "@abstractmethod",
-            "@interface",
-            "Protocol",
-            "TypeVar",
-            "@overload",
-        ],
-        "external_deps": {
-            "requests",
-            "aiohttp",
-            "httpx",
-            "sqlalchemy",
-            "django",
-            "flask",
-            "fastapi",
-            "boto3",
-            "azure",
-            "google.cloud",
-            "pymongo",
-            "redis",
-            "celery",
-            "kafka",
-            "rabbitmq",
-            "pika",
-        },
-    }
+    if not analyzer.has_testable_code:
+        return True
 
-    if any(pattern in file_path.stem.lower() for pattern in skip_patterns["patterns"]):
+    if analyzer.import_names & _SKIP_PATTERNS["external_deps"]:  # type: ignore
         return True
 
+    if analyzer.has_api_calls or analyzer.has_db_operations:
+        return True
+
+    content_lower = content.lower()
+    marker_matches = sum(
+        1 for marker in _SKIP_PATTERNS["content_markers"] if marker in content_lower
+    )
+
+    return marker_matches > 2 or analyzer.decorator_count > 5
+
+
+def _analyze_file(
+    path: str, data: Optional[bytes] = None
+) -> Tuple[Optional[FileAnalysis], str]:
+    """Read, parse and analyze a Python file exactly once.
+
+    The imports of skipped files are analyzed too, since a change to a
+    skipped file affects the modules importing it.
+
+    Args:
+        path (str): Path to the Python file
+        data (Optional[bytes]): Content of the file, if it was already read
+
+    Returns:
+        Tuple[Optional[FileAnalysis], str]: The analysis, or None if the file could
+        not be read, and the source code, which is empty for skipped files
+    """
     try:
-        content = file_path.read_text(encoding="utf-8")
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            if data is None:
+                data = f.read()
+        content = data.decode("utf-8")
+    except Exception as e:
+        print(f"Error reading file {path}: {str(e)}")
+        return None, ""
+
+    analysis: FileAnalysis = {
+        "path": path,
+        "mtime_ns": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "content_hash": hashlib.sha256(data).hexdigest(),
+        "skip": len(content.strip()) < 50 or _is_skipped_name(os.path.basename(path)),
+        "import_names": [],
+        "imported_modules": [],
+    }
 
-        if len(content.strip()) < 50:
-            return True
+    analyzer = CodeAnalyzer()
+    try:
+        analyzer.visit(ast.parse(content))
+    except Exception as e:
+        print(f"Error analyzing file {path}: {str(e)}")
+    else:
+        analysis["skip"] = analysis["skip"] or _should_skip_source(content, analyzer)
+        analysis["import_names"] = sorted(analyzer.import_names)
+        analysis["imported_modules"] = sorted(analyzer.imported_modules)
 
-        tree = ast.parse(content)
-        analyzer = CodeAnalyzer()
-        analyzer.visit(tree)
+    return analysis, "" if analysis["skip"] else content
 
-        if not analyzer.has_testable_code:
-            return True
 
-        if analyzer.import_names & skip_patterns["external_deps"]:  # type: ignore
-            return True
+def _reuse_cached_analyses(
+    python_files: List[str], analysis_cache: AnalysisCache
+) -> Tuple[List[Tuple[FileAnalysis, str]], List[Tuple[str, Optional[bytes]]]]:
+    """Split files into those with a valid cached analysis and those that
+    need to be analyzed.
 
-        if analyzer.has_api_calls or analyzer.has_db_operations:
-            return True
+    A cached analysis is valid if the file's modification time and size are
+    unchanged, in which case skipped files are not even read, or if the
+    content hash is unchanged.
 
-        content_lower = content.lower()
-        marker_matches = sum(
-            1 for marker in skip_patterns["content_markers"] if marker in content_lower
-        )
+    Returns:
+        Tuple[List[Tuple[FileAnalysis, str]], List[Tuple[str, Optional[bytes]]]]:
+        The reused analyses with their source code, and the paths that need
+        to be analyzed with their content if it was already read
+    """
+    cached = analysis_cache.load(python_files)
+    reused: List[Tuple[FileAnalysis, str]] = []
+    refreshed: List[FileAnalysis] = []
+    pending: List[Tuple[str, Optional[bytes]]] = []
+    for path in python_files:
+        entry = cached.get(path)
+        if entry is None:
+            pending.append((path, None))
+            continue
+        try:
+            stat = os.stat(path)
+            unchanged = (
+                entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size
+            )
+            if unchanged and entry["skip"]:
+                reused.append((entry, ""))
+                continue
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError as e:
+            print(f"Error reading file {path}: {str(e)}")
+            continue
 
-        if marker_matches > 2 or analyzer.decorator_count > 5:
-            return True
+        if not unchanged:
+            if hashlib.sha256(data).hexdigest() != entry["content_hash"]:
+                pending.append((path, data))
+                continue
+            entry = {**entry, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+            refreshed.append(entry)
+        try:
+            reused.append((entry, "" if entry["skip"] else data.decode("utf-8")))
+        except UnicodeDecodeError:
+            pending.append((path, data))
 
-        return False
+    analysis_cache.store(refreshed)
+    analysis_cache.hits += len(reused)
+    analysis_cache.misses += len(pending)
+    return reused, pending
 
-    except Exception as e:
-        print(f"Error analyzing file {file_path}: {str(e)}")
-        return False
 
+def _compile_gitignore_pattern(
+    pattern: str,
+) -> Optional[Tuple[Pattern[str], bool, bool]]:
+    """Translate a .gitignore pattern into a regular expression.
 
-def read_python_files(folder_path: str) -> Dict[str, str]:
-    """Read all Python files in the specified folder and return their contents
-    as a dictionary.
+    Args:
+        pattern (str): A line of a .gitignore file
+
+    Returns:
+        Optional[Tuple[Pattern[str], bool, bool]]: The expression matching paths
+        relative to the .gitignore file, whether the pattern is negated, and
+        whether it only matches directories, or None for blank lines and comments
+    """
+    pattern = pattern.rstrip("\n").rstrip()
+    if not pattern or pattern.startswith("#"):
+        return None
+
+    negate = pattern.startswith("!")
+    if negate:
+        pattern = pattern[1:]
+    if pattern.startswith("\\"):
+        pattern = pattern[1:]
+    dir_only = pattern.endswith("/")
+    pattern = pattern.rstrip("/")
+    anchored = "/" in pattern
+    pattern = pattern.lstrip("/")
+    if not pattern:
+        return None
+
+    regex = ""
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            regex += "(?:.*/)?"
+            i += 3
+        elif pattern.startswith("/**", i) and i + 3 == len(pattern):
+            regex += "/.*"
+            i += 3
+        elif pattern.startswith("**", i):
+            regex += ".*"
+            i += 2
+        elif pattern[i] == "*":
+            regex += "[^/]*"
+            i += 1
+        elif pattern[i] == "?":
+            regex += "[^/]"
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + 2 :]:
+            end = pattern.index("]", i + 2)
+            regex += "[" + pattern[i + 1 : end].replace("!", "^", 1) + "]"
+            i = end + 1
+        else:
+            regex += re.escape(pattern[i])
+            i += 1
+
+    if not anchored:
+        regex = "(?:.*/)?" + regex
+    return re.compile(regex + "$"), negate, dir_only
+
+
+class _GitIgnore:
+    """The rules of all .gitignore files found while walking a directory
+    tree."""
+
+    def __init__(self) -> None:
+        self._rules: List[Tuple[str, Pattern[str], bool, bool]] = []
+
+    def add_file(self, gitignore_path: Path, base: str) -> None:
+        try:
+            lines = gitignore_path.read_text(encoding="utf-8").splitlines()
+        except Exception:
+            return
+        for line in lines:
+            rule = _compile_gitignore_pattern(line)
+            if rule:
+                self._rules.append((base, *rule))
+
+    def is_ignored(self, relative_path: str, is_dir: bool) -> bool:
+        ignored = False
+        for base, regex, negate, dir_only in self._rules:
+            if dir_only and not is_dir:
+                continue
+            if base:
+                if not relative_path.startswith(base + "/"):
+                    continue
+                path = relative_path[len(base) + 1 :]
+            else:
+                path = relative_path
+            if regex.match(path):
+                ignored = not negate
+        return ignored
+
+
+def module_name_from_path(file_path: Path, root: Path) -> str:
+    """Get the dotted module path of a Python file relative to a root
+    directory, e.g. ``package.sub.module`` for ``package/sub/module.py``."""
+    return ".".join(file_path.relative_to(root).with_suffix("").parts)
+
+
+def package_prefix(folder_path: str) -> str:
+    """Get the dotted package a directory belongs to, e.g. ``app.core`` for
+    ``src/app/core`` if ``app`` and ``core`` contain an ``__init__.py``, and an
+    empty string otherwise."""
+    folder = Path(folder_path).resolve()
+    packages: List[str] = []
+    while (folder / "__init__.py").is_file():
+        packages.insert(0, folder.name)
+        folder = folder.parent
+    return ".".join(packages)
+
+
+def _is_test_file(file_name: str) -> bool:
+    """Check if a file is a test module or a pytest configuration file."""
+    return (
+        file_name.startswith("test_")
+        or file_name.endswith("_test.py")
+        or file_name == "conftest.py"
+    )
+
+
+def _walk_python_files(folder: Path, excluded: Optional[Path] = None) -> List[Path]:
+    """Recursively find the Python files of a directory tree that are not
+    ignored by a .gitignore file and are not tests.
+
+    Args:
+        folder (Path): Root of the directory tree
+        excluded (Optional[Path]): Resolved directory that is not walked, e.g.
+            the directory the test modules are written to
+    """
+    gitignore = _GitIgnore()
+    python_files = []
+    pending = [(folder, "")]
+    while pending:
+        directory, relative_dir = pending.pop()
+        if (directory / ".gitignore").is_file():
+            gitignore.add_file(directory / ".gitignore", relative_dir)
+
+        try:
+            entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+        except OSError as e:
+            print(f"Error reading directory {directory}: {str(e)}")
+            continue
+
+        for entry in entries:
+            relative_path = (
+                f"{relative_dir}/{entry.name}" if relative_dir else entry.name
+            )
+            if entry.is_dir(follow_symlinks=False):
+                if (
+                    entry.name.startswith(".")
+                    or entry.name in _EXCLUDED_DIRS
+                    or gitignore.is_ignored(relative_path, is_dir=True)
+                    or (excluded is not None and Path(entry.path).resolve() == excluded)
+                ):
+                    continue
+                if not entry.name.isidentifier():
+                    # Modules in it could not be imported by their dotted name
+                    print(
+                        f"Warning: Skipping the directory {relative_path}, "
+                        "which is not a valid package name"
+                    )
+                    continue
+                pending.append((Path(entry.path), relative_path))
+            elif (
+                entry.name.endswith(".py")
+                and entry.is_file()
+                and not _is_test_file(entry.name)
+                and not gitignore.is_ignored(relative_path, is_dir=False)
+            ):
+                python_files.append(Path(entry.path))
+    return python_files
+
+
+@timed("discovery")
+def discover_python_modules(
+    folder_path: str,
+    max_workers: Optional[int] = None,
+    analysis_cache: Optional[AnalysisCache] = None,
+    include_skipped: bool = False,
+    test_dir: Optional[str] = None,
+) -> Dict[str, ModuleInfo]:
+    """Recursively discover the Python modules of a directory tree that need
+    tests, or all of them.
+
+    Every file is read and parsed at most once. Files with a valid entry in
+    the analysis cache are not parsed at all. For large trees, the analysis
+    runs in a process pool.
 
     Args:
         folder_path (str): Path to the folder containing Python files
+        max_workers (Optional[int]): Maximum number of analysis processes
+        analysis_cache (Optional[AnalysisCache]): Cache of analysis results, which
+            is updated with the new results
+        include_skipped (bool): Whether to also return the modules that do not
+            need tests, e.g. helpers or configuration, whose imports and hashes
+            decide which modules are affected by a change
+        test_dir (Optional[str]): Directory of the generated test modules,
+            which is not searched if it is inside the folder
 
     Returns:
-        Dict[str, str]: Dictionary where keys are file names (without .py) and values are file contents
-    """
+        Dict[str, ModuleInfo]: Dictionary where keys are dotted module paths relative
+        to the folder and values are information about the modules
 
+    Raises:
+        ValueError: If the path does not exist or is not a directory
+    """
     folder = Path(folder_path)
-    result = {}
-
     if not folder.exists() or not folder.is_dir():
         raise ValueError(f"The path {folder_path} does not exist or is not a directory")
 
-    for python_file in folder.glob("*.py"):
-        if not _should_skip_file(python_file):
-            try:
-                content = python_file.read_text(encoding="utf-8")
-                result[python_file.stem] = content
-            except Exception as e:
-                print(f"Error reading file {python_file}: {str(e)}")
-                continue
+    excluded = Path(test_dir).resolve() if test_dir else None
+    python_files = [str(path) for path in _walk_python_files(folder, excluded)]
+    if analysis_cache is not None:
+        analyzed, pending = _reuse_cached_analyses(python_files, analysis_cache)
+    else:
+        analyzed, pending = [], [(path, None) for path in python_files]
+
+    paths = [path for path, _ in pending]
+    datas = [data for _, data in pending]
+    if len(pending) < _PROCESS_POOL_THRESHOLD:
+        results = [_analyze_file(path, data) for path, data in pending]
+    else:
+        workers = max_workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(
+                executor.map(
+                    _analyze_file,
+                    paths,
+                    datas,
+                    chunksize=max(1, len(pending) // (workers * 8)),
+                )
+            )
+    new_analyses = [
+        (analysis, content) for analysis, content in results if analysis is not None
+    ]
+
+    if analysis_cache is not None:
+        analysis_cache.store(analysis for analysis, _ in new_analyses)
+
+    return {
+        module_name_from_path(Path(analysis["path"]), folder): {
+            "path": analysis["path"],
+            "source": content,
+            "content_hash": analysis["content_hash"],
+            "skipped": analysis["skip"],
+            "import_names": analysis["import_names"],
+            "imported_modules": analysis["imported_modules"],
+        }
+        for analysis, content in analyzed + new_analyses
+        if include_skipped or not analysis["skip"]
+    }
+
+
+def read_python_files(folder_path: str) -> Dict[str, str]:
+    """Recursively read all Python files in the specified folder that need
+    tests and return their contents as a dictionary.
 
-    return result
+    Args:
+        folder_path (str): Path to the folder containing Python files
+
+    Returns:
+        Dict[str, str]: Dictionary where keys are dotted module paths relative to the folder and values are file contents
+    """
+    return {
+        module_name: info["source"]
+        for module_name, info in discover_python_modules(folder_path).items()
+    }
 
 
+@timed("writing")
 def write_test_python_module(content: str, file_path: str):
     """Writes the given string content to a Python file at the specified
     location.
@@ -0,0 +1,415 @@
+"""Generation of the test module of a single module: the agent runs of its
+units or candidates, their repair, slimming and caching."""
+
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from budget import ModuleBudget, budget_scope
+from cache import GenerationCache, cache_key
+from chunker import (
+    DEFAULT_MAX_UNIT_LINES,
+    DEFAULT_SPLIT_THRESHOLD_LINES,
+    merge_test_fragments,
+    should_split,
+    split_module,
+)
+from file_manager import write_test_python_module
+from helper import clean_python_code, record_validation
+from metrics import ModuleRecord, add_module_record, new_module_record
+from models import TEMPERATURE, model_id
+from prompts import _SYSTEM_PROMPT, candidate_prompt, unit_prompt, user_prompt
+from repair import mark_failing_tests, repair_test_module
+from slimming import DEFAULT_MAX_TEST_SECONDS, describe_report, slim_test_module
+from validation import registered_source, run_validation, tools_fingerprint
+
+# The agent runtime imports langchain and langgraph, which takes longer than
+# everything else at startup, so it is only imported once an agent is run
+if TYPE_CHECKING:
+    from langchain_core.messages import BaseMessage
+
+DEFAULT_MAX_CONCURRENCY = 4
+
+
+@dataclass(frozen=True)
+class GenerationSettings:
+    """Settings of the generation of the test modules of a source directory,
+    which are the same for every module.
+
+    Args:
+        relative_source_path (str): Path from the test directory to the source directory
+        test_module_path (str): Directory where the test modules are written
+        model_name (str): Name of the model backend, which is part of the cache key
+        cache (Optional[GenerationCache]): Cache of validated test modules
+        cache_only (bool): Whether to only write cached test modules
+        repair (bool): Whether to repair existing test modules instead of
+            generating new ones
+        split_threshold (int): Number of lines above which a module is split,
+            0 to never split it
+        max_unit_lines (int): Maximum number of lines per unit of a split module
+        max_concurrency (int): Maximum number of units or candidates of a module
+            generated at the same time
+        candidates (int): Number of candidate test modules generated in
+            parallel for a module that is not split
+        budget_limits (Optional[Dict[str, Any]]): Arguments of the
+            ``ModuleBudget`` of every attempt to generate the tests of a module,
+            None for no budget
+        remove_failing_tests (bool): Whether to remove the failing tests of a
+            partial test module instead of marking them as expected to fail
+        slim_tests (str): Whether to "flag" or "remove" the slow and redundant
+            tests of a passing test module, or "" to not profile its tests
+        max_test_seconds (float): Time budget of a top-level test for slimming
+    """
+
+    relative_source_path: str = ""
+    test_module_path: str = ""
+    model_name: str = "bedrock"
+    cache: Optional[GenerationCache] = None
+    cache_only: bool = False
+    repair: bool = False
+    split_threshold: int = DEFAULT_SPLIT_THRESHOLD_LINES
+    max_unit_lines: int = DEFAULT_MAX_UNIT_LINES
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY
+    candidates: int = 1
+    budget_limits: Optional[Dict[str, Any]] = None
+    remove_failing_tests: bool = False
+    slim_tests: str = ""
+    max_test_seconds: float = DEFAULT_MAX_TEST_SECONDS
+
+
+def _test_file_path(test_module_path: str, module_name: str) -> str:
+    # Test modules are stored flat. Dotted module paths are joined with "-",
+    # which cannot be part of a module name, so a.b_c and a_b.c do not clash
+    return f"{test_module_path}/test_{module_name.replace('.', '-')}.py"
+
+
+def _invoke_agent(graph: Any, prompt: str, record: ModuleRecord) -> str:
+    from agent import final_test_code, run_agent
+
+    return final_test_code(run_agent(graph, prompt, record))
+
+
+def _generate_in_units(
+    graph: Any, prompts: List[str], max_concurrency: int, record: ModuleRecord
+) -> str:
+    """Run the agent for every unit of a split module concurrently and merge
+    the resulting test fragments into one test module."""
+    unit_records = [new_module_record(record["module"]) for _ in prompts]
+    with ThreadPoolExecutor(max_workers=min(len(prompts), max_concurrency)) as executor:
+        # Run every unit in a copy of the current context, so its stages are
+        # attributed to the module
+        futures = [
+            executor.submit(
+                contextvars.copy_context().run,
+                _invoke_agent,
+                graph,
+                prompt,
+                unit_record,
+            )
+            for prompt, unit_record in zip(prompts, unit_records)
+        ]
+        fragments = [future.result() for future in futures]
+    for unit_record in unit_records:
+        add_module_record(record, unit_record)
+    return merge_test_fragments(fragments)
+
+
+def _invoke_candidate(
+    graph: Any, prompt: str, record: ModuleRecord, cancel: threading.Event
+) -> List["BaseMessage"]:
+    from agent import run_agent
+
+    if cancel.is_set():
+        return []
+    return run_agent(graph, prompt, record, cancel=cancel, stop_when_passed=True)
+
+
+def _generate_candidates(
+    graph: Any,
+    prompt: str,
+    candidates: int,
+    max_concurrency: int,
+    record: ModuleRecord,
+) -> str:
+    """Run the agent for several variants of the prompt of a module
+    concurrently. The first candidate whose tests pass wins and the others
+    are cancelled after their current step. If no candidate passes, the
+    candidate with the best validated draft is returned, to be repaired like
+    the tests of a single agent run."""
+    from agent import best_draft, draft_rank, final_test_code
+
+    module_name = record["module"]
+    candidate_records = [new_module_record(module_name) for _ in range(candidates)]
+    cancel = threading.Event()
+    conversations: Dict[int, List["BaseMessage"]] = {}
+    winner: Optional[int] = None
+    errors: List[Exception] = []
+    with ThreadPoolExecutor(max_workers=min(candidates, max_concurrency)) as executor:
+        futures = {
+            executor.submit(
+                contextvars.copy_context().run,
+                _invoke_candidate,
+                graph,
+                candidate_prompt(prompt, index),
+                candidate_record,
+                cancel,
+            ): index
+            for index, candidate_record in enumerate(candidate_records)
+        }
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                messages = future.result()
+            except Exception as e:
+                print(
+                    f"Error generating candidate {index + 1} for {module_name}: "
+                    f"{str(e)}"
+                )
+                errors.append(e)
+                continue
+            conversations[index] = messages
+            draft = best_draft(messages)
+            if winner is None and draft is not None and draft[1]["passed"]:
+                winner = index
+                cancel.set()
+                print(
+                    f"[{module_name}] candidate {index + 1} of {candidates} passed "
+                    "first"
+                )
+    for candidate_record in candidate_records:
+        add_module_record(record, candidate_record)
+    if not conversations:
+        raise errors[0]
+
+    if winner is not None:
+        draft = best_draft(conversations[winner])
+        assert draft is not None
+        return clean_python_code(draft[0])
+
+    def rank(index: int) -> Tuple[Tuple[bool, float, int], int]:
+        draft = best_draft(conversations[index])
+        return (draft_rank(draft[1]) if draft else (False, -1.0, -1), -index)
+
+    best = max(conversations, key=rank)
+    print(
+        f"[{module_name}] no candidate passed, continuing with candidate "
+        f"{best + 1} of {candidates}"
+    )
+    return final_test_code(conversations[best])
+
+
+def _slim_test_module(
+    test_code: str,
+    code: str,
+    module_name: str,
+    remove: bool,
+    max_test_seconds: float,
+    record: ModuleRecord,
+) -> str:
+    """Report the slow and redundant tests of a passing test module, remove
+    them if requested, and add them to the record of the module."""
+    slimmed_test_code, report = slim_test_module(
+        test_code, code, module_name, max_test_seconds, remove
+    )
+    if report is None:
+        return test_code
+    record["slow_tests"] += len(report["slow"])
+    record["redundant_tests"] += len(report["redundant"])
+    record["removed_tests"] += len(report["removed"])
+    record["test_seconds_saved"] += report["seconds_before"] - report["seconds_after"]
+    if report["slow"] or report["redundant"]:
+        print(f"[{module_name}] slimming: {describe_report(report)}")
+    return slimmed_test_code
+
+
+def _budget_allows_repair(budget: Optional[ModuleBudget]) -> bool:
+    """Check if the budget of a module allows a repair, which takes at least
+    one model turn and usually a validation run."""
+    return budget is None or (budget.allows("model") and budget.allows("validation"))
+
+
+def generate_test_module(
+    graph: Any,
+    settings: GenerationSettings,
+    module_name: str,
+    code: str,
+    record: Optional[ModuleRecord] = None,
+    budget: Optional[ModuleBudget] = None,
+    dependency_summary: str = "",
+) -> Tuple[str, str]:
+    """Run the agent for a single module and write the resulting test module.
+
+    Test modules that pass validation are stored in the cache, and a cached
+    test module is written without running the agent. In cache-only mode, no
+    agent is run and modules without a cached test module are skipped. In
+    repair mode, an existing test module that still passes is kept, and
+    otherwise only its failing tests are fixed by the agent.
+
+    The agent runs of the module share its budget. If the budget runs out
+    before the tests pass, the best draft is kept with its failing tests
+    marked as expected to fail, or removed, and the module gets the status
+    "partial". Partial test modules are not cached.
+
+    Modules larger than the split threshold are split into units of top-level
+    functions and classes. The agent writes the tests of every unit
+    separately, and the merged test module is repaired if it fails.
+
+    Args:
+        graph (Any): The compiled ReAct agent graph, None in cache-only mode
+        settings (GenerationSettings): Settings of the run
+        module_name (str): Name of the module the tests are written for
+        code (str): Source code of the module
+        record (Optional[ModuleRecord]): Record of the module, to which the
+            agent runs and validation runs are added
+        budget (Optional[ModuleBudget]): Budget of the agent runs of the module
+        dependency_summary (str): Signature summaries of the modules of the
+            project the module imports, which are added to the prompts
+
+    Returns:
+        Tuple[str, str]: Path of the written test module and its status, one of
+        "cached", "uncached", "kept", "repaired", "passed", "partial" or "failed"
+    """
+    relative_source_path = settings.relative_source_path
+    units = (
+        split_module(code, settings.max_unit_lines)
+        if should_split(code, settings.split_threshold)
+        else []
+    )
+    if len(units) > 1:
+        prompts = [
+            unit_prompt(
+                relative_source_path,
+                module_name,
+                unit["code"],
+                unit["summary"],
+                dependency_summary,
+            )
+            for unit in units
+        ]
+    else:
+        prompts = [
+            user_prompt(relative_source_path, module_name, code, dependency_summary)
+        ]
+    candidates = settings.candidates if len(prompts) == 1 else 1
+    if budget is not None and len(prompts) * candidates > 1:
+        budget.scale(len(prompts) * candidates)
+    test_file_path = _test_file_path(settings.test_module_path, module_name)
+
+    key = cache_key(
+        code,
+        _SYSTEM_PROMPT,
+        *prompts,
+        model_id(settings.model_name),
+        str(TEMPERATURE),
+        tools_fingerprint(),
+        # Cached test modules are slimmed, unless tests are only flagged
+        (
+            f"slim={settings.max_test_seconds:g}"
+            if settings.slim_tests == "remove"
+            else ""
+        ),
+    )
+    cache = settings.cache
+    if cache is not None:
+        cached_test_code = cache.get(key)
+        if cached_test_code is not None:
+            write_test_python_module(cached_test_code, test_file_path)
+            return test_file_path, "cached"
+    if settings.cache_only:
+        return test_file_path, "uncached"
+
+    if record is None:
+        record = new_module_record(module_name)
+    with registered_source(module_name, code), budget_scope(budget):
+        test_code = None
+        status = "passed"
+        if settings.repair and os.path.exists(test_file_path):
+            with open(test_file_path, encoding="utf-8") as f:
+                existing_test_code = f.read()
+            validation = run_validation(existing_test_code, code, module_name)
+            record_validation(record, validation)
+            if validation["passed"]:
+                return test_file_path, "kept"
+            test_code = repair_test_module(
+                graph,
+                existing_test_code,
+                validation,
+                relative_source_path,
+                module_name,
+                code,
+                record,
+            )
+            status = "repaired"
+
+        if test_code is None:
+            if len(prompts) > 1:
+                test_code = _generate_in_units(
+                    graph, prompts, settings.max_concurrency, record
+                )
+            elif candidates > 1:
+                test_code = _generate_candidates(
+                    graph, prompts[0], candidates, settings.max_concurrency, record
+                )
+            else:
+                test_code = _invoke_agent(graph, prompts[0], record)
+            status = "passed"
+        write_test_python_module(test_code, test_file_path)
+
+        validation = run_validation(test_code, code, module_name)
+
+        record_validation(record, validation)
+        if (
+            not validation["passed"]
+            and (len(prompts) > 1 or candidates > 1)
+            and status == "passed"
+            and _budget_allows_repair(budget)
+        ):
+            # The units were validated separately, so the merged module usually
+            # fails only where fragments conflict, and the best of several
+            # candidates usually fails only a few tests; fix just those tests
+            repaired_test_code = repair_test_module(
+                graph,
+                test_code,
+                validation,
+                relative_source_path,
+                module_name,
+                code,
+                record,
+            )
+            if repaired_test_code is not None:
+                test_code = repaired_test_code
+                write_test_python_module(test_code, test_file_path)
+                validation = run_validation(test_code, code, module_name)
+                record_validation(record, validation)
+
+    if not validation["passed"] and budget is not None and budget.exhausted_by:
+        partial_test_code = mark_failing_tests(
+            test_code, validation, remove=settings.remove_failing_tests
+        )
+        if partial_test_code is not None:
+            write_test_python_module(partial_test_code, test_file_path)
+            validation = run_validation(partial_test_code, code, module_name)
+            record_validation(record, validation)
+            if validation["passed"]:
+                return test_file_path, "partial"
+
+    if not validation["passed"]:
+        return test_file_path, "failed"
+    if settings.slim_tests:
+        slimmed_test_code = _slim_test_module(
+            test_code,
+            code,
+            module_name,
+            settings.slim_tests == "remove",
+            settings.max_test_seconds,
+            record,
+        )
+        if slimmed_test_code != test_code:
+            test_code = slimmed_test_code
+            write_test_python_module(test_code, test_file_path)
+    if cache is not None:
+        cache.put(key, test_code)
+    return test_file_path, status
@@ -1,100 +1,173 @@
-import ast
+import itertools
 import os
+import tokenize
 from pathlib import Path
-from typing import List
+from typing import Any, List, Mapping, Optional
 
+from metrics import ModuleRecord, timed
+
+_PYTHON_FENCE_LANGUAGES = ("", "python", "python3", "py")
+# An unclosed bracket in prose is only reported at the end of the text, so
+# every restart of the tokenizer may read the rest of the text again
+MAX_TOKENIZE_RESTARTS = 16
+
+
+def _fenced_code(text: str) -> Optional[str]:
+    """Get the content of the Python code fences of a text, or None if the
+    text has no Python code fences. A fence left open, e.g. by a truncated
+    response, extends to the end of the text."""
+    blocks: List[str] = []
+    block: List[str] = []
+    in_fence = False
+    is_python = False
+    for line in text.splitlines(keepends=True):
+        stripped = line.strip()
+        if stripped.startswith("```"):
+            if in_fence and is_python:
+                blocks.append("".join(block))
+            elif not in_fence:
+                is_python = stripped[3:].strip().lower() in _PYTHON_FENCE_LANGUAGES
+            in_fence = not in_fence
+            block = []
+        elif in_fence and is_python:
+            block.append(line)
+    if in_fence and is_python:
+        blocks.append("".join(block))
+    return "\n".join(blocks) if blocks else None
+
+
+def _is_valid_python(code: str) -> bool:
+    # Compiling is faster than building the AST, which is not needed here
+    try:
+        compile(code, "<response>", "exec", dont_inherit=True)
+    except (SyntaxError, ValueError):
+        return False
+    return True
 
-def clean_python_code(text: str) -> str:
-    """Cleans a string containing Python code mixed with natural language,
-    preserving only valid Python code, blank lines, comments, and docstrings.
+
+def _line_starts(lines: List[str], first: int) -> List[int]:
+    """Find the lines at which top-level statements probably start, without
+    tokenizing: lines at column 0 that do not close a bracket and do not
+    follow a decorator.
 
     Args:
-        text (str): Input text containing Python code and natural language
+        lines (List[str]): Lines of the text, with their line endings
+        first (int): Index of the first line to look at
 
     Returns:
-        str: Cleaned text with natural language removed
+        List[int]: Zero-based indices of the first lines of the statements
     """
+    starts = []
+    decorated = False
+    for index in range(first, len(lines)):
+        line = lines[index]
+        if not line.strip() or line[0] in " \t#)]}":
+            continue
+        if not decorated:
+            starts.append(index)
+        decorated = line.startswith("@")
+    return starts
+
+
+def _top_level_starts(lines: List[str]) -> List[int]:
+    """Find the lines at which top-level statements start.
+
+    The lines are tokenized once, so lines inside strings and brackets are
+    never mistaken for statements. Where the tokenizer fails, e.g. on an
+    apostrophe in prose, the failing statement becomes a block of its own
+    and tokenizing restarts after it. If the tokenizer failed only at the end
+    of the text, or after ``MAX_TOKENIZE_RESTARTS`` restarts, the remaining
+    lines are split by ``_line_starts`` instead.
+    Decorators are kept together with the definition they decorate.
 
-    def try_parse_line(line: str) -> bool:
-        """Check if a single line could be part of valid Python code."""
-        stripped = line.strip()
-        if not stripped:
-            return True
-
-        if any(
-            [
-                stripped.startswith("#"),
-                stripped.startswith(('"""', "'''")),
-                stripped.startswith(("import ", "from ")),
-                stripped.startswith(("def ", "class ")),
-                stripped.startswith("@"),
-                stripped.startswith(
-                    ("if ", "elif ", "else:", "try:", "except", "finally:")
-                ),
-                stripped.startswith(("while ", "for ")),
-                stripped.startswith(("return ", "yield ", "raise ")),
-                stripped in ("pass", "break", "continue"),
-                stripped.startswith("print("),
-                "=" in stripped,
-            ]
-        ):
-            return True
-
-        if line.startswith((" ", "\t")):
-            return True
+    Args:
+        lines (List[str]): Lines of the text, with their line endings
 
+    Returns:
+        List[int]: Sorted zero-based indices of the first lines of the statements
+    """
+    skipped = (
+        tokenize.NL,
+        tokenize.COMMENT,
+        tokenize.INDENT,
+        tokenize.DEDENT,
+        tokenize.ENDMARKER,
+    )
+    starts = [0]
+    first = 0
+    restarts = 0
+    while first < len(lines):
+        if restarts > MAX_TOKENIZE_RESTARTS:
+            starts.extend(_line_starts(lines, first))
+            break
+        statement_start: Optional[int] = None
+        decorated = False
         try:
-            ast.parse(stripped, mode="eval")
-            return True
-        except:
-            pass
-
-        return False
-
-    lines = text.split("\n")
-    result_lines = []
-    in_multiline_string = False
-
-    for line in lines:
-        stripped = line.strip()
-        if stripped.count('"""') % 2 == 1 or stripped.count("'''") % 2 == 1:
-            in_multiline_string = not in_multiline_string
+            remaining = itertools.islice(lines, first, None)
+            for token in tokenize.generate_tokens(lambda: next(remaining, "")):
+                if token.type == tokenize.ERRORTOKEN and not token.string.isspace():
+                    raise tokenize.TokenError("invalid token", token.start)
+                if token.type in skipped:
+                    continue
+                if token.type == tokenize.NEWLINE:
+                    statement_start = None
+                    continue
+                if statement_start is None:
+                    statement_start = first + token.start[0] - 1
+                    if token.start[1] == 0:
+                        if not decorated:
+                            starts.append(statement_start)
+                        decorated = token.string == "@"
+            break
+        except (tokenize.TokenError, SyntaxError) as e:
+            row = e.lineno if isinstance(e, SyntaxError) else e.args[1][0]
+            error_line = first + (row or 1) - 1
+            if statement_start is None:
+                statement_start = error_line
+            # A failing statement inside a definition, e.g. a truncated one,
+            # stays in the block of the definition, which is then dropped
+            if not lines[statement_start][:1].isspace():
+                starts.append(statement_start)
+            starts.append(statement_start + 1)
+            first = statement_start + 1
+            restarts += 1
+            if error_line >= len(lines) - 1:
+                # The tokenizer read to the end, e.g. for an unclosed bracket,
+                # and would do so again after every restart
+                restarts = MAX_TOKENIZE_RESTARTS + 1
+    return sorted(set(start for start in starts if start < len(lines)))
+
+
+@timed("cleaning")
+def clean_python_code(text: str) -> str:
+    """Extract the Python code from a model response.
 
-        if not stripped or in_multiline_string or try_parse_line(line):
-            result_lines.append(line)
+    The content of Python code fences is used if the response has any, and
+    the whole response otherwise. If that does not parse, it is split into
+    its top-level statements, which are parsed one by one, and only the
+    statements that compile are kept. This drops prose and truncated
+    definitions while keeping every complete test function.
 
-    result = "\n".join(result_lines)
+    Args:
+        text (str): Model response containing Python code and natural language
 
-    try:
-        ast.parse(result)
-        return result
-    except:
-        final_lines = []
-        current_block: List[str] = []
-
-        for line in result.split("\n"):
-            if not line.strip():
-                if current_block:
-                    try:
-                        ast.parse("\n".join(current_block))
-                        final_lines.extend(current_block)
-                        final_lines.append(line)
-                    except:
-                        pass
-                    current_block = []
-                else:
-                    final_lines.append(line)
-            else:
-                current_block.append(line)
-
-        if current_block:
-            try:
-                ast.parse("\n".join(current_block))
-                final_lines.extend(current_block)
-            except:
-                pass
-
-        return "\n".join(final_lines)
+    Returns:
+        str: The Python code of the response
+    """
+    code = _fenced_code(text)
+    if code is None:
+        code = text
+    if _is_valid_python(code):
+        return code
+
+    lines = code.splitlines(keepends=True)
+    starts = _top_level_starts(lines)
+    blocks = []
+    for start, end in zip(starts, [*starts[1:], len(lines)]):
+        block = "".join(lines[start:end])
+        if _is_valid_python(block):
+            blocks.append(block)
+    return "".join(blocks)
 
 
 def get_relative_source_path(source_path: str, test_path: str) -> str:
@@ -126,3 +199,10 @@ def get_relative_source_path(source_path: str, test_path: str) -> str:
         )
 
     return os.path.relpath(str(source_path_obj), str(test_path_obj))
+
+
+def record_validation(record: ModuleRecord, validation: Mapping[str, Any]) -> None:
+    """Add a validation run to a module record."""
+    record["validation_runs"] += 1
+    record["pytest_seconds"] += validation.get("duration", 0.0)
+    record["reused_test_outcomes"] += validation.get("reused", 0)
@@ -0,0 +1,194 @@
+import hashlib
+import json
+import os
+import subprocess
+from pathlib import Path
+from typing import Dict, Iterable, Set
+
+from file_manager import module_name_from_path
+
+MANIFEST_FILE_NAME = ".minerva_manifest.json"
+
+
+def source_hash(code: str) -> str:
+    """Hash the source code of a module."""
+    return hashlib.sha256(code.encode("utf-8")).hexdigest()
+
+
+def load_manifest(manifest_path: str) -> Dict[str, str]:
+    """Load the source hashes of the modules tested by the last run.
+
+    Args:
+        manifest_path (str): Path to the manifest file
+
+    Returns:
+        Dict[str, str]: Module names mapped to the hash of their source code, or
+        an empty dictionary if no manifest exists yet
+    """
+    try:
+        with open(manifest_path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"Warning: Ignoring unreadable manifest {manifest_path}: {str(e)}")
+        return {}
+
+
+def save_manifest(manifest_path: str, manifest: Dict[str, str]) -> None:
+    """Write the manifest atomically.
+
+    Args:
+        manifest_path (str): Path to the manifest file
+        manifest (Dict[str, str]): Module names mapped to the hash of their source code
+    """
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+
+def changed_modules_from_manifest(
+    source_hashes: Dict[str, str], manifest: Dict[str, str]
+) -> Set[str]:
+    """Get the modules whose source code differs from the manifest.
+
+    Args:
+        source_hashes (Dict[str, str]): Module names mapped to the hash of their
+            source code, see :func:`source_hash`
+        manifest (Dict[str, str]): Manifest of the last run
+
+    Returns:
+        Set[str]: Names of the new or changed modules
+    """
+    return {
+        module_name
+        for module_name, current_hash in source_hashes.items()
+        if manifest.get(module_name) != current_hash
+    }
+
+
+def changed_modules_from_git(
+    python_module_path: str, python_modules: Iterable[str], base_ref: str
+) -> Set[str]:
+    """Get the modules that changed since a git ref, including uncommitted and
+    untracked files.
+
+    Args:
+        python_module_path (str): Directory containing the Python modules
+        python_modules (Iterable[str]): Names of the discovered modules
+        base_ref (str): The git ref to compare against, e.g. ``origin/main``
+
+    Returns:
+        Set[str]: Names of the changed modules
+
+    Raises:
+        ValueError: If git cannot compare the directory against the ref
+    """
+    folder = Path(python_module_path).resolve()
+
+    def git(*args: str) -> str:
+        try:
+            result = subprocess.run(
+                ["git", *args],
+                cwd=str(folder),
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+        except (OSError, subprocess.CalledProcessError) as e:
+            stderr = getattr(e, "stderr", "") or str(e)
+            raise ValueError(f"git {' '.join(args)} failed: {stderr.strip()}")
+        return result.stdout
+
+    repo_root = Path(git("rev-parse", "--show-toplevel").strip())
+    changed_files = git("diff", "--name-only", base_ref, "--", ".").splitlines()
+    changed_files += git(
+        "ls-files", "--others", "--exclude-standard", "--full-name", "--", "."
+    ).splitlines()
+
+    module_names = set(python_modules)
+    changed = set()
+    for changed_file in changed_files:
+        path = (repo_root / changed_file).resolve()
+        if path.suffix != ".py" or not path.is_relative_to(folder):
+            continue
+        module_name = module_name_from_path(path, folder)
+        if module_name in module_names:
+            changed.add(module_name)
+    return changed
+
+
+def _resolve_import(importer: str, imported: str) -> str:
+    """Resolve a relative import against the package of the importing
+    module."""
+    level = len(imported) - len(imported.lstrip("."))
+    if not level:
+        return imported
+    package = importer.split(".")[:-level]
+    return ".".join([*package, imported[level:]]).strip(".")
+
+
+def build_import_graph(
+    imported_modules: Dict[str, Iterable[str]], package_prefix: str = ""
+) -> Dict[str, Set[str]]:
+    """Map every module to the discovered modules it imports.
+
+    Args:
+        imported_modules (Dict[str, Iterable[str]]): Module names mapped to the
+            modules they import, as collected by ``CodeAnalyzer.imported_modules``
+        package_prefix (str): Dotted package of the source directory, if it is
+            itself part of a package, as returned by ``package_prefix``
+
+    Returns:
+        Dict[str, Set[str]]: Module names mapped to the names of the modules they import
+    """
+    # A package is imported by its name, but discovered as its __init__ module
+    module_names = {}
+    for module_name in imported_modules:
+        if module_name == "__init__":
+            module_names[package_prefix] = module_name
+        else:
+            module_names[module_name.removesuffix(".__init__")] = module_name
+    graph = {}
+    for module_name, imports in imported_modules.items():
+        importer = f"{package_prefix}.{module_name}" if package_prefix else module_name
+        graph[module_name] = set()
+        for imported in imports:
+            resolved = _resolve_import(importer, imported)
+            # The tests put the source directory on sys.path, so its modules
+            # can be imported with or without the package prefix
+            if package_prefix and resolved.startswith(package_prefix + "."):
+                resolved = resolved[len(package_prefix) + 1 :]
+            resolved = module_names.get(resolved, "")
+            if resolved and resolved != module_name:
+                graph[module_name].add(resolved)
+    return graph
+
+
+def with_dependents(changed: Set[str], import_graph: Dict[str, Set[str]]) -> Set[str]:
+    """Extend the changed modules by every module that imports them, directly
+    or through other modules.
+
+    Args:
+        changed (Set[str]): Names of the changed modules
+        import_graph (Dict[str, Set[str]]): Graph built by :func:`build_import_graph`
+
+    Returns:
+        Set[str]: Names of the changed modules and their dependents
+    """
+    dependents: Dict[str, Set[str]] = {
+        module_name: set() for module_name in import_graph
+    }
+    for module_name, imports in import_graph.items():
+        for imported in imports:
+            dependents[imported].add(module_name)
+
+    selected = set(changed)
+    pending = list(changed)
+    while pending:
+        for dependent in dependents.get(pending.pop(), ()):
+            if dependent not in selected:
+                selected.add(dependent)
+                pending.append(dependent)
+    return selected
@@ -0,0 +1,112 @@
+"""Progress ledger of a run.
+
+Every finished module is appended to a JSON lines file of the run as soon as
+its test module is written, so a run that is restarted with the same run ID
+skips the modules it already finished. Lines are flushed to disk one by one,
+and a line that was cut off by a crash is ignored when the ledger is read.
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Dict, Optional, Tuple, TypedDict
+
+DEFAULT_STATE_DIR = ".minerva"
+
+
+class LedgerEntry(TypedDict):
+    source_dir: str
+    module: str
+    source_hash: str
+    status: str
+    test_file: str
+    time: float
+
+
+def new_run_id() -> str:
+    """Create a run ID that sorts by the start time of the run."""
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+
+def ledger_path(state_dir: str, run_id: str) -> str:
+    return os.path.join(state_dir, "runs", f"{run_id}.jsonl")
+
+
+class RunLedger:
+    """Append-only record of the modules a run has finished.
+
+    Args:
+        path (str): Path to the JSON lines file of the run, which is created if
+            it does not exist
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: Dict[Tuple[str, str], LedgerEntry] = {}
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    self._entries[(entry["source_dir"], entry["module"])] = entry
+        self._file = open(path, "a", encoding="utf-8")
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def finished(
+        self, source_dir: str, module_name: str, source_hash: str
+    ) -> Optional[LedgerEntry]:
+        """Get the entry of a module the run already finished, or None if the
+        module was not finished, changed since, or its test module is gone.
+
+        Args:
+            source_dir (str): Source directory the module belongs to
+            module_name (str): Name of the module
+            source_hash (str): Hash of the current source code of the module
+
+        Returns:
+            Optional[LedgerEntry]: The entry of the module
+        """
+        with self._lock:
+            entry = self._entries.get((source_dir, module_name))
+        if entry is None or entry["source_hash"] != source_hash:
+            return None
+        if not os.path.exists(entry["test_file"]):
+            return None
+        return entry
+
+    def record(
+        self,
+        source_dir: str,
+        module_name: str,
+        source_hash: str,
+        status: str,
+        test_file: str,
+    ) -> None:
+        """Append a finished module to the ledger and flush it to disk."""
+        entry: LedgerEntry = {
+            "source_dir": source_dir,
+            "module": module_name,
+            "source_hash": source_hash,
+            "status": status,
+            "test_file": test_file,
+            "time": time.time(),
+        }
+        with self._lock:
+            self._entries[(source_dir, module_name)] = entry
+            self._file.write(json.dumps(entry, sort_keys=True) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
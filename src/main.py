@@ -1,33 +1,544 @@
-from langgraph.prebuilt import create_react_agent
+import argparse
+import json
+import os
+from typing import List, Optional, Tuple
 
-from file_manager import (get_file_path_from_user, read_python_files,
-                          write_test_python_module)
-from helper import clean_python_code, get_relative_source_path
-from models import bedrock_model as model
-from prompts import system_prompt, user_prompt
-from tools import validation_tools
+from budget import (
+    DEFAULT_MAX_MODEL_TURNS,
+    DEFAULT_MAX_VALIDATION_RUNS,
+    DEFAULT_MODULE_DEADLINE,
+)
+from cache import DEFAULT_CACHE_DIR, DEFAULT_MAX_ENTRIES
+from chunker import DEFAULT_MAX_UNIT_LINES, DEFAULT_SPLIT_THRESHOLD_LINES
+from file_manager import get_file_path_from_user
+from generation import DEFAULT_MAX_CONCURRENCY, GenerationSettings
+from ledger import DEFAULT_STATE_DIR, new_run_id
+from metrics import (
+    ModuleRecord,
+    get_stage_timer,
+    write_chrome_trace,
+    write_jsonl,
+    write_prometheus,
+)
+from models import available_models
+from pipeline import RunSettings, run_pipeline
+from pytest_pool import (
+    DEFAULT_CPU_SECONDS,
+    DEFAULT_MEMORY_MB,
+    DEFAULT_OPEN_FILES,
+    DEFAULT_RUN_TIMEOUT,
+    DEFAULT_TEST_TIMEOUT,
+)
+from rate_limit import DEFAULT_MAX_RETRIES
+from routing import (
+    DEFAULT_LOCAL_MAX_BRANCHES,
+    DEFAULT_LOCAL_MAX_FUNCTIONS,
+    DEFAULT_LOCAL_MAX_LINES,
+    DEFAULT_LOCAL_MAX_MODEL_TURNS,
+)
+from slimming import DEFAULT_MAX_TEST_SECONDS
 
 
-def main() -> None:
-    graph = create_react_agent(
-        model, tools=validation_tools, state_modifier=system_prompt, debug=True
+def _parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Generate PyTest unit tests for the Python modules of a package."
     )
+    parser.add_argument(
+        "--source",
+        help="Directory of the Python modules. Asked for interactively if neither "
+        "--source nor --batch is given.",
+    )
+    parser.add_argument(
+        "--tests",
+        help="Directory where the test modules are written, required with --source.",
+    )
+    parser.add_argument(
+        "--batch",
+        help="JSON file listing source and test directory pairs, as objects with "
+        "the keys source and tests, which are processed one after another. "
+        "Relative paths are relative to the file.",
+    )
+    parser.add_argument(
+        "--state-dir",
+        default=DEFAULT_STATE_DIR,
+        help="Directory of the progress ledgers and agent checkpoints of the runs "
+        f"(default: {DEFAULT_STATE_DIR}).",
+    )
+    parser.add_argument(
+        "--run-id",
+        help="ID of the run. Pass the ID of an interrupted run to resume it, "
+        "skipping the modules it finished. A new ID is created by default.",
+    )
+    parser.add_argument(
+        "--no-state",
+        action="store_true",
+        help="Neither record the progress of the run nor checkpoint the agent "
+        "conversations, so the run cannot be resumed.",
+    )
+    parser.add_argument(
+        "--max-concurrency",
+        type=int,
+        default=DEFAULT_MAX_CONCURRENCY,
+        help="Maximum number of modules for which tests are generated at the same "
+        f"time (default: {DEFAULT_MAX_CONCURRENCY}).",
+    )
+    parser.add_argument(
+        "--candidates",
+        type=int,
+        default=1,
+        help="Number of candidate test modules generated in parallel for a module "
+        "that is not split, with different prompt variants. The first candidate "
+        "whose tests pass wins and the others are cancelled; otherwise the best "
+        "candidate is repaired (default: 1).",
+    )
+    parser.add_argument(
+        "--schedule",
+        choices=["cost", "discovery"],
+        default="cost",
+        help="Order in which modules are started: the most expensive modules "
+        "first, estimated from the module sizes and earlier runs, or the order "
+        "in which they were discovered (default: cost).",
+    )
+    parser.add_argument(
+        "--model",
+        choices=available_models(),
+        default="bedrock",
+        help="Model backend of the agent (default: bedrock).",
+    )
+    parser.add_argument(
+        "--model-scripts",
+        help="JSON file of recorded conversations replayed by the fake model.",
+    )
+    parser.add_argument(
+        "--local-model",
+        choices=available_models(),
+        help="Backend that gets simple modules first, e.g. llama_cpp with the model "
+        "file in MINERVA_LLAMA_CPP_MODEL. Modules escalate to --model if its "
+        "tests do not pass. By default, every module goes to --model.",
+    )
+    parser.add_argument(
+        "--local-max-lines",
+        type=int,
+        default=DEFAULT_LOCAL_MAX_LINES,
+        help="Maximum number of lines of a module sent to the local model "
+        f"(default: {DEFAULT_LOCAL_MAX_LINES}).",
+    )
+    parser.add_argument(
+        "--local-max-functions",
+        type=int,
+        default=DEFAULT_LOCAL_MAX_FUNCTIONS,
+        help="Maximum number of functions of a module sent to the local model "
+        f"(default: {DEFAULT_LOCAL_MAX_FUNCTIONS}).",
+    )
+    parser.add_argument(
+        "--local-max-branches",
+        type=int,
+        default=DEFAULT_LOCAL_MAX_BRANCHES,
+        help="Maximum number of branches of a module sent to the local model "
+        f"(default: {DEFAULT_LOCAL_MAX_BRANCHES}).",
+    )
+    parser.add_argument(
+        "--local-max-model-turns",
+        type=int,
+        default=DEFAULT_LOCAL_MAX_MODEL_TURNS,
+        help="Model turns of the local model per module before it escalates, 0 "
+        f"for no limit (default: {DEFAULT_LOCAL_MAX_MODEL_TURNS}).",
+    )
+    parser.add_argument(
+        "--requests-per-minute",
+        type=float,
+        default=0,
+        help="Maximum number of calls per minute to --model, 0 for no limit "
+        "(default: 0).",
+    )
+    parser.add_argument(
+        "--tokens-per-minute",
+        type=float,
+        default=0,
+        help="Maximum number of input and output tokens per minute of --model, 0 "
+        "for no limit (default: 0).",
+    )
+    parser.add_argument(
+        "--max-model-retries",
+        type=int,
+        default=DEFAULT_MAX_RETRIES,
+        help="Number of retries of a throttled call to --model, with jittered "
+        "exponential backoff; concurrent calls are also reduced while the model "
+        f"throttles (default: {DEFAULT_MAX_RETRIES}).",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=DEFAULT_CACHE_DIR,
+        help="Directory of the cache of validated test modules "
+        f"(default: {DEFAULT_CACHE_DIR}).",
+    )
+    parser.add_argument(
+        "--cache-max-entries",
+        type=int,
+        default=DEFAULT_MAX_ENTRIES,
+        help="Maximum number of cached test modules before the least recently "
+        f"used ones are evicted (default: {DEFAULT_MAX_ENTRIES}).",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always generate new test modules instead of using cached ones.",
+    )
+    parser.add_argument(
+        "--cache-only",
+        action="store_true",
+        help="Only write the cached test modules and skip the modules without one, "
+        "without creating an agent.",
+    )
+    parser.add_argument(
+        "--list-modules",
+        action="store_true",
+        help="Only list the modules tests would be generated for, and exit.",
+    )
+    parser.add_argument(
+        "--no-analysis-cache",
+        action="store_true",
+        help="Parse and analyze every source file instead of reusing the analysis "
+        "results of unchanged files stored in the cache directory.",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only generate tests for modules that changed since the last run, "
+        "according to the manifest in the test directory, and the modules that "
+        "import them.",
+    )
+    parser.add_argument(
+        "--base-ref",
+        help="Like --incremental, but detect changed modules with git diff against "
+        "this ref instead of the manifest.",
+    )
+    parser.add_argument(
+        "--repair",
+        action="store_true",
+        help="Keep existing test modules that still pass, and let the agent fix only "
+        "the failing tests of the others instead of generating new test modules.",
+    )
+    parser.add_argument(
+        "--split-threshold",
+        type=int,
+        default=DEFAULT_SPLIT_THRESHOLD_LINES,
+        help="Generate the tests of modules with more lines than this in separate "
+        "units of top-level functions and classes, 0 to never split modules "
+        f"(default: {DEFAULT_SPLIT_THRESHOLD_LINES}).",
+    )
+    parser.add_argument(
+        "--max-unit-lines",
+        type=int,
+        default=DEFAULT_MAX_UNIT_LINES,
+        help="Maximum number of source lines per unit of a split module "
+        f"(default: {DEFAULT_MAX_UNIT_LINES}).",
+    )
+    parser.add_argument(
+        "--prompt-caching",
+        action="store_true",
+        help="Mark the system prompt for Bedrock prompt caching, for models "
+        "that support it.",
+    )
+    parser.add_argument(
+        "--max-model-turns",
+        type=int,
+        default=DEFAULT_MAX_MODEL_TURNS,
+        help="Model turns the agent may take per module, 0 for no limit "
+        f"(default: {DEFAULT_MAX_MODEL_TURNS}). Split modules get this many per unit.",
+    )
+    parser.add_argument(
+        "--max-validation-runs",
+        type=int,
+        default=DEFAULT_MAX_VALIDATION_RUNS,
+        help="Validation runs the agent may start per module, 0 for no limit "
+        f"(default: {DEFAULT_MAX_VALIDATION_RUNS}). Split modules get this many "
+        "per unit.",
+    )
+    parser.add_argument(
+        "--module-deadline",
+        type=float,
+        default=DEFAULT_MODULE_DEADLINE,
+        help="Seconds after which the agent stops working on a module, 0 for no "
+        f"limit (default: {DEFAULT_MODULE_DEADLINE:g}).",
+    )
+    parser.add_argument(
+        "--remove-failing-tests",
+        action="store_true",
+        help="When the budget of a module runs out, remove the failing tests of "
+        "the best draft instead of marking them as expected to fail.",
+    )
+    parser.add_argument(
+        "--slim-tests",
+        choices=["flag", "remove"],
+        help="Profile the duration and coverage of every test of a passing test "
+        "module, and report or remove the tests that run longer than "
+        "--max-test-seconds and the tests that cover nothing the other tests do "
+        "not cover. By default, the tests are not profiled.",
+    )
+    parser.add_argument(
+        "--max-test-seconds",
+        type=float,
+        default=DEFAULT_MAX_TEST_SECONDS,
+        help="Time budget of a top-level test function or class for --slim-tests, "
+        f"0 for no budget (default: {DEFAULT_MAX_TEST_SECONDS:g}).",
+    )
+    parser.add_argument(
+        "--coverage-target",
+        type=float,
+        default=0.0,
+        help="Stop the agent as soon as its tests pass and cover this percentage "
+        "of the lines and branches of a module, 0 to always wait for its final "
+        "answer (default: 0).",
+    )
+    parser.add_argument(
+        "--no-coverage",
+        action="store_true",
+        help="Do not measure the coverage of the source code in validation runs.",
+    )
+    parser.add_argument(
+        "--full-validation",
+        action="store_true",
+        help="Rerun every test in every validation run, instead of only the "
+        "edited and failing tests while some tests fail.",
+    )
+    parser.add_argument(
+        "--test-timeout",
+        type=float,
+        default=DEFAULT_TEST_TIMEOUT,
+        help="Seconds after which a single generated test fails as timed out, 0 for "
+        f"no limit (default: {DEFAULT_TEST_TIMEOUT:g}).",
+    )
+    parser.add_argument(
+        "--run-timeout",
+        type=float,
+        default=DEFAULT_RUN_TIMEOUT,
+        help="Seconds after which a whole pytest run is killed, 0 for no limit "
+        f"(default: {DEFAULT_RUN_TIMEOUT:g}).",
+    )
+    parser.add_argument(
+        "--cpu-limit",
+        type=int,
+        default=DEFAULT_CPU_SECONDS,
+        help="CPU seconds a pytest run may use, 0 for no limit "
+        f"(default: {DEFAULT_CPU_SECONDS}).",
+    )
+    parser.add_argument(
+        "--memory-limit",
+        type=int,
+        default=DEFAULT_MEMORY_MB,
+        help="Address space of a pytest run in MB, 0 for no limit "
+        f"(default: {DEFAULT_MEMORY_MB}).",
+    )
+    parser.add_argument(
+        "--open-files-limit",
+        type=int,
+        default=DEFAULT_OPEN_FILES,
+        help="Number of files a pytest run may open, 0 for no limit "
+        f"(default: {DEFAULT_OPEN_FILES}).",
+    )
+    parser.add_argument(
+        "--quiet",
+        action="store_true",
+        help="Do not print a progress line for every model turn and tool result.",
+    )
+    parser.add_argument(
+        "--metrics-jsonl",
+        help="Write the metrics of every module to this file as JSON lines.",
+    )
+    parser.add_argument(
+        "--prometheus-textfile",
+        help="Write the module and stage metrics to this file in the Prometheus "
+        "text format, e.g. for the textfile collector of the node exporter.",
+    )
+    parser.add_argument(
+        "--trace",
+        help="Write the timings of all stages to this file in the Chrome trace "
+        "event format, which Perfetto and chrome://tracing can load.",
+    )
+    args = parser.parse_args(argv)
+    if args.max_concurrency < 1:
+        parser.error("--max-concurrency must be at least 1")
+    if args.candidates < 1:
+        parser.error("--candidates must be at least 1")
+    if args.max_test_seconds < 0:
+        parser.error("--max-test-seconds must not be negative")
+    if args.max_unit_lines < 1:
+        parser.error("--max-unit-lines must be at least 1")
+    if args.cache_only and args.no_cache:
+        parser.error("--cache-only cannot be combined with --no-cache")
+    if args.coverage_target > 100:
+        parser.error("--coverage-target must be at most 100")
+    if args.coverage_target and args.no_coverage:
+        parser.error("--coverage-target cannot be combined with --no-coverage")
+    if args.local_model and args.local_model == args.model:
+        parser.error("--local-model must differ from --model")
+    for name in (
+        "local_max_lines",
+        "local_max_functions",
+        "local_max_branches",
+        "local_max_model_turns",
+        "requests_per_minute",
+        "tokens_per_minute",
+        "max_model_retries",
+        "coverage_target",
+        "max_model_turns",
+        "max_validation_runs",
+        "module_deadline",
+        "test_timeout",
+        "run_timeout",
+        "cpu_limit",
+        "memory_limit",
+        "open_files_limit",
+    ):
+        if getattr(args, name) < 0:
+            parser.error(f"--{name.replace('_', '-')} must not be negative")
+    if args.batch and (args.source or args.tests):
+        parser.error("--batch cannot be combined with --source and --tests")
+    if bool(args.source) != bool(args.tests):
+        parser.error("--source and --tests must be given together")
+    if args.run_id is None:
+        args.run_id = new_run_id()
+    return args
+
 
-    python_module_path = get_file_path_from_user("Enter the path to the Python modules: ")
-    test_module_path = get_file_path_from_user(
-        "Enter the path where the test modules should be stored: "
+def _run_settings(args: argparse.Namespace) -> RunSettings:
+    """Build the settings of a pipeline run from the command line arguments."""
+    return RunSettings(
+        run_id=args.run_id,
+        generation=GenerationSettings(
+            model_name=args.model,
+            cache_only=args.cache_only,
+            repair=args.repair,
+            split_threshold=args.split_threshold,
+            max_unit_lines=args.max_unit_lines,
+            max_concurrency=args.max_concurrency,
+            candidates=args.candidates,
+            budget_limits={
+                "max_model_turns": args.max_model_turns,
+                "max_validation_runs": args.max_validation_runs,
+                "deadline": args.module_deadline,
+            },
+            remove_failing_tests=args.remove_failing_tests,
+            slim_tests=args.slim_tests or "",
+            max_test_seconds=args.max_test_seconds,
+        ),
+        state_dir=args.state_dir,
+        use_state=not args.no_state,
+        incremental=args.incremental,
+        base_ref=args.base_ref,
+        list_modules=args.list_modules,
+        schedule=args.schedule,
+        max_concurrency=args.max_concurrency,
+        cache_dir=args.cache_dir,
+        use_cache=not args.no_cache,
+        cache_max_entries=args.cache_max_entries,
+        use_analysis_cache=not args.no_analysis_cache,
+        resource_limits={
+            "run_timeout": args.run_timeout,
+            "test_timeout": args.test_timeout,
+            "cpu_seconds": args.cpu_limit,
+            "memory_mb": args.memory_limit,
+            "open_files": args.open_files_limit,
+        },
+        coverage=not args.no_coverage,
+        incremental_validation=not args.full_validation,
+        coverage_target=args.coverage_target,
+        model_scripts=args.model_scripts,
+        local_model=args.local_model,
+        routing_thresholds={
+            "max_lines": args.local_max_lines,
+            "max_functions": args.local_max_functions,
+            "max_branches": args.local_max_branches,
+        },
+        local_max_model_turns=args.local_max_model_turns,
+        prompt_caching=args.prompt_caching,
+        progress=not args.quiet,
+        requests_per_minute=args.requests_per_minute,
+        tokens_per_minute=args.tokens_per_minute,
+        max_model_retries=args.max_model_retries,
     )
 
-    python_modules = read_python_files(python_module_path)
-    relative_source_path = get_relative_source_path(python_module_path, test_module_path)
-    for module_name, code in python_modules.items():
-        response = graph.invoke(
-            {"messages": [("user", user_prompt(relative_source_path, module_name, code))]}
+
+def _load_batch(batch_path: str) -> List[Tuple[str, str]]:
+    """Read the source and test directory pairs of a batch file.
+
+    Args:
+        batch_path (str): Path to the JSON batch file
+
+    Returns:
+        List[Tuple[str, str]]: Absolute source and test directory of every pair
+
+    Raises:
+        ValueError: If the file is malformed or a source directory does not exist
+    """
+    with open(batch_path, encoding="utf-8") as f:
+        entries = json.load(f)
+    if not isinstance(entries, list):
+        raise ValueError(f"{batch_path} must contain a list of directory pairs")
+
+    base_dir = os.path.dirname(os.path.abspath(batch_path))
+    pairs = []
+    for entry in entries:
+        if not isinstance(entry, dict) or not {"source", "tests"} <= entry.keys():
+            raise ValueError(f"Invalid entry in {batch_path}: {entry!r}")
+        source_dir = os.path.join(base_dir, os.path.expanduser(entry["source"]))
+        test_dir = os.path.join(base_dir, os.path.expanduser(entry["tests"]))
+        if not os.path.isdir(source_dir):
+            raise ValueError(f"The source directory {source_dir} does not exist")
+        pairs.append((os.path.normpath(source_dir), os.path.normpath(test_dir)))
+    return pairs
+
+
+def _export_metrics(args: argparse.Namespace, records: List[ModuleRecord]) -> None:
+    timer = get_stage_timer()
+    try:
+        if args.metrics_jsonl:
+            write_jsonl(args.metrics_jsonl, records)
+        if args.prometheus_textfile:
+            write_prometheus(args.prometheus_textfile, records, timer.totals())
+        if args.trace:
+            write_chrome_trace(args.trace, timer.spans())
+    except OSError as e:
+        print(f"Warning: Could not write metrics: {str(e)}")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = _parse_args(argv)
+    if args.batch:
+        try:
+            pairs = _load_batch(args.batch)
+        except (OSError, ValueError) as e:
+            print(f"Error reading batch file {args.batch}: {str(e)}")
+            return
+    elif args.source:
+        pairs = [(args.source, args.tests)]
+    else:
+        python_module_path = get_file_path_from_user(
+            "Enter the path to the Python modules: "
         )
-        write_test_python_module(
-            clean_python_code(response["messages"][-1].content),
-            f"{test_module_path}/test_{module_name}.py",
+        test_module_path = get_file_path_from_user(
+            "Enter the path where the test modules should be stored: "
         )
+        pairs = [(python_module_path, test_module_path)]
+
+    settings = _run_settings(args)
+    if not args.no_state and not args.list_modules:
+        print(f"Run {args.run_id} (resume it with --run-id {args.run_id})")
+    # The metrics of all pairs are exported together, as the stage timer
+    # accumulates the stages of all of them
+    records: List[ModuleRecord] = []
+    for python_module_path, test_module_path in pairs:
+        if len(pairs) > 1:
+            print(f"Generating tests for {python_module_path} in {test_module_path}")
+        try:
+            os.makedirs(test_module_path, exist_ok=True)
+            result = run_pipeline(settings, python_module_path, test_module_path)
+            records.extend(result["records"].values())
+        except (OSError, ValueError) as e:
+            print(f"Error processing {python_module_path}: {str(e)}")
+    _export_metrics(args, records)
+
 
 if __name__ == "__main__":
     main()
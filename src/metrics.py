@@ -0,0 +1,347 @@
+"""Metrics and traces of the pipeline.
+
+Stages are timed with ``with stage("validation"): ...`` or the ``timed``
+decorator anywhere in the pipeline. The process-wide timer sums them over all
+threads and keeps every run as a span of the module being processed, set with
+``module_scope``. Stages can be nested, e.g. the validation runs of the agent
+are also part of the "agent" stage.
+
+Per-module counters are kept in a ``ModuleRecord``. Records, stage totals and
+spans can be exported as JSON lines, as a Prometheus textfile and as a trace
+in the Chrome trace event format, which Perfetto and chrome://tracing load.
+"""
+
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import (
+    Any,
+    Callable,
+    ContextManager,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    TypedDict,
+    TypeVar,
+    cast,
+)
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+_current_module: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "current_module", default=None
+)
+
+
+class StageTotal(TypedDict):
+    count: int
+    seconds: float
+
+
+class Span(TypedDict):
+    name: str
+    module: Optional[str]
+    thread: int
+    start: float
+    seconds: float
+
+
+class ModuleRecord(TypedDict):
+    module: str
+    source: str
+    status: str
+    backend: str
+    route: str
+    seconds: float
+    model_calls: int
+    tool_calls: int
+    input_tokens: int
+    output_tokens: int
+    cache_read_tokens: int
+    cache_creation_tokens: int
+    validation_runs: int
+    pytest_seconds: float
+    reused_test_outcomes: int
+    repair_iterations: int
+    escalations: int
+    slow_tests: int
+    redundant_tests: int
+    removed_tests: int
+    test_seconds_saved: float
+
+
+# Numeric fields of a module record that are exported as metrics
+_RECORD_METRICS = {
+    "seconds": "Wall time of generating the tests of a module.",
+    "model_calls": "Number of model calls for a module.",
+    "tool_calls": "Number of tool calls for a module.",
+    "input_tokens": "Input tokens used for a module.",
+    "output_tokens": "Output tokens used for a module.",
+    "cache_read_tokens": "Input tokens read from the prompt cache for a module.",
+    "cache_creation_tokens": "Input tokens written to the prompt cache for a module.",
+    "validation_runs": "Number of pytest runs for a module.",
+    "pytest_seconds": "Time pytest spent running the tests of a module.",
+    "reused_test_outcomes": "Test outcomes of a module reused instead of rerun.",
+    "repair_iterations": "Number of failed validations followed by a fix.",
+    "escalations": "Number of failed local model attempts before the remote model.",
+    "slow_tests": "Tests of a module that ran longer than the time budget.",
+    "redundant_tests": "Tests of a module that covered nothing the others did not.",
+    "removed_tests": "Slow or redundant tests removed from a module.",
+    "test_seconds_saved": "Test time of a module saved by removing tests.",
+}
+
+
+def new_module_record(module_name: str, source: str = "") -> ModuleRecord:
+    return {
+        "module": module_name,
+        "source": source,
+        "status": "pending",
+        "backend": "",
+        "route": "",
+        "seconds": 0.0,
+        "model_calls": 0,
+        "tool_calls": 0,
+        "input_tokens": 0,
+        "output_tokens": 0,
+        "cache_read_tokens": 0,
+        "cache_creation_tokens": 0,
+        "validation_runs": 0,
+        "pytest_seconds": 0.0,
+        "reused_test_outcomes": 0,
+        "repair_iterations": 0,
+        "escalations": 0,
+        "slow_tests": 0,
+        "redundant_tests": 0,
+        "removed_tests": 0,
+        "test_seconds_saved": 0.0,
+    }
+
+
+def add_module_record(total: ModuleRecord, other: ModuleRecord) -> None:
+    """Add the counters of another record, e.g. of a unit of a split module,
+    to a module record in place."""
+    for field in _RECORD_METRICS:
+        if field != "seconds":
+            cast(Dict[str, Any], total)[field] += cast(Dict[str, Any], other)[field]
+
+
+@contextmanager
+def module_scope(module_name: str) -> Iterator[None]:
+    """Attribute the stages run in this context to a module."""
+    token = _current_module.set(module_name)
+    try:
+        yield
+    finally:
+        _current_module.reset(token)
+
+
+class StageTimer:
+    """Thread-safe accumulator of the time spent in every stage, which also
+    keeps every stage run as a span."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._totals: Dict[str, StageTotal] = {}
+        self._spans: List[Span] = []
+        self._origin = time.perf_counter()
+
+    def add(self, name: str, seconds: float, start: Optional[float] = None) -> None:
+        if start is None:
+            start = time.perf_counter() - seconds
+        span: Span = {
+            "name": name,
+            "module": _current_module.get(),
+            "thread": threading.get_ident(),
+            "start": start - self._origin,
+            "seconds": seconds,
+        }
+        with self._lock:
+            total = self._totals.setdefault(name, {"count": 0, "seconds": 0.0})
+            total["count"] += 1
+            total["seconds"] += seconds
+            self._spans.append(span)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start, start)
+
+    def totals(self) -> Dict[str, StageTotal]:
+        """Get a copy of the number of runs and the total time of every stage."""
+        with self._lock:
+            return {
+                name: {"count": total["count"], "seconds": total["seconds"]}
+                for name, total in self._totals.items()
+            }
+
+    def spans(self) -> List[Span]:
+        """Get a copy of the spans, with start times relative to the last reset."""
+        with self._lock:
+            return list(self._spans)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._totals.clear()
+            self._spans.clear()
+            self._origin = time.perf_counter()
+
+
+_timer = StageTimer()
+
+
+def get_stage_timer() -> StageTimer:
+    """Get the process-wide stage timer."""
+    return _timer
+
+
+def stage(name: str) -> ContextManager[None]:
+    """Time a stage with the process-wide stage timer."""
+    return _timer.stage(name)
+
+
+def timed(name: str) -> Callable[[F], F]:
+    """Decorate a function so every call is timed as the given stage."""
+
+    def decorator(func: F) -> F:
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with _timer.stage(name):
+                return func(*args, **kwargs)
+
+        return cast(F, wrapper)
+
+    return decorator
+
+
+def _write_atomically(path: str, content: str) -> None:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def write_jsonl(path: str, records: Iterable[ModuleRecord]) -> None:
+    """Write one JSON document per module record.
+
+    Args:
+        path (str): Path to the JSONL file
+        records (Iterable[ModuleRecord]): The module records
+    """
+    _write_atomically(
+        path, "".join(json.dumps(record, sort_keys=True) + "\n" for record in records)
+    )
+
+
+def _label(value: str) -> str:
+    escaped = value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    return f'"{escaped}"'
+
+
+def write_prometheus(
+    path: str, records: Iterable[ModuleRecord], totals: Dict[str, StageTotal]
+) -> None:
+    """Write the module records and stage totals in the Prometheus text
+    format, e.g. for the textfile collector of the node exporter.
+
+    Args:
+        path (str): Path to the ``.prom`` file
+        records (Iterable[ModuleRecord]): The module records
+        totals (Dict[str, StageTotal]): Stage totals of the stage timer
+    """
+    records = list(records)
+    lines: List[str] = []
+
+    def gauge(name: str, help_text: str, samples: Iterable[str]) -> None:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        lines.extend(f"{name}{sample}" for sample in samples)
+
+    statuses: Dict[str, int] = {}
+    for record in records:
+        statuses[record["status"]] = statuses.get(record["status"], 0) + 1
+    gauge(
+        "minerva_modules",
+        "Number of modules by final status.",
+        (f"{{status={_label(s)}}} {count}" for s, count in sorted(statuses.items())),
+    )
+    backends: Dict[Tuple[str, str], int] = {}
+    for record in records:
+        if record["backend"]:
+            key = (record["backend"], record["status"])
+            backends[key] = backends.get(key, 0) + 1
+    gauge(
+        "minerva_backend_modules",
+        "Number of modules by the model backend that wrote their tests and status.",
+        (
+            f"{{backend={_label(b)},status={_label(s)}}} {count}"
+            for (b, s), count in sorted(backends.items())
+        ),
+    )
+    gauge(
+        "minerva_stage_seconds",
+        "Time spent in every stage, summed over all threads.",
+        (
+            f"{{stage={_label(name)}}} {total['seconds']:.6f}"
+            for name, total in sorted(totals.items())
+        ),
+    )
+    gauge(
+        "minerva_stage_runs",
+        "Number of runs of every stage.",
+        (
+            f"{{stage={_label(name)}}} {total['count']}"
+            for name, total in sorted(totals.items())
+        ),
+    )
+    for field, help_text in _RECORD_METRICS.items():
+        gauge(
+            f"minerva_module_{field}",
+            help_text,
+            (
+                f"{{source={_label(record['source'])},"
+                f"module={_label(record['module'])},status={_label(record['status'])}}}"
+                f" {cast(Dict[str, Any], record)[field]}"
+                for record in records
+            ),
+        )
+    _write_atomically(path, "\n".join(lines) + "\n")
+
+
+def write_chrome_trace(path: str, spans: Iterable[Span]) -> None:
+    """Write spans in the Chrome trace event format.
+
+    Every thread is a track, and every span is a complete event named after
+    its stage, with the module in its arguments.
+
+    Args:
+        path (str): Path to the JSON file
+        spans (Iterable[Span]): Spans of the stage timer
+    """
+    pid = os.getpid()
+    events = [
+        {
+            "name": span["name"],
+            "cat": "minerva",
+            "ph": "X",
+            "ts": round(span["start"] * 1e6),
+            "dur": round(span["seconds"] * 1e6),
+            "pid": pid,
+            "tid": span["thread"],
+            "args": {"module": span["module"]},
+        }
+        for span in spans
+    ]
+    _write_atomically(path, json.dumps({"traceEvents": events}))
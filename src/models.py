@@ -1,25 +1,122 @@
-from langchain_aws import ChatBedrock
-from langchain_community.llms import LlamaCpp
+"""Registry of the chat model backends.
+
+Backends are created by name on first use, and their client libraries are only
+imported then, so runs that never call a model do not pay for importing them.
+"""
+
+import os
+import threading
+from typing import Any, Callable, Dict, List, Tuple
 
 MAX_TOKENS = 40000
 TEMPERATURE = 0.2
 
 BEDROCK_MODEL_ID = "anthropic.claude-3-5-sonnet-20240620-v1:0"
-LLAMA_CPP_MODEL_PATH = ""  # Path to your local LlamaCpp model.
-
-bedrock_model = ChatBedrock(
-    model_id=BEDROCK_MODEL_ID,
-    model_kwargs={"temperature": TEMPERATURE, "max_tokens": MAX_TOKENS},
-)
-
-llama_cpp_model = None
-if LLAMA_CPP_MODEL_PATH:
-    try:
-        llama_cpp_model = LlamaCpp(
-            model_path=LLAMA_CPP_MODEL_PATH,
-            temperature=TEMPERATURE,
-            max_tokens=MAX_TOKENS,
-            seed=42,
+# Path to your local LlamaCpp model
+LLAMA_CPP_MODEL_PATH = os.environ.get("MINERVA_LLAMA_CPP_MODEL", "")
+
+
+def _bedrock(**overrides: Any) -> Any:
+    from langchain_aws import ChatBedrock
+
+    return ChatBedrock(
+        model_id=overrides.pop("model_id", BEDROCK_MODEL_ID),
+        model_kwargs={
+            "temperature": overrides.pop("temperature", TEMPERATURE),
+            "max_tokens": overrides.pop("max_tokens", MAX_TOKENS),
+        },
+        **overrides,
+    )
+
+
+def _llama_cpp(**overrides: Any) -> Any:
+    model_path = overrides.pop("model_path", LLAMA_CPP_MODEL_PATH)
+    if not model_path:
+        raise ValueError("No LlamaCpp model path is configured")
+
+    # The chat model supports the tool calls of the agent, the plain LLM does not
+    from langchain_community.chat_models import ChatLlamaCpp
+
+    return ChatLlamaCpp(
+        model_path=model_path,
+        temperature=overrides.pop("temperature", TEMPERATURE),
+        max_tokens=overrides.pop("max_tokens", MAX_TOKENS),
+        seed=overrides.pop("seed", 42),
+        **overrides,
+    )
+
+
+def _fake(**overrides: Any) -> Any:
+    from fake_model import ScriptedChatModel, load_scripts
+
+    scripts_path = overrides.pop("scripts_path", None)
+    if scripts_path:
+        overrides["scripts"] = load_scripts(scripts_path)
+    return ScriptedChatModel(**overrides)
+
+
+_MODEL_FACTORIES: Dict[str, Callable[..., Any]] = {
+    "bedrock": _bedrock,
+    "llama_cpp": _llama_cpp,
+    "fake": _fake,
+}
+
+_models: Dict[Tuple[str, Tuple[Tuple[str, Any], ...]], Any] = {}
+_models_lock = threading.Lock()
+
+
+def available_models() -> List[str]:
+    """Get the names of the model backends."""
+    return list(_MODEL_FACTORIES)
+
+
+def model_id(name: str) -> str:
+    """Get the identifier of the model a backend uses by default, e.g. for
+    cache keys, without creating the backend."""
+    if name == "bedrock":
+        return BEDROCK_MODEL_ID
+    if name == "llama_cpp":
+        return f"llama_cpp:{LLAMA_CPP_MODEL_PATH}"
+    return name
+
+
+def get_model(name: str = "bedrock", **overrides: Any) -> Any:
+    """Get a model backend by name, creating it on first use.
+
+    Backends are shared by all callers asking for the same name and overrides.
+
+    Args:
+        name (str): Name of the backend, one of ``available_models()``
+        **overrides (Any): Settings that replace the defaults of the backend,
+            e.g. ``temperature``, or ``scripts_path`` of the fake backend
+
+    Returns:
+        Any: The chat model
+
+    Raises:
+        ValueError: If the backend is unknown or cannot be configured
+    """
+    if name not in _MODEL_FACTORIES:
+        raise ValueError(
+            f"Unknown model {name}, expected one of {', '.join(available_models())}"
         )
-    except Exception as e:
-        print(f"Warning: Could not initialize LlamaCpp model: {e}")
+    key = (name, tuple(sorted(overrides.items())))
+    with _models_lock:
+        if key not in _models:
+            _models[key] = _MODEL_FACTORIES[name](**overrides)
+        return _models[key]
+
+
+def __getattr__(name: str) -> Any:
+    # The models used to be created on import as module attributes
+    if name == "bedrock_model":
+        return get_model("bedrock")
+    if name == "llama_cpp_model":
+        if not LLAMA_CPP_MODEL_PATH:
+            return None
+        try:
+            return get_model("llama_cpp")
+        except Exception as e:
+            print(f"Warning: Could not initialize LlamaCpp model: {e}")
+            return None
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,910 @@
+"""Generation pipeline of a source directory: module selection, scheduling,
+the agent runs of every module and their validation."""
+
+import dataclasses
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    TypedDict,
+)
+
+from analysis_cache import DEFAULT_ANALYSIS_CACHE_FILE, AnalysisCache
+from budget import ModuleBudget
+from cache import DEFAULT_CACHE_DIR, DEFAULT_MAX_ENTRIES, GenerationCache
+from chunker import signature_summary
+from file_manager import ModuleInfo, discover_python_modules, package_prefix
+from generation import (
+    DEFAULT_MAX_CONCURRENCY,
+    GenerationSettings,
+    _test_file_path,
+    generate_test_module,
+)
+from helper import get_relative_source_path
+from incremental import (
+    MANIFEST_FILE_NAME,
+    build_import_graph,
+    changed_modules_from_git,
+    changed_modules_from_manifest,
+    load_manifest,
+    save_manifest,
+    source_hash,
+    with_dependents,
+)
+from ledger import DEFAULT_STATE_DIR, RunLedger, ledger_path
+from metrics import (
+    ModuleRecord,
+    add_module_record,
+    module_scope,
+    new_module_record,
+    stage,
+)
+from models import get_model
+from pytest_pool import ResourceLimits, default_limits
+from rate_limit import DEFAULT_MAX_RETRIES, ModelRateLimiter
+from routing import (
+    DEFAULT_LOCAL_MAX_BRANCHES,
+    DEFAULT_LOCAL_MAX_FUNCTIONS,
+    DEFAULT_LOCAL_MAX_LINES,
+    DEFAULT_LOCAL_MAX_MODEL_TURNS,
+    ROUTING_LOG_FILE_NAME,
+    RoutingLog,
+    RoutingThresholds,
+    is_simple_module,
+)
+from scheduler import (
+    HISTORY_FILE_NAME,
+    CostHistory,
+    estimate_costs,
+    longest_first_order,
+    simulate_makespan,
+    static_cost,
+)
+from validation import set_coverage, set_incremental, set_resource_limits
+
+# The agent runtime and the model backends import langchain and langgraph, which
+# takes longer than everything else at startup, so they are only imported once
+# an agent is created
+if TYPE_CHECKING:
+    from langchain_core.language_models import BaseChatModel
+
+CHECKPOINT_FILE_NAME = "checkpoints.sqlite"
+# Signature summaries of imported modules beyond this size are left out of
+# the prompt
+MAX_DEPENDENCY_SUMMARY_CHARS = 4000
+
+
+def _default_thresholds() -> RoutingThresholds:
+    return {
+        "max_lines": DEFAULT_LOCAL_MAX_LINES,
+        "max_functions": DEFAULT_LOCAL_MAX_FUNCTIONS,
+        "max_branches": DEFAULT_LOCAL_MAX_BRANCHES,
+    }
+
+
+@dataclass(frozen=True)
+class RunSettings:
+    """Settings of a pipeline run, which are the same for every source
+    directory of the run.
+
+    Args:
+        run_id (str): ID of the run, under which its progress is recorded
+        generation (GenerationSettings): Settings of the generation of every
+            module; its paths and cache are set per source directory
+        state_dir (str): Directory of the progress ledgers, checkpoints, cost
+            history and routing log
+        use_state (bool): Whether to record the progress of the run, so it
+            can be resumed
+        incremental (bool): Whether to only generate tests for modules that
+            changed since the last run, and the modules importing them
+        base_ref (Optional[str]): Git reference to detect changed modules
+            against, instead of the manifest of the last run
+        list_modules (bool): Whether to only list the selected modules
+        schedule (str): Order in which modules are started, "cost" for the
+            most expensive first or "discovery" for the order they were found
+        max_concurrency (int): Maximum number of modules generated at the same time
+        cache_dir (str): Directory of the generation and analysis caches
+        use_cache (bool): Whether to cache validated test modules
+        cache_max_entries (int): Maximum number of cached test modules
+        use_analysis_cache (bool): Whether to cache the analysis of modules
+        resource_limits (ResourceLimits): Timeouts and rlimits of validation runs
+        coverage (bool): Whether to measure the coverage of validation runs
+        incremental_validation (bool): Whether to only rerun tests affected
+            by a change of the test module
+        coverage_target (float): Line coverage in percent at which the agent
+            stops, 0 to stop once the tests pass
+        model_scripts (Optional[str]): Scripts of the fake model backend
+        local_model (Optional[str]): Backend that simple modules are tried
+            with first, None to send every module to the main backend
+        routing_thresholds (RoutingThresholds): Size limits of simple modules
+        local_max_model_turns (int): Model turns of a local attempt
+        prompt_caching (bool): Whether to mark the system prompt as cacheable
+        progress (bool): Whether to print the progress of agent runs
+        requests_per_minute (float): Model requests per minute, 0 for no limit
+        tokens_per_minute (float): Model tokens per minute, 0 for no limit
+        max_model_retries (int): Retries of a throttled model call
+    """
+
+    run_id: str
+    generation: GenerationSettings = field(default_factory=GenerationSettings)
+    state_dir: str = DEFAULT_STATE_DIR
+    use_state: bool = True
+    incremental: bool = False
+    base_ref: Optional[str] = None
+    list_modules: bool = False
+    schedule: str = "cost"
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY
+    cache_dir: str = DEFAULT_CACHE_DIR
+    use_cache: bool = True
+    cache_max_entries: int = DEFAULT_MAX_ENTRIES
+    use_analysis_cache: bool = True
+    resource_limits: ResourceLimits = field(default_factory=default_limits)
+    coverage: bool = True
+    incremental_validation: bool = True
+    coverage_target: float = 0.0
+    model_scripts: Optional[str] = None
+    local_model: Optional[str] = None
+    routing_thresholds: RoutingThresholds = field(default_factory=_default_thresholds)
+    local_max_model_turns: int = DEFAULT_LOCAL_MAX_MODEL_TURNS
+    prompt_caching: bool = False
+    progress: bool = True
+    requests_per_minute: float = 0.0
+    tokens_per_minute: float = 0.0
+    max_model_retries: int = DEFAULT_MAX_RETRIES
+
+
+class PipelineResult(TypedDict):
+    statuses: Dict[str, int]
+    errors: List[str]
+    records: Dict[str, ModuleRecord]
+
+
+class DiscoveredModules(TypedDict):
+    """The modules of a source directory.
+
+    If ``includes_skipped`` is set, ``all_modules`` includes the modules that
+    need no tests, since a change to them affects the modules importing them,
+    and ``modules`` does not.
+    """
+
+    all_modules: Dict[str, ModuleInfo]
+    modules: Dict[str, ModuleInfo]
+    import_graph: Dict[str, Set[str]]
+    includes_skipped: bool
+
+
+class LocalRoute(TypedDict):
+    graph: Any
+    model_name: str
+    max_model_turns: int
+
+
+class Agents(TypedDict):
+    graph: Any
+    local_graph: Any
+    rate_limiter: Optional[ModelRateLimiter]
+    checkpointer: Any
+
+
+def _format_token_usage(record: ModuleRecord) -> str:
+    text = f"{record['input_tokens']} input / {record['output_tokens']} output tokens"
+    if record["cache_read_tokens"] or record["cache_creation_tokens"]:
+        text += (
+            f", {record['cache_read_tokens']} read from and "
+            f"{record['cache_creation_tokens']} written to the prompt cache"
+        )
+    return text
+
+
+def _discover_modules(
+    settings: RunSettings, python_module_path: str, test_module_path: str
+) -> DiscoveredModules:
+    """Discover the modules of a source directory and their import graph.
+
+    Modules that need no tests are only included if changed modules are
+    selected, which needs their imports to find the modules they affect.
+    """
+    include_skipped = bool(settings.incremental or settings.base_ref)
+    analysis_cache = (
+        AnalysisCache(os.path.join(settings.cache_dir, DEFAULT_ANALYSIS_CACHE_FILE))
+        if settings.use_analysis_cache
+        else None
+    )
+    try:
+        all_modules = discover_python_modules(
+            python_module_path,
+            analysis_cache=analysis_cache,
+            include_skipped=include_skipped,
+            test_dir=test_module_path,
+        )
+    finally:
+        if analysis_cache is not None:
+            analysis_cache.close()
+    import_graph = build_import_graph(
+        {
+            module_name: info["imported_modules"]
+            for module_name, info in all_modules.items()
+        },
+        package_prefix(python_module_path),
+    )
+    return {
+        "all_modules": all_modules,
+        "modules": {
+            module_name: info
+            for module_name, info in all_modules.items()
+            if not info["skipped"]
+        },
+        "import_graph": import_graph,
+        "includes_skipped": include_skipped,
+    }
+
+
+def _select_changed_modules(
+    settings: RunSettings,
+    discovered: DiscoveredModules,
+    python_module_path: str,
+    test_module_path: str,
+    manifest: Dict[str, str],
+) -> Dict[str, str]:
+    """Select the changed modules, modules without a test module, and all
+    modules importing them, directly or through modules that need no tests."""
+    all_modules = discovered["all_modules"]
+    python_modules = {
+        module_name: info["source"]
+        for module_name, info in discovered["modules"].items()
+    }
+    if settings.base_ref:
+        changed = changed_modules_from_git(
+            python_module_path, all_modules, settings.base_ref
+        )
+    else:
+        changed = changed_modules_from_manifest(
+            {
+                module_name: info["content_hash"]
+                for module_name, info in all_modules.items()
+            },
+            manifest,
+        )
+    changed |= {
+        module_name
+        for module_name in python_modules
+        if not os.path.exists(_test_file_path(test_module_path, module_name))
+    }
+
+    selected = with_dependents(changed, discovered["import_graph"]) & set(
+        python_modules
+    )
+    print(
+        f"Incremental mode: {len(selected)} of {len(python_modules)} modules changed "
+        "or import changed modules."
+    )
+    return {
+        module_name: code
+        for module_name, code in python_modules.items()
+        if module_name in selected
+    }
+
+
+def _skip_finished(
+    ledger: RunLedger,
+    settings: RunSettings,
+    python_modules: Dict[str, str],
+    source_dir: str,
+) -> Dict[str, str]:
+    """Remove the modules the run already finished before it was resumed.
+
+    Returns:
+        Dict[str, str]: Status of every finished module
+    """
+    finished: Dict[str, str] = {}
+    for module_name, code in list(python_modules.items()):
+        entry = ledger.finished(source_dir, module_name, source_hash(code))
+        if entry is not None:
+            finished[module_name] = entry["status"]
+            del python_modules[module_name]
+    if finished:
+        print(
+            f"Resuming run {settings.run_id}: skipping {len(finished)} modules "
+            "it already finished."
+        )
+    return finished
+
+
+def _create_agents(
+    settings: RunSettings,
+    chat_model: Optional["BaseChatModel"],
+    local_chat_model: Optional["BaseChatModel"],
+) -> Agents:
+    """Create the agent of the main backend, with the rate limiter of its
+    model calls, and the agent of the local backend if there is one."""
+    from agent import (
+        create_agent,
+        set_coverage_target,
+        set_progress,
+        set_run_id,
+        sqlite_checkpointer,
+    )
+
+    model_name = settings.generation.model_name
+    set_progress(settings.progress)
+    set_coverage_target(settings.coverage_target)
+    if chat_model is None:
+        overrides = (
+            {"scripts_path": settings.model_scripts} if settings.model_scripts else {}
+        )
+        chat_model = get_model(model_name, **overrides)
+    checkpointer = (
+        sqlite_checkpointer(os.path.join(settings.state_dir, CHECKPOINT_FILE_NAME))
+        if settings.use_state
+        else None
+    )
+    set_run_id(settings.run_id if checkpointer is not None else None)
+    rate_limiter = ModelRateLimiter(
+        requests_per_minute=settings.requests_per_minute,
+        tokens_per_minute=settings.tokens_per_minute,
+        # Every module may generate the tests of its units concurrently
+        max_concurrency=settings.max_concurrency**2,
+        max_retries=settings.max_model_retries,
+    )
+    graph = create_agent(
+        chat_model,
+        prompt_caching=settings.prompt_caching,
+        checkpointer=checkpointer,
+        rate_limiter=rate_limiter,
+    )
+    local_graph = None
+    if settings.local_model:
+        try:
+            if local_chat_model is None:
+                overrides = (
+                    {"scripts_path": settings.model_scripts}
+                    if settings.model_scripts and settings.local_model == "fake"
+                    else {}
+                )
+                local_chat_model = get_model(settings.local_model, **overrides)
+            local_graph = create_agent(
+                local_chat_model, checkpointer=checkpointer, name=settings.local_model
+            )
+        except Exception as e:
+            print(
+                f"Warning: Could not create the local model {settings.local_model}, "
+                f"sending every module to {model_name}: {str(e)}"
+            )
+    return {
+        "graph": graph,
+        "local_graph": local_graph,
+        "rate_limiter": rate_limiter,
+        "checkpointer": checkpointer,
+    }
+
+
+def _schedule_modules(
+    settings: RunSettings,
+    python_modules: Dict[str, str],
+    source_dir: str,
+    history: Optional[CostHistory],
+) -> Tuple[List[str], float]:
+    """Order the modules by the schedule of the run.
+
+    Returns:
+        Tuple[List[str], float]: The order in which the modules are started,
+        and the estimated runtime of the run in seconds
+    """
+    costs = estimate_costs(python_modules, source_dir, history)
+    order = (
+        longest_first_order(costs)
+        if settings.schedule == "cost"
+        else list(python_modules)
+    )
+    estimated_seconds = simulate_makespan(order, costs, settings.max_concurrency)
+    if python_modules and not settings.generation.cache_only:
+        discovery_seconds = simulate_makespan(
+            list(python_modules), costs, settings.max_concurrency
+        )
+        print(
+            f"Schedule: {len(order)} modules on {settings.max_concurrency} workers, "
+            f"estimated {estimated_seconds:.0f} s ({settings.schedule} order, "
+            f"{discovery_seconds:.0f} s in discovery order)."
+        )
+    return order, estimated_seconds
+
+
+def _route_modules(
+    settings: RunSettings,
+    local_graph: Any,
+    python_modules: Dict[str, str],
+    records: Dict[str, ModuleRecord],
+) -> Tuple[Dict[str, LocalRoute], RoutingLog]:
+    """Route the simple modules to the local backend, and record the routing
+    decision of every module.
+
+    Returns:
+        Tuple[Dict[str, LocalRoute], RoutingLog]: The local route of every
+        simple module, and the log of the attempts of all modules
+    """
+    routing_log = RoutingLog(
+        (
+            os.path.join(settings.state_dir, ROUTING_LOG_FILE_NAME)
+            if settings.use_state
+            else None
+        ),
+        settings.run_id,
+    )
+    model_name = settings.generation.model_name
+    local_routes: Dict[str, LocalRoute] = {}
+    for module_name, code in python_modules.items():
+        simple, reason = is_simple_module(code, settings.routing_thresholds)
+        if simple:
+            local_routes[module_name] = {
+                "graph": local_graph,
+                "model_name": settings.local_model or model_name,
+                "max_model_turns": settings.local_max_model_turns,
+            }
+        records[module_name][
+            "route"
+        ] = f"{settings.local_model if simple else model_name}: {reason}"
+    print(
+        f"Routing: {len(local_routes)} of {len(python_modules)} modules go to "
+        f"{settings.local_model} first."
+    )
+    return local_routes, routing_log
+
+
+def _generate_attempt(
+    record: ModuleRecord,
+    graph: Any,
+    settings: GenerationSettings,
+    code: str,
+    dependency_summary: str,
+    routing_log: Optional[RoutingLog],
+) -> Tuple[str, str]:
+    """Generate the tests of a module with one model backend, and log the
+    attempt if modules are routed between backends."""
+    start = time.perf_counter()
+    model_calls = record["model_calls"]
+    # The deadline of the budget starts with the attempt, not when it is queued
+    budget = (
+        ModuleBudget(**settings.budget_limits)
+        if settings.budget_limits is not None
+        else None
+    )
+    status = "error"
+    try:
+        test_file_path, status = generate_test_module(
+            graph,
+            settings,
+            record["module"],
+            code,
+            record=record,
+            budget=budget,
+            dependency_summary=dependency_summary,
+        )
+    finally:
+        record["backend"] = settings.model_name
+        if routing_log is not None:
+            routing_log.record(
+                record["module"],
+                settings.model_name,
+                record["route"],
+                status,
+                time.perf_counter() - start,
+                record["model_calls"] - model_calls,
+            )
+    return test_file_path, status
+
+
+def _recorded_generate_test_module(
+    record: ModuleRecord,
+    graph: Any,
+    settings: GenerationSettings,
+    code: str,
+    dependency_summary: str = "",
+    local_route: Optional[LocalRoute] = None,
+    routing_log: Optional[RoutingLog] = None,
+) -> Tuple[str, str]:
+    start = time.perf_counter()
+    with module_scope(record["module"]), stage("module"):
+        try:
+            if local_route is not None:
+                local_settings = dataclasses.replace(
+                    settings,
+                    model_name=local_route["model_name"],
+                    budget_limits=dict(
+                        settings.budget_limits or {},
+                        max_model_turns=local_route["max_model_turns"],
+                    ),
+                )
+                try:
+                    test_file_path, status = _generate_attempt(
+                        record,
+                        local_route["graph"],
+                        local_settings,
+                        code,
+                        dependency_summary,
+                        routing_log,
+                    )
+                except Exception as e:
+                    print(
+                        f"Warning: {local_route['model_name']} failed on "
+                        f"{record['module']}: {str(e)}"
+                    )
+                    status = "error"
+                if status not in ("failed", "partial", "error"):
+                    record["status"] = status
+                    return test_file_path, status
+                record["escalations"] += 1
+                print(f"[{record['module']}] escalating to {settings.model_name}")
+            test_file_path, status = _generate_attempt(
+                record, graph, settings, code, dependency_summary, routing_log
+            )
+        except Exception:
+            record["status"] = "error"
+            raise
+        finally:
+            record["seconds"] = time.perf_counter() - start
+    record["status"] = status
+    return test_file_path, status
+
+
+def _dependency_summary(
+    module_name: str,
+    import_graph: Dict[str, Set[str]],
+    discovered_modules: Dict[str, ModuleInfo],
+) -> str:
+    """Summarize the modules of the project a module imports by their imports
+    and signatures, up to ``MAX_DEPENDENCY_SUMMARY_CHARS``."""
+    summaries = []
+    size = 0
+    for imported in sorted(import_graph.get(module_name, ())):
+        summary = signature_summary(discovered_modules[imported]["source"]).strip()
+        if not summary:
+            continue
+        summary = f"# Module {imported}\n{summary}"
+        if size + len(summary) > MAX_DEPENDENCY_SUMMARY_CHARS:
+            break
+        summaries.append(summary)
+        size += len(summary)
+    return "\n\n".join(summaries)
+
+
+def _generate_modules(
+    generation: GenerationSettings,
+    graph: Any,
+    order: List[str],
+    python_modules: Dict[str, str],
+    discovered: DiscoveredModules,
+    records: Dict[str, ModuleRecord],
+    local_routes: Dict[str, LocalRoute],
+    routing_log: Optional[RoutingLog],
+    max_concurrency: int,
+) -> Iterator[Tuple[str, Optional[Tuple[str, str]]]]:
+    """Generate the test modules of all modules concurrently, in the given
+    order.
+
+    Yields:
+        Tuple[str, Optional[Tuple[str, str]]]: Name of every module as soon as
+        it finishes, with the path of its test module and its status, or None
+        if it failed with an error
+    """
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        futures = {
+            executor.submit(
+                _recorded_generate_test_module,
+                records[module_name],
+                graph,
+                generation,
+                python_modules[module_name],
+                dependency_summary=_dependency_summary(
+                    module_name, discovered["import_graph"], discovered["all_modules"]
+                ),
+                local_route=local_routes.get(module_name),
+                routing_log=routing_log,
+            ): module_name
+            for module_name in order
+        }
+        for future in as_completed(futures):
+            module_name = futures[future]
+            try:
+                outcome = future.result()
+            except Exception as e:
+                print(f"Error generating tests for {module_name}: {str(e)}")
+                outcome = None
+            yield module_name, outcome
+
+
+def _record_costs(
+    history: CostHistory,
+    records: Dict[str, ModuleRecord],
+    python_modules: Dict[str, str],
+    source_dir: str,
+) -> None:
+    for module_name, record in records.items():
+        # Cached modules say nothing about the cost of generating tests
+        if record["status"] in ("kept", "repaired", "passed", "partial", "failed"):
+            history.record(
+                source_dir,
+                module_name,
+                record["seconds"],
+                static_cost(python_modules[module_name]),
+            )
+    try:
+        history.save()
+    except OSError as e:
+        print(f"Warning: Could not write the cost history: {str(e)}")
+
+
+def _save_manifest(
+    manifest_path: str, manifest: Dict[str, str], discovered: DiscoveredModules
+) -> None:
+    all_modules = discovered["all_modules"]
+    for module_name, info in all_modules.items():
+        # A skipped module is up to date once every module importing it is
+        if info["skipped"] and all(
+            manifest.get(dependent) == discovered["modules"][dependent]["content_hash"]
+            for dependent in with_dependents({module_name}, discovered["import_graph"])
+            if dependent in discovered["modules"]
+        ):
+            manifest[module_name] = info["content_hash"]
+    if not discovered["includes_skipped"]:
+        # The entries of the modules that need no tests are kept from the last
+        # run that discovered them, so their changes since then are not lost
+        save_manifest(manifest_path, manifest)
+        return
+    save_manifest(
+        manifest_path,
+        {
+            module_name: manifest[module_name]
+            for module_name in all_modules
+            if module_name in manifest
+        },
+    )
+
+
+def _print_summary(
+    settings: RunSettings,
+    result: PipelineResult,
+    modules: int,
+    elapsed: float,
+    estimated_seconds: float,
+    agents: Optional[Agents],
+    routing_log: Optional[RoutingLog],
+    cache: Optional[GenerationCache],
+) -> None:
+    statuses, errors, records = result["statuses"], result["errors"], result["records"]
+    print(
+        f"Generated tests for "
+        f"{modules - len(errors) - statuses['uncached']} of "
+        f"{modules} modules: {statuses['passed']} passed, "
+        f"{statuses['repaired']} repaired, {statuses['kept']} kept, "
+        f"{statuses['partial']} partial, "
+        f"{statuses['failed']} failed validation, {statuses['cached']} from cache."
+    )
+    if settings.generation.cache_only:
+        print(f"Skipped {statuses['uncached']} modules without cached tests.")
+    if statuses["resumed"]:
+        print(
+            f"Skipped {statuses['resumed']} modules finished before the run was "
+            "resumed."
+        )
+    if modules and not settings.generation.cache_only:
+        print(f"Runtime: {elapsed:.0f} s, estimated {estimated_seconds:.0f} s.")
+    rate_limiter = agents["rate_limiter"] if agents is not None else None
+    if rate_limiter is not None and rate_limiter.throttled_calls:
+        stats = rate_limiter.stats()
+        print(
+            f"Rate limits: {stats['throttled_calls']} throttled model calls "
+            f"retried, {stats['wait_seconds']:.1f} s waited, concurrency limit "
+            f"{stats['concurrency_limit']}."
+        )
+    if routing_log is not None and routing_log.attempts:
+        escalations = sum(record["escalations"] for record in records.values())
+        print(
+            f"Backends: {routing_log.summary()}. {escalations} modules "
+            f"escalated to {settings.generation.model_name}."
+        )
+    total = new_module_record("total")
+    for record in records.values():
+        add_module_record(total, record)
+    print(
+        f"Tokens: {_format_token_usage(total)}. Model calls: {total['model_calls']}, "
+        f"validation runs: {total['validation_runs']} "
+        f"({total['pytest_seconds']:.1f} s in pytest)."
+    )
+    if settings.generation.slim_tests:
+        print(
+            f"Slimming: {total['slow_tests']} slow and {total['redundant_tests']} "
+            f"redundant tests, {total['removed_tests']} removed, "
+            f"{total['test_seconds_saved']:.2f} s of test time saved."
+        )
+    if cache is not None:
+        print(f"Cache: {cache.hits} hits, {cache.misses} misses.")
+    if errors:
+        print(f"Failed modules: {', '.join(sorted(errors))}")
+
+
+def run_pipeline(
+    settings: RunSettings,
+    python_module_path: str,
+    test_module_path: str,
+    chat_model: Optional["BaseChatModel"] = None,
+    local_chat_model: Optional["BaseChatModel"] = None,
+) -> PipelineResult:
+    """Generate and validate the test modules of all selected modules.
+
+    Finished modules are recorded in the progress ledger of the run, and the
+    agent conversations are checkpointed, so a run restarted with the same run
+    ID skips the finished modules and continues the unfinished conversations.
+
+    With a local model, simple modules are tried with the local backend first
+    and escalate to the main backend if their tests do not pass.
+
+    Args:
+        settings (RunSettings): Settings of the run
+        python_module_path (str): Directory containing the Python modules
+        test_module_path (str): Directory where the test modules are written
+        chat_model (Optional[BaseChatModel]): Chat model of the agent, the
+            backend named in the generation settings by default
+        local_chat_model (Optional[BaseChatModel]): Chat model of the local
+            agent, the backend named by ``settings.local_model`` by default
+
+    Returns:
+        PipelineResult: Number of modules per status, the modules that failed
+        with an error, and the metrics record of every module
+    """
+    set_resource_limits(settings.resource_limits)
+    set_coverage(settings.coverage)
+    set_incremental(settings.incremental_validation)
+
+    discovered = _discover_modules(settings, python_module_path, test_module_path)
+    manifest_path = os.path.join(test_module_path, MANIFEST_FILE_NAME)
+    manifest = load_manifest(manifest_path)
+    if settings.incremental or settings.base_ref:
+        python_modules = _select_changed_modules(
+            settings, discovered, python_module_path, test_module_path, manifest
+        )
+    else:
+        python_modules = {
+            module_name: info["source"]
+            for module_name, info in discovered["modules"].items()
+        }
+    if settings.list_modules:
+        for module_name in sorted(python_modules):
+            print(f"{module_name}: {discovered['modules'][module_name]['path']}")
+        return {"statuses": {}, "errors": [], "records": {}}
+
+    source_dir = os.path.abspath(python_module_path)
+    ledger = (
+        RunLedger(ledger_path(settings.state_dir, settings.run_id))
+        if settings.use_state
+        else None
+    )
+    finished = (
+        _skip_finished(ledger, settings, python_modules, source_dir)
+        if ledger is not None
+        else {}
+    )
+    for module_name, status in finished.items():
+        if status not in ("failed", "partial"):
+            manifest[module_name] = source_hash(
+                discovered["modules"][module_name]["source"]
+            )
+
+    cache = (
+        GenerationCache(settings.cache_dir, max_entries=settings.cache_max_entries)
+        if settings.use_cache
+        else None
+    )
+    generation = dataclasses.replace(
+        settings.generation,
+        relative_source_path=get_relative_source_path(
+            python_module_path, test_module_path
+        ),
+        test_module_path=test_module_path,
+        cache=cache,
+    )
+    agents = (
+        _create_agents(settings, chat_model, local_chat_model)
+        if python_modules and not generation.cache_only
+        else None
+    )
+    records = {
+        module_name: new_module_record(module_name, python_module_path)
+        for module_name in python_modules
+    }
+    history = (
+        CostHistory(os.path.join(settings.state_dir, HISTORY_FILE_NAME))
+        if settings.use_state
+        else None
+    )
+    order, estimated_seconds = _schedule_modules(
+        settings, python_modules, source_dir, history
+    )
+    routing_log = None
+    local_routes: Dict[str, LocalRoute] = {}
+    if agents is not None and agents["local_graph"] is not None:
+        local_routes, routing_log = _route_modules(
+            settings, agents["local_graph"], python_modules, records
+        )
+
+    statuses: Dict[str, int] = {
+        "resumed": len(finished),
+        "cached": 0,
+        "uncached": 0,
+        "kept": 0,
+        "repaired": 0,
+        "passed": 0,
+        "partial": 0,
+        "failed": 0,
+    }
+    errors: List[str] = []
+    pipeline_start = time.perf_counter()
+    for module_name, outcome in _generate_modules(
+        generation,
+        agents["graph"] if agents is not None else None,
+        order,
+        python_modules,
+        discovered,
+        records,
+        local_routes,
+        routing_log,
+        settings.max_concurrency,
+    ):
+        if outcome is None:
+            errors.append(module_name)
+            continue
+        test_file_path, status = outcome
+        statuses[status] += 1
+        if status == "uncached":
+            print(f"No cached tests for {module_name}")
+            continue
+        if status not in ("failed", "partial"):
+            manifest[module_name] = source_hash(python_modules[module_name])
+        if ledger is not None:
+            ledger.record(
+                source_dir,
+                module_name,
+                source_hash(python_modules[module_name]),
+                status,
+                os.path.abspath(test_file_path),
+            )
+        print(
+            f"Wrote tests for {module_name} to {test_file_path} ({status}, "
+            f"{_format_token_usage(records[module_name])})"
+        )
+    elapsed = time.perf_counter() - pipeline_start
+
+    if history is not None:
+        _record_costs(history, records, python_modules, source_dir)
+    _save_manifest(manifest_path, manifest, discovered)
+    if ledger is not None:
+        ledger.close()
+    if agents is not None and agents["checkpointer"] is not None:
+        agents["checkpointer"].conn.close()
+    if routing_log is not None:
+        routing_log.close()
+
+    result: PipelineResult = {
+        "statuses": statuses,
+        "errors": errors,
+        "records": records,
+    }
+    _print_summary(
+        settings,
+        result,
+        len(python_modules),
+        elapsed,
+        estimated_seconds,
+        agents,
+        routing_log,
+        cache,
+    )
+    return result
@@ -1,4 +1,9 @@
-from langchain_core.messages import SystemMessage
+from typing import TYPE_CHECKING, List
+
+# The message classes are imported by the state modifiers, so prompts can be
+# built without loading langchain
+if TYPE_CHECKING:
+    from langchain_core.messages import BaseMessage
 
 _SYSTEM_PROMPT = '''
 You are an advanced Python testing specialist that both writes and validates production-quality PyTest unit tests.
@@ -12,21 +17,23 @@ Core Responsibilities:
 5. Ensure type consistency between function returns and test assertions
 
 Available Tools:
-1. run_tests_with_results - Execute tests and get detailed results as well as the PyTest unit test code and the original source code
-2. did_tests_pass - Check overall test execution status and return True/False
+1. validate_tests - Execute the tests once and get a compact result: whether all tests passed, the outcome and duration of every test, the trimmed tracebacks of the failed tests, and the line and branch coverage of the source code with the uncovered lines and branches.
+   Pass the module name given by the user as module_name, so the tests can import the module under its real name.
+   Leave source_code empty; the tool then uses the source code of that module.
 
 Validation Workflow:
 1. Analyze source code return types and type hints
 2. Generate initial test code with appropriate assertions
-3. Use run_tests_with_results to verify execution
+3. Use validate_tests to verify execution
 4. If tests fail:
    a. Compare actual vs expected return types
    b. Verify type handling matches function guarantees
    c. Fix type mismatches and assertion errors
    d. Validate edge cases
    e. Ensure input validation matches function signatures
-5. Verify with did_tests_pass
-6. Return only working, validated test code
+   f. Run validate_tests again with the fixed test code
+5. If all tests pass but lines or branches are uncovered, add tests for the uncovered code paths when they are reachable through the public interface
+6. Return only working, validated test code as soon as validate_tests reports that all tests passed
 
 Technical Requirements:
 
@@ -219,9 +226,159 @@ def _user_prompt(relative_dir_path, module_name: str, code: str) -> str:
     ```{code}```."""
 
 
+def _unit_prompt(
+    relative_dir_path: str, module_name: str, unit_code: str, summary: str
+) -> str:
+    return f"""The directory of the Python source module is {relative_dir_path},
+    the module name where the test should be written for {module_name}.
+    The module is too large to be tested at once, so write tests only for the following part of it.
+    The rest of the module is summarized by its imports and signatures below; do not write tests for it.
+    Call validate_tests with module_name {module_name} and leave source_code empty,
+    the tool then validates the tests against the complete module.
+
+    This is the summary of the rest of the module:
+    ```{summary}```
+
+    This is the code to test:
+    ```{unit_code}```."""
+
+
+def _repair_prompt(
+    relative_dir_path: str,
+    module_name: str,
+    code: str,
+    header: str,
+    failing_tests: str,
+    tracebacks: str,
+) -> str:
+    return f"""The Python source module {module_name} in the directory {relative_dir_path} was changed.
+    Its existing test module still has tests that pass, but the following tests now fail.
+    Fix only these tests. Return the complete fixed versions of the failing test functions and classes,
+    together with any imports or fixtures they additionally need. Do not return the tests that pass.
+    When you validate the fixed tests with validate_tests, put the header of the test module in front of them.
+
+    This is the header of the test module:
+    ```{header}```
+
+    These are the failing tests:
+    ```{failing_tests}```
+
+    These are the failures:
+    ```{tracebacks}```
+
+    This is the changed code of the module:
+    ```{code}```."""
+
+
+def prune_messages(messages: List["BaseMessage"]) -> List["BaseMessage"]:
+    """Keep only the messages the agent needs for its next turn.
+
+    These are the first user message, which contains the source code, the
+    latest tool call of the agent together with its tool results, i.e. the
+    latest test draft and its failure report, and any message after them.
+    Older drafts and results are dropped, so the input does not grow with
+    every validation round.
+
+    Args:
+        messages (List[BaseMessage]): Messages of the agent state
+
+    Returns:
+        List[BaseMessage]: The messages to send to the model
+    """
+    from langchain_core.messages import AIMessage
+
+    for index in range(len(messages) - 1, 0, -1):
+        message = messages[index]
+        if isinstance(message, AIMessage) and message.tool_calls:
+            return [messages[0], *messages[index:]]
+    return list(messages)
+
+
+def _cacheable(content: str) -> list:
+    return [{"type": "text", "text": content, "cache_control": {"type": "ephemeral"}}]
+
+
 def system_prompt(state: dict) -> list:
-    return [SystemMessage(content=_SYSTEM_PROMPT)] + state["messages"]
+    from langchain_core.messages import SystemMessage
+
+    return [SystemMessage(content=_SYSTEM_PROMPT)] + prune_messages(state["messages"])
+
+
+def cached_system_prompt(state: dict) -> list:
+    """Like ``system_prompt``, but marks the system prompt for Bedrock prompt
+    caching, so the static instructions are only processed once."""
+    from langchain_core.messages import SystemMessage
+
+    return [SystemMessage(content=_cacheable(_SYSTEM_PROMPT))] + prune_messages(
+        state["messages"]
+    )
+
+
+def _dependency_section(dependency_summary: str) -> str:
+    if not dependency_summary:
+        return ""
+    return f"""
+
+    The module imports these modules of the same project, summarized by their imports and signatures:
+    ```{dependency_summary}```"""
+
+
+# Instructions that make the candidates for one module differ, so parallel
+# attempts explore different tests instead of repeating the same mistakes
+_CANDIDATE_STRATEGIES = (
+    "Focus on edge cases and error handling: empty and boundary inputs, invalid arguments and the exceptions they raise.",
+    "Prefer few, parametrized tests that cover many inputs of every function.",
+    "Keep the tests minimal and test only the documented behaviour of the public functions and classes.",
+)
+
+
+def candidate_prompt(prompt: str, index: int) -> str:
+    """Vary the prompt of a module for one of several candidates generated in
+    parallel. The first candidate keeps the prompt as it is.
+
+    Args:
+        prompt (str): The user or unit prompt of the module
+        index (int): Index of the candidate, starting at 0
+
+    Returns:
+        str: The prompt of the candidate
+    """
+    if index == 0:
+        return prompt
+    strategy = _CANDIDATE_STRATEGIES[(index - 1) % len(_CANDIDATE_STRATEGIES)]
+    return f"""{prompt}
+
+    You are writing candidate {index + 1} of the tests of this module. {strategy}"""
+
+
+def user_prompt(
+    relative_dir_path: str, module_name: str, code: str, dependency_summary: str = ""
+) -> str:
+    return _user_prompt(relative_dir_path, module_name, code) + _dependency_section(
+        dependency_summary
+    )
+
+
+def unit_prompt(
+    relative_dir_path: str,
+    module_name: str,
+    unit_code: str,
+    summary: str,
+    dependency_summary: str = "",
+) -> str:
+    return _unit_prompt(
+        relative_dir_path, module_name, unit_code, summary
+    ) + _dependency_section(dependency_summary)
 
 
-def user_prompt(relative_dir_path: str, module_name: str, code: str) -> str:
-    return _user_prompt(relative_dir_path, module_name, code)
+def repair_prompt(
+    relative_dir_path: str,
+    module_name: str,
+    code: str,
+    header: str,
+    failing_tests: str,
+    tracebacks: str,
+) -> str:
+    return _repair_prompt(
+        relative_dir_path, module_name, code, header, failing_tests, tracebacks
+    )
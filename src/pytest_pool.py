@@ -0,0 +1,597 @@
+"""Pool of long-lived pytest workers.
+
+Every worker is a Python process that has pytest and its plugins imported
+once. A test run is executed in a child forked from the worker, so the run
+starts from the same clean state as a fresh ``python -m pytest`` process
+without paying for interpreter startup and the pytest imports again.
+
+The modules a worker has imported stay loaded for its lifetime, so a worker
+is replaced after a number of runs, and a worker that notices that the file
+of one of its modules changed, e.g. because a package was upgraded, exits
+and leaves the run to a new worker.
+
+Generated tests may loop forever, allocate without bound or leak processes,
+so every child runs in its own process group with rlimits for CPU time,
+address space and open files, and is killed with its whole group when the
+wall-clock timeout of the request expires. The same limits are applied to
+fresh pytest processes.
+
+The module is also the worker's entry point: ``python pytest_pool.py``
+serves run requests, one JSON document per line, on stdin and stdout, and
+``python pytest_pool.py --apply-limits LIMITS COMMAND...`` applies the
+rlimits and replaces itself with the command.
+"""
+
+import atexit
+import importlib
+import importlib.util
+import json
+import os
+import queue
+import shutil
+import signal
+import subprocess
+import sys
+import sysconfig
+import tempfile
+import threading
+import traceback
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, TypedDict
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None  # type: ignore
+
+POOL_ENV = "MINERVA_PYTEST_POOL"
+POOL_SIZE_ENV = "MINERVA_PYTEST_WORKERS"
+MAX_RUNS_ENV = "MINERVA_PYTEST_WORKER_RUNS"
+
+DEFAULT_RUN_TIMEOUT = 300.0
+DEFAULT_TEST_TIMEOUT = 30.0
+DEFAULT_CPU_SECONDS = 300
+DEFAULT_MEMORY_MB = 4096
+DEFAULT_OPEN_FILES = 1024
+DEFAULT_MAX_RUNS_PER_WORKER = 200
+APPLY_LIMITS_ARG = "--apply-limits"
+
+
+class ResourceLimits(TypedDict):
+    """Limits of a test run, where 0 means unlimited.
+
+    ``run_timeout`` is the wall-clock time of the whole pytest run and
+    ``test_timeout`` the wall-clock time of every single test.
+    """
+
+    run_timeout: float
+    test_timeout: float
+    cpu_seconds: int
+    memory_mb: int
+    open_files: int
+
+
+def default_limits() -> ResourceLimits:
+    return {
+        "run_timeout": DEFAULT_RUN_TIMEOUT,
+        "test_timeout": DEFAULT_TEST_TIMEOUT,
+        "cpu_seconds": DEFAULT_CPU_SECONDS,
+        "memory_mb": DEFAULT_MEMORY_MB,
+        "open_files": DEFAULT_OPEN_FILES,
+    }
+
+
+def _lower_limit(limit: int, value: int, hard_margin: int = 0) -> None:
+    """Lower a resource limit of the current process, never above the
+    current hard limit. The hard limit is set ``hard_margin`` above the soft
+    one, so the process gets a signal before it is killed."""
+    soft, hard = resource.getrlimit(limit)
+    if hard != resource.RLIM_INFINITY:
+        value = min(value, hard)
+    new_hard = value + hard_margin
+    if hard != resource.RLIM_INFINITY:
+        new_hard = min(new_hard, hard)
+    resource.setrlimit(limit, (value, new_hard))
+
+
+def apply_resource_limits(limits: Optional[ResourceLimits]) -> None:
+    """Apply the rlimits to the current process.
+
+    This runs Python code, which is not async-signal-safe, so it must not be
+    called between fork and exec of a multi-threaded process, e.g. as
+    ``preexec_fn``. Use ``limited_command`` to start a process with limits.
+
+    Args:
+        limits (Optional[ResourceLimits]): The limits, None for no limits
+    """
+    if not limits or resource is None:
+        return
+    if limits["cpu_seconds"]:
+        # SIGXCPU at the soft limit, SIGKILL a second later
+        _lower_limit(resource.RLIMIT_CPU, int(limits["cpu_seconds"]), hard_margin=1)
+    if limits["memory_mb"] and hasattr(resource, "RLIMIT_AS"):
+        _lower_limit(resource.RLIMIT_AS, int(limits["memory_mb"]) * 1024 * 1024)
+    if limits["open_files"]:
+        _lower_limit(resource.RLIMIT_NOFILE, int(limits["open_files"]))
+
+
+def limited_command(command: List[str], limits: Optional[ResourceLimits]) -> List[str]:
+    """Wrap a command so it runs with the rlimits.
+
+    The wrapper is a fresh Python process, which applies the limits to
+    itself and then replaces itself with the command.
+
+    Args:
+        command (List[str]): The command, starting with the executable
+        limits (Optional[ResourceLimits]): The limits, None for no limits
+
+    Returns:
+        List[str]: The wrapped command, or the command if there are no limits
+    """
+    if not limits or resource is None:
+        return command
+    return [
+        sys.executable,
+        # Isolated, so modules on the PYTHONPATH of the command cannot shadow
+        # the standard library in the wrapper, and without site for a faster
+        # start
+        "-I",
+        "-S",
+        str(Path(__file__).resolve()),
+        APPLY_LIMITS_ARG,
+        json.dumps(limits),
+        *command,
+    ]
+
+
+def _exec_with_limits(limits: str, command: List[str]) -> None:
+    apply_resource_limits(json.loads(limits))
+    os.execvp(command[0], command)
+
+
+def kill_process_group(pgid: int) -> None:
+    """Kill every process left in a process group, ignoring a group that is
+    already gone."""
+    try:
+        os.killpg(pgid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def describe_signal(returncode: int) -> Optional[str]:
+    """Explain a negative return code of a process killed by a signal, or
+    return None for a normal exit."""
+    if returncode >= 0:
+        return None
+    signum = -returncode
+    if signum == getattr(signal, "SIGXCPU", None):
+        return "pytest exceeded its CPU time limit and was killed"
+    try:
+        name = signal.Signals(signum).name
+    except ValueError:
+        name = str(signum)
+    return f"pytest was killed by signal {name}"
+
+
+class PytestPoolError(RuntimeError):
+    """Raised when a worker could not execute a run request."""
+
+
+def _is_installed_module(module_name: str) -> bool:
+    """Check if a top-level module is part of the standard library or an
+    installed package, which makes it safe to import before a fork."""
+    try:
+        spec = importlib.util.find_spec(module_name)
+    except (ImportError, ValueError):
+        return False
+    if spec is None:
+        return False
+    if spec.origin in ("built-in", "frozen"):
+        return True
+
+    locations = spec.submodule_search_locations or [spec.origin or ""]
+    install_dirs = {
+        sysconfig.get_path(name)
+        for name in ("stdlib", "platstdlib", "purelib", "platlib")
+    }
+    return all(
+        any(
+            os.path.abspath(location).startswith(install_dir + os.sep)
+            for install_dir in install_dirs
+            if install_dir
+        )
+        for location in locations
+    )
+
+
+def _preload(module_names: Iterable[str]) -> None:
+    """Import dependencies of the module under test in the worker, so the
+    forked children find them in ``sys.modules``."""
+    for module_name in module_names:
+        if module_name in sys.modules or not _is_installed_module(module_name):
+            continue
+        try:
+            importlib.import_module(module_name)
+        except Exception:
+            pass
+
+
+def _module_files() -> Dict[str, Tuple[int, int]]:
+    """Get the modification time and size of the file of every imported
+    module."""
+    files: Dict[str, Tuple[int, int]] = {}
+    for module in list(sys.modules.values()):
+        path = getattr(module, "__file__", None)
+        if not path or path in files:
+            continue
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        files[path] = (stat.st_mtime_ns, stat.st_size)
+    return files
+
+
+def _modules_changed(files: Dict[str, Tuple[int, int]]) -> bool:
+    """Check if the file of an imported module changed or disappeared since
+    it was imported, so forked children would run outdated code."""
+    for path, signature in files.items():
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return True
+        if (stat.st_mtime_ns, stat.st_size) != signature:
+            return True
+    return False
+
+
+def _warm_up(output_dir: str) -> None:
+    """Run one empty pytest session in the worker.
+
+    The session imports the installed plugins through pytest's assertion
+    rewriting hook, so forked children find them in ``sys.modules`` exactly
+    as pytest would have imported them.
+    """
+    import pytest
+
+    empty_dir = os.path.join(output_dir, "warm-up")
+    os.mkdir(empty_dir)
+    cwd = os.getcwd()
+    try:
+        os.chdir(empty_dir)
+        pytest.main(["-q", "-p", "no:cacheprovider", "--collect-only", empty_dir])
+    except BaseException:
+        pass
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(empty_dir, ignore_errors=True)
+
+
+def _run_in_child(request: Dict, base_path: List[str], output_dir: str) -> Dict:
+    """Fork a child from the worker, run pytest in it and collect its
+    output. The child and any process it starts are killed when the run
+    times out, and stragglers are killed when it ends."""
+    stdout_path = os.path.join(output_dir, "stdout")
+    stderr_path = os.path.join(output_dir, "stderr")
+
+    limits = request.get("limits")
+    pid = os.fork()
+    if pid == 0:
+        exit_code = 4
+        try:
+            os.setpgid(0, 0)
+            apply_resource_limits(limits)
+            stdout_fd = os.open(stdout_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+            stderr_fd = os.open(stderr_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+            os.dup2(stdout_fd, 1)
+            os.dup2(stderr_fd, 2)
+            os.dup2(os.open(os.devnull, os.O_RDONLY), 0)
+
+            os.chdir(request["cwd"])
+            os.environ.clear()
+            os.environ.update(request["env"])
+            # Rebuild sys.path the way ``python -m pytest`` would
+            python_path = [
+                p for p in request["env"].get("PYTHONPATH", "").split(os.pathsep) if p
+            ]
+            sys.path[:] = [request["cwd"], *python_path, *base_path]
+            sys.argv = ["pytest", *request["args"]]
+
+            import pytest
+
+            exit_code = int(pytest.main(request["args"]))
+        except SystemExit as e:
+            exit_code = e.code if isinstance(e.code, int) else 1
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            try:
+                sys.stdout.flush()
+                sys.stderr.flush()
+            finally:
+                os._exit(exit_code)
+
+    try:
+        # Set the group in the parent as well, so a timeout cannot miss it
+        os.setpgid(pid, pid)
+    except OSError:
+        pass
+    timed_out = threading.Event()
+
+    def on_timeout() -> None:
+        timed_out.set()
+        kill_process_group(pid)
+
+    timer = None
+    if limits and limits["run_timeout"]:
+        timer = threading.Timer(limits["run_timeout"], on_timeout)
+        timer.start()
+    try:
+        _, status = os.waitpid(pid, 0)
+    finally:
+        if timer is not None:
+            timer.cancel()
+            # The timer thread must be gone before the next run forks, and
+            # must not kill the group of a later child with the same ID
+            timer.join()
+        kill_process_group(pid)
+    if os.WIFEXITED(status):
+        returncode = os.WEXITSTATUS(status)
+    else:
+        returncode = -os.WTERMSIG(status)
+
+    def read(path: str) -> str:
+        try:
+            with open(path, encoding="utf-8", errors="replace") as f:
+                return f.read()
+        except FileNotFoundError:
+            return ""
+
+    return {
+        "returncode": returncode,
+        "stdout": read(stdout_path),
+        "stderr": read(stderr_path),
+        "timed_out": timed_out.is_set(),
+    }
+
+
+def _serve() -> None:
+    """Serve run requests until stdin is closed."""
+    # Keep the protocol channel apart from anything printed by imports
+    protocol = os.fdopen(os.dup(1), "w", encoding="utf-8")
+    os.dup2(os.open(os.devnull, os.O_WRONLY), 1)
+
+    # sys.path as a fresh ``python -m pytest`` would see it, without this
+    # script's directory
+    base_path = sys.path[1:]
+    sys.path[:] = base_path
+
+    output_dir = tempfile.mkdtemp(prefix="minerva-pytest-worker-")
+    try:
+        _warm_up(output_dir)
+        loaded = _module_files()
+        for line in sys.stdin:
+            if not line.strip():
+                continue
+            if _modules_changed(loaded):
+                protocol.write(json.dumps({"stale": True}) + "\n")
+                protocol.flush()
+                break
+            try:
+                request = json.loads(line)
+                module_count = len(sys.modules)
+                _preload(request.get("preload", []))
+                if len(sys.modules) != module_count:
+                    loaded = {**_module_files(), **loaded}
+                response = _run_in_child(request, base_path, output_dir)
+            except Exception as e:
+                response = {"error": f"{type(e).__name__}: {str(e)}"}
+            protocol.write(json.dumps(response) + "\n")
+            protocol.flush()
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+
+class _Worker:
+    """Handle to a single worker process."""
+
+    def __init__(self) -> None:
+        self.process = subprocess.Popen(
+            [sys.executable, str(Path(__file__).resolve())],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            encoding="utf-8",
+        )
+        self.runs = 0
+        self.retired = False
+
+    def is_alive(self) -> bool:
+        return self.process.poll() is None
+
+    def request(self, payload: Dict) -> Dict:
+        assert self.process.stdin is not None and self.process.stdout is not None
+        try:
+            self.process.stdin.write(json.dumps(payload) + "\n")
+            self.process.stdin.flush()
+            line = self.process.stdout.readline()
+        except (OSError, ValueError) as e:
+            raise PytestPoolError(f"Lost connection to pytest worker: {str(e)}")
+        if not line:
+            raise PytestPoolError("Pytest worker exited unexpectedly")
+
+        response = json.loads(line)
+        if "error" in response:
+            raise PytestPoolError(response["error"])
+        return response
+
+    def close(self) -> None:
+        try:
+            if self.process.stdin:
+                self.process.stdin.close()
+            self.process.wait(timeout=5)
+        except Exception:
+            self.process.kill()
+
+
+class PytestWorkerPool:
+    """A bounded pool of warm pytest workers that is safe to use from many
+    threads.
+
+    Args:
+        size (int): Maximum number of worker processes
+        max_runs (int): Number of runs after which a worker is replaced
+    """
+
+    def __init__(self, size: int, max_runs: int = DEFAULT_MAX_RUNS_PER_WORKER) -> None:
+        if size < 1:
+            raise ValueError("The pool size must be at least 1")
+        if max_runs < 1:
+            raise ValueError("The number of runs per worker must be at least 1")
+        self._size = size
+        self._max_runs = max_runs
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._workers: List[_Worker] = []
+        self._closed = False
+
+    def _acquire(self) -> _Worker:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._closed:
+                raise PytestPoolError("The pytest worker pool is closed")
+            if len(self._workers) < self._size:
+                worker = _Worker()
+                self._workers.append(worker)
+                return worker
+        return self._idle.get()
+
+    def _release(self, worker: _Worker) -> None:
+        if (
+            worker.is_alive()
+            and not self._closed
+            and not worker.retired
+            and worker.runs < self._max_runs
+        ):
+            self._idle.put(worker)
+            return
+        worker.close()
+        with self._lock:
+            if worker in self._workers:
+                self._workers.remove(worker)
+            if self._closed:
+                return
+            # Other threads may be waiting for an idle worker
+            replacement = _Worker()
+            self._workers.append(replacement)
+        self._idle.put(replacement)
+
+    def run(
+        self,
+        args: List[str],
+        cwd: str,
+        env: Dict[str, str],
+        preload: Iterable[str] = (),
+        limits: Optional[ResourceLimits] = None,
+    ) -> subprocess.CompletedProcess:
+        """Run pytest in a child forked from one of the workers.
+
+        Args:
+            args (List[str]): Command line arguments for pytest
+            cwd (str): Working directory of the run
+            env (Dict[str, str]): Environment variables of the run
+            preload (Iterable[str]): Installed modules the worker imports
+                before forking
+            limits (Optional[ResourceLimits]): Timeout and rlimits of the run
+
+        Returns:
+            subprocess.CompletedProcess: The result of the run, as
+            ``subprocess.run`` would return it
+
+        Raises:
+            PytestPoolError: If the worker failed to execute the run
+            subprocess.TimeoutExpired: If the run timed out, with the output
+                written until then
+        """
+        payload = {
+            "args": args,
+            "cwd": cwd,
+            "env": env,
+            "preload": sorted(preload),
+            "limits": limits,
+        }
+        # A worker with outdated modules exits without running the request,
+        # which is then sent to a new worker once
+        for _ in range(2):
+            worker = self._acquire()
+            try:
+                response = worker.request(payload)
+                worker.runs += 1
+                worker.retired = bool(response.get("stale"))
+            except PytestPoolError:
+                worker.process.kill()
+                raise
+            finally:
+                self._release(worker)
+            if not worker.retired:
+                break
+        else:
+            raise PytestPoolError("The modules of the pytest workers keep changing")
+
+        if response.get("timed_out"):
+            raise subprocess.TimeoutExpired(
+                [sys.executable, "-m", "pytest", *args],
+                limits["run_timeout"] if limits else 0,
+                output=response["stdout"],
+                stderr=response["stderr"],
+            )
+        return subprocess.CompletedProcess(
+            [sys.executable, "-m", "pytest", *args],
+            response["returncode"],
+            response["stdout"],
+            response["stderr"],
+        )
+
+    def close(self) -> None:
+        """Stop all workers of the pool."""
+        with self._lock:
+            self._closed = True
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.close()
+
+
+_pool: Optional[PytestWorkerPool] = None
+_pool_lock = threading.Lock()
+
+
+def pool_enabled() -> bool:
+    """Check if test runs should use the worker pool.
+
+    The pool needs ``os.fork`` and can be switched off by setting
+    ``MINERVA_PYTEST_POOL=0``.
+    """
+    return hasattr(os, "fork") and os.environ.get(POOL_ENV, "1") != "0"
+
+
+def get_pytest_pool() -> PytestWorkerPool:
+    """Get the process-wide worker pool, creating it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            size = int(os.environ.get(POOL_SIZE_ENV, os.cpu_count() or 1))
+            max_runs = int(os.environ.get(MAX_RUNS_ENV, DEFAULT_MAX_RUNS_PER_WORKER))
+            _pool = PytestWorkerPool(size, max_runs)
+            atexit.register(_pool.close)
+        return _pool
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == [APPLY_LIMITS_ARG]:
+        _exec_with_limits(sys.argv[2], sys.argv[3:])
+    else:
+        _serve()
@@ -0,0 +1,285 @@
+"""Client-side rate limiting of model calls.
+
+Model calls are limited by token buckets for requests and tokens per minute,
+and by an adaptive concurrency limit that is halved when the backend throttles
+a call and grows back by about one call per window of successful calls
+(additive increase, multiplicative decrease). Throttled calls are retried
+with jittered exponential backoff, so the agent continues its conversation
+instead of failing the module.
+
+This module does not depend on langchain; the chat model wrapper that uses
+it is ``agent.RateLimitedChatModel``.
+"""
+
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+DEFAULT_MAX_RETRIES = 6
+DEFAULT_BASE_DELAY = 1.0
+DEFAULT_MAX_DELAY = 60.0
+# Seconds after a decrease in which further throttled calls, which were
+# usually sent before the decrease, do not decrease the limit again
+DECREASE_COOLDOWN = 1.0
+
+# Error codes of throttled AWS calls, and phrases of throttling errors of
+# clients that only keep the message
+_THROTTLING_CODES = {
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "ServiceUnavailableException",
+    "ModelNotReadyException",
+}
+_THROTTLING_PHRASES = (
+    "throttl",
+    "too many requests",
+    "rate exceeded",
+    "rate limit",
+)
+
+T = TypeVar("T")
+
+
+class ThrottlingError(RuntimeError):
+    """Raised by a backend that rejects a call because of its rate limits."""
+
+
+def is_throttling_error(error: BaseException) -> bool:
+    """Check if an error means the backend throttled the call, e.g. a
+    botocore ``ClientError`` with a throttling code, or an error wrapping one.
+
+    Args:
+        error (BaseException): The error raised by the model call
+
+    Returns:
+        bool: Whether the call can be retried after a backoff
+    """
+    if isinstance(error, ThrottlingError):
+        return True
+    response = getattr(error, "response", None)
+    if isinstance(response, dict):
+        code = response.get("Error", {}).get("Code", "")
+        if code in _THROTTLING_CODES:
+            return True
+    message = str(error).lower()
+    return any(phrase in message for phrase in _THROTTLING_PHRASES)
+
+
+def backoff_delay(
+    attempt: int,
+    base_delay: float = DEFAULT_BASE_DELAY,
+    max_delay: float = DEFAULT_MAX_DELAY,
+) -> float:
+    """Get a random delay before the next attempt, up to an exponentially
+    growing bound ("full jitter"), so throttled callers do not retry in
+    lockstep.
+
+    Args:
+        attempt (int): Number of the failed attempt, starting at 0
+        base_delay (float): Bound of the delay after the first attempt
+        max_delay (float): Largest bound
+
+    Returns:
+        float: Seconds to wait
+    """
+    return random.uniform(0, min(max_delay, base_delay * 2**attempt))
+
+
+class TokenBucket:
+    """Thread-safe token bucket, where a rate of 0 means unlimited.
+
+    Args:
+        rate (float): Tokens added per second
+        capacity (Optional[float]): Maximum number of tokens, the tokens of one
+            second but at least one by default
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def acquire(self, amount: float = 1.0) -> float:
+        """Take tokens from the bucket, waiting until there are enough.
+
+        Args:
+            amount (float): Number of tokens, at most the capacity is waited for
+
+        Returns:
+            float: Seconds waited
+        """
+        if not self.rate:
+            return 0.0
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return waited
+                wait = (amount - self._tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+    def adjust(self, amount: float) -> None:
+        """Take tokens without waiting, e.g. the difference between the
+        actual and the estimated tokens of a call. The bucket may go into
+        debt, which delays the next callers."""
+        if not self.rate:
+            return
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens - amount)
+
+
+class AdaptiveConcurrencyLimiter:
+    """Limit of concurrent calls that adapts to throttling (AIMD).
+
+    Args:
+        initial (int): Initial limit
+        minimum (int): Lowest limit
+        maximum (int): Highest limit
+        decrease (float): Factor of the limit after a throttled call
+    """
+
+    def __init__(
+        self, initial: int, minimum: int = 1, maximum: int = 0, decrease: float = 0.5
+    ):
+        self.minimum = max(minimum, 1)
+        self.maximum = max(maximum or initial, self.minimum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.decrease = decrease
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self) -> float:
+        """Wait until a call may start.
+
+        Returns:
+            float: Seconds waited
+        """
+        start = time.perf_counter()
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+        return time.perf_counter() - start
+
+    def release(self, throttled: bool = False) -> None:
+        """End a call, and adapt the limit to its result."""
+        with self._condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if throttled:
+                if now - self._last_decrease >= DECREASE_COOLDOWN:
+                    self.limit = max(self.minimum, self.limit * self.decrease)
+                    self._last_decrease = now
+            else:
+                # About one more call per window of successful calls
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+
+class ModelRateLimiter:
+    """Rate limits, adaptive concurrency and retries of the calls to one
+    model backend. Limits of 0 mean unlimited.
+
+    Args:
+        requests_per_minute (float): Maximum number of calls per minute
+        tokens_per_minute (float): Maximum number of input and output tokens
+            per minute
+        max_concurrency (int): Highest number of concurrent calls
+        max_retries (int): Number of retries of a throttled call
+        base_delay (float): Bound of the backoff after the first throttled call
+        max_delay (float): Largest bound of the backoff
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = 0,
+        tokens_per_minute: float = 0,
+        max_concurrency: int = 4,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        base_delay: float = DEFAULT_BASE_DELAY,
+        max_delay: float = DEFAULT_MAX_DELAY,
+    ):
+        self.requests = TokenBucket(requests_per_minute / 60)
+        # A whole minute of tokens may be used at once, so large prompts fit
+        self.tokens = TokenBucket(tokens_per_minute / 60, tokens_per_minute)
+        self.concurrency = AdaptiveConcurrencyLimiter(max_concurrency)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.throttled_calls = 0
+        self.wait_seconds = 0.0
+        self._stats_lock = threading.Lock()
+
+    def _add_stats(self, throttled: int = 0, waited: float = 0.0) -> None:
+        with self._stats_lock:
+            self.throttled_calls += throttled
+            self.wait_seconds += waited
+
+    def call(
+        self,
+        function: Callable[[], T],
+        estimated_tokens: int = 0,
+        used_tokens: Optional[Callable[[T], int]] = None,
+    ) -> T:
+        """Call a model within the limits, retrying it while it is throttled.
+
+        Args:
+            function (Callable[[], T]): The model call
+            estimated_tokens (int): Tokens the call is expected to use
+            used_tokens (Optional[Callable[[T], int]]): Get the tokens the call
+                actually used from its result, to correct the estimate
+
+        Returns:
+            T: The result of the call
+
+        Raises:
+            Exception: The error of the call, if it is not throttling or it was
+                throttled more than ``max_retries`` times
+        """
+        attempt = 0
+        while True:
+            waited = self.requests.acquire()
+            waited += self.tokens.acquire(estimated_tokens)
+            waited += self.concurrency.acquire()
+            self._add_stats(waited=waited)
+            try:
+                result = function()
+            except Exception as e:
+                throttled = is_throttling_error(e)
+                self.concurrency.release(throttled=throttled)
+                if not throttled or attempt >= self.max_retries:
+                    raise
+                self._add_stats(throttled=1)
+                delay = backoff_delay(attempt, self.base_delay, self.max_delay)
+                self._add_stats(waited=delay)
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self.concurrency.release()
+            if used_tokens is not None:
+                self.tokens.adjust(used_tokens(result) - estimated_tokens)
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "throttled_calls": self.throttled_calls,
+                "wait_seconds": round(self.wait_seconds, 3),
+                "concurrency_limit": int(self.concurrency.limit),
+            }
@@ -0,0 +1,271 @@
+import ast
+from typing import Any, Dict, Optional, Set
+
+from chunker import _DEFINITION_TYPES, _definitions, _first_line, _segment
+from helper import clean_python_code
+from metrics import ModuleRecord
+from prompts import repair_prompt
+from validation import ValidationResult
+
+
+def failing_definitions(validation: ValidationResult) -> Optional[Set[str]]:
+    """Get the top-level test functions and classes containing failed tests.
+
+    Args:
+        validation (ValidationResult): Result of validating the test module
+
+    Returns:
+        Optional[Set[str]]: Names of the top-level definitions, or None if the
+        test module failed as a whole, e.g. because it could not be imported
+    """
+    names = set()
+    for failure in validation["failures"]:
+        parts = failure["id"].split("::")
+        if len(parts) < 2:
+            return None
+        names.add(parts[1].split("[")[0])
+    return names
+
+
+def split_test_module(test_code: str, names: Set[str]) -> Dict[str, str]:
+    """Split a test module into its header and the given top-level
+    definitions.
+
+    Args:
+        test_code (str): The test module
+        names (Set[str]): Names of the top-level definitions to extract
+
+    Returns:
+        Dict[str, str]: The imports and module-level statements under the key
+        "header", and the source of every requested definition under its name
+    """
+    tree = ast.parse(test_code)
+    lines = test_code.splitlines(keepends=True)
+    definitions = _definitions(tree)
+
+    parts = {
+        "header": "".join(
+            _segment(lines, node)
+            for node in tree.body
+            if not isinstance(node, _DEFINITION_TYPES)
+        )
+    }
+    for name in names:
+        if name in definitions:
+            parts[name] = _segment(lines, definitions[name])
+    return parts
+
+
+def splice_test_module(test_code: str, fixed_code: str) -> str:
+    """Replace top-level definitions of a test module by their fixed versions.
+
+    Definitions of the fixed code that do not exist in the test module, e.g.
+    new fixtures, are appended, and imports that are missing are added after
+    the existing imports.
+
+    Args:
+        test_code (str): The test module
+        fixed_code (str): Fixed top-level definitions and the imports they need
+
+    Returns:
+        str: The test module with the fixed definitions
+    """
+    tree = ast.parse(test_code)
+    fixed_tree = ast.parse(fixed_code)
+    lines = test_code.splitlines(keepends=True)
+    fixed_lines = fixed_code.splitlines(keepends=True)
+    if lines and not lines[-1].endswith("\n"):
+        lines[-1] += "\n"
+    if fixed_lines and not fixed_lines[-1].endswith("\n"):
+        fixed_lines[-1] += "\n"
+
+    existing_imports = {
+        ast.unparse(node)
+        for node in tree.body
+        if isinstance(node, (ast.Import, ast.ImportFrom))
+    }
+    new_imports = [
+        _segment(fixed_lines, node)
+        for node in fixed_tree.body
+        if isinstance(node, (ast.Import, ast.ImportFrom))
+        and ast.unparse(node) not in existing_imports
+    ]
+    fixed_definitions = _definitions(fixed_tree)
+    definitions = _definitions(tree)
+
+    # Replace from the bottom up, so earlier line numbers stay valid
+    for name, node in sorted(
+        definitions.items(), key=lambda item: item[1].lineno, reverse=True
+    ):
+        if name in fixed_definitions:
+            lines[_first_line(node) - 1 : node.end_lineno] = [
+                _segment(fixed_lines, fixed_definitions[name])
+            ]
+
+    appended = [
+        "\n\n" + _segment(fixed_lines, node)
+        for name, node in fixed_definitions.items()
+        if name not in definitions
+    ]
+
+    if new_imports:
+        last_import = max(
+            (
+                node.end_lineno or node.lineno
+                for node in tree.body
+                if isinstance(node, (ast.Import, ast.ImportFrom))
+            ),
+            default=0,
+        )
+        lines[last_import:last_import] = new_imports
+
+    return "".join(lines + appended)
+
+
+def repair_test_module(
+    graph: Any,
+    test_code: str,
+    validation: ValidationResult,
+    relative_source_path: str,
+    module_name: str,
+    code: str,
+    record: Optional[ModuleRecord] = None,
+) -> Optional[str]:
+    """Let the agent fix only the failing tests of an existing test module.
+
+    Args:
+        graph (Any): The compiled ReAct agent graph
+        test_code (str): The existing test module
+        validation (ValidationResult): Result of validating the existing test module
+        relative_source_path (str): Path from the test directory to the source directory
+        module_name (str): Name of the module the tests are written for
+        code (str): The changed source code of the module
+        record (Optional[ModuleRecord]): Record of the module, to which the
+            agent run is added
+
+    Returns:
+        Optional[str]: The test module with the fixed tests, or None if the test
+        module cannot be repaired test by test
+    """
+    names = failing_definitions(validation)
+    if not names:
+        return None
+    try:
+        parts = split_test_module(test_code, names)
+    except SyntaxError:
+        return None
+
+    failing_tests = "\n\n".join(parts[name] for name in sorted(names) if name in parts)
+    tracebacks = "\n\n".join(
+        f"{failure['id']}:\n{failure['traceback']}"
+        for failure in validation["failures"]
+    )
+    prompt = repair_prompt(
+        relative_source_path,
+        module_name,
+        code,
+        parts["header"],
+        failing_tests,
+        tracebacks,
+    )
+    from agent import is_finished, run_agent
+
+    messages = run_agent(graph, prompt, record)
+    if record is not None:
+        record["repair_iterations"] += 1
+    if not is_finished(messages):
+        # Stopped by the budget of the module
+        return None
+    fixed_code = clean_python_code(messages[-1].content)
+    try:
+        return splice_test_module(test_code, fixed_code)
+    except SyntaxError:
+        return None
+
+
+def remove_definitions(test_code: str, names: Set[str]) -> Optional[str]:
+    """Remove top-level functions and classes from a test module.
+
+    Args:
+        test_code (str): The test module
+        names (Set[str]): Names of the definitions to remove
+
+    Returns:
+        Optional[str]: The test module without the definitions, or None if it
+        cannot be parsed
+    """
+    try:
+        tree = ast.parse(test_code)
+    except SyntaxError:
+        return None
+    lines = test_code.splitlines(keepends=True)
+    if lines and not lines[-1].endswith("\n"):
+        lines[-1] += "\n"
+    # Edit from the bottom up, so earlier line numbers stay valid
+    for name, node in sorted(
+        _definitions(tree).items(), key=lambda item: item[1].lineno, reverse=True
+    ):
+        if name in names:
+            del lines[_first_line(node) - 1 : node.end_lineno]
+    return "".join(lines)
+
+
+def mark_failing_tests(
+    test_code: str, validation: ValidationResult, remove: bool = False
+) -> Optional[str]:
+    """Mark the top-level test functions and classes containing failed tests
+    as expected to fail, or remove them, so the rest of a test module can be
+    kept.
+
+    Args:
+        test_code (str): The test module
+        validation (ValidationResult): Result of validating the test module
+        remove (bool): Whether to remove the failing tests instead of marking
+            them with ``pytest.mark.xfail``
+
+    Returns:
+        Optional[str]: The test module without failing tests, or None if the
+        test module failed as a whole, e.g. because it could not be imported
+    """
+    names = failing_definitions(validation)
+    if names is None:
+        return None
+    if remove:
+        return remove_definitions(test_code, names)
+    try:
+        tree = ast.parse(test_code)
+    except SyntaxError:
+        return None
+    lines = test_code.splitlines(keepends=True)
+    if lines and not lines[-1].endswith("\n"):
+        lines[-1] += "\n"
+    definitions = _definitions(tree)
+
+    # Edit from the bottom up, so earlier line numbers stay valid
+    for name, node in sorted(
+        definitions.items(), key=lambda item: item[1].lineno, reverse=True
+    ):
+        if name not in names:
+            continue
+        lines.insert(
+            _first_line(node) - 1,
+            '@pytest.mark.xfail(reason="Failed when the agent ran out of budget", '
+            "strict=False)\n",
+        )
+
+    if not any(
+        isinstance(node, ast.Import)
+        and any(alias.name == "pytest" and alias.asname is None for alias in node.names)
+        for node in tree.body
+    ):
+        # After any __future__ imports, which have to come first
+        position = max(
+            (
+                node.end_lineno or node.lineno
+                for node in tree.body
+                if isinstance(node, ast.ImportFrom) and node.module == "__future__"
+            ),
+            default=0,
+        )
+        lines.insert(position, "import pytest\n")
+    return "".join(lines)
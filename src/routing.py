@@ -0,0 +1,157 @@
+"""Routing of modules between a local and a remote model backend.
+
+Simple modules, judged by the size metrics of ``CodeAnalyzer``, are sent to
+the local backend first with a smaller turn budget, and escalate to the
+remote backend only if the local attempt does not produce passing tests.
+Every attempt is recorded with its backend, the reason of the routing
+decision, its status and latency, so the thresholds can be tuned from the
+success rate of the local backend.
+"""
+
+import ast
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional, TextIO, Tuple, TypedDict
+
+from code_analyzer import CodeAnalyzer
+
+ROUTING_LOG_FILE_NAME = "routing.jsonl"
+DEFAULT_LOCAL_MAX_LINES = 150
+DEFAULT_LOCAL_MAX_FUNCTIONS = 8
+DEFAULT_LOCAL_MAX_BRANCHES = 20
+DEFAULT_LOCAL_MAX_MODEL_TURNS = 6
+
+# Statuses of a module whose tests pass without marked or failing tests
+SUCCESS_STATUSES = ("cached", "kept", "repaired", "passed")
+
+
+class RoutingThresholds(TypedDict):
+    max_lines: int
+    max_functions: int
+    max_branches: int
+
+
+class RoutingAttempt(TypedDict):
+    run_id: str
+    module: str
+    backend: str
+    reason: str
+    status: str
+    seconds: float
+    model_calls: int
+    time: float
+
+
+class BackendStats(TypedDict):
+    attempts: int
+    passed: int
+    seconds: float
+
+
+def is_simple_module(code: str, thresholds: RoutingThresholds) -> Tuple[bool, str]:
+    """Decide if a module is simple enough for the local backend.
+
+    Args:
+        code (str): Source code of the module
+        thresholds (RoutingThresholds): Maximum size of a simple module
+
+    Returns:
+        Tuple[bool, str]: Whether the module is simple, and the metrics or the
+        exceeded threshold that decided it
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return False, "syntax error"
+    analyzer = CodeAnalyzer()
+    analyzer.visit(tree)
+    metrics = [
+        ("lines", len(code.splitlines()), thresholds["max_lines"]),
+        ("functions", analyzer.function_count, thresholds["max_functions"]),
+        ("branches", analyzer.branch_count, thresholds["max_branches"]),
+    ]
+    for name, value, limit in metrics:
+        if value > limit:
+            return False, f"{value} {name} > {limit}"
+    return True, ", ".join(f"{value} {name}" for name, value, _ in metrics)
+
+
+class RoutingLog:
+    """Attempts of the backends at generating tests, kept for the summary of
+    the run and appended to a JSON lines file if a path is given.
+
+    Args:
+        path (Optional[str]): Path to the JSON lines file, shared by all runs
+        run_id (str): Run the attempts belong to
+    """
+
+    def __init__(self, path: Optional[str] = None, run_id: str = ""):
+        self.path = path
+        self.run_id = run_id
+        self.attempts: List[RoutingAttempt] = []
+        self._lock = threading.Lock()
+        self._file: Optional[TextIO] = None
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = open(path, "a", encoding="utf-8")
+
+    def record(
+        self,
+        module_name: str,
+        backend: str,
+        reason: str,
+        status: str,
+        seconds: float,
+        model_calls: int,
+    ) -> None:
+        """Add an attempt and append it to the file."""
+        attempt: RoutingAttempt = {
+            "run_id": self.run_id,
+            "module": module_name,
+            "backend": backend,
+            "reason": reason,
+            "status": status,
+            "seconds": round(seconds, 3),
+            "model_calls": model_calls,
+            "time": time.time(),
+        }
+        with self._lock:
+            self.attempts.append(attempt)
+            if self._file is not None:
+                self._file.write(json.dumps(attempt, sort_keys=True) + "\n")
+                self._file.flush()
+
+    def stats(self) -> Dict[str, BackendStats]:
+        """Get the number of attempts, the number of attempts with passing
+        tests and the total seconds of every backend."""
+        stats: Dict[str, BackendStats] = {}
+        with self._lock:
+            for attempt in self.attempts:
+                backend = stats.setdefault(
+                    attempt["backend"], {"attempts": 0, "passed": 0, "seconds": 0.0}
+                )
+                backend["attempts"] += 1
+                backend["passed"] += attempt["status"] in SUCCESS_STATUSES
+                backend["seconds"] += attempt["seconds"]
+        return stats
+
+    def summary(self) -> str:
+        """Describe the success rate and the average latency of every backend."""
+        parts = []
+        for backend, stats in sorted(self.stats().items()):
+            parts.append(
+                f"{backend} passed {stats['passed']} of {stats['attempts']} modules "
+                f"({100 * stats['passed'] / stats['attempts']:.0f}%) in "
+                f"{stats['seconds'] / stats['attempts']:.1f} s on average"
+            )
+        return "; ".join(parts)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
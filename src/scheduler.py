@@ -0,0 +1,174 @@
+"""Order in which the modules of a run are started.
+
+The modules of a run are processed by a pool of workers, so a large module
+that is started last keeps the run going long after the others finished.
+Every module gets a cost estimate from its size, calibrated by the time the
+modules took in earlier runs, and the most expensive modules are started
+first. The modules do not wait for each other: the prompt of a module
+describes the modules it imports by their source code, not by their
+generated tests, so the import order does not matter.
+"""
+
+import ast
+import heapq
+import json
+import os
+import statistics
+import threading
+from typing import Dict, Iterable, List, Mapping, Optional, TypedDict
+
+HISTORY_FILE_NAME = "history.json"
+
+# Seconds of a module before they are calibrated by the history of earlier
+# runs, roughly one agent turn per function and a little more for long ones
+BASE_SECONDS = 10.0
+SECONDS_PER_FUNCTION = 15.0
+SECONDS_PER_NODE = 0.02
+
+
+class HistoryEntry(TypedDict):
+    seconds: float
+    static_seconds: float
+
+
+def static_cost(code: str) -> float:
+    """Estimate the seconds of a module from its number of AST nodes and
+    functions.
+
+    Args:
+        code (str): Source code of the module
+
+    Returns:
+        float: The estimated seconds, the base cost if the code cannot be parsed
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return BASE_SECONDS
+    nodes = 0
+    functions = 0
+    for node in ast.walk(tree):
+        nodes += 1
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            functions += 1
+    return BASE_SECONDS + SECONDS_PER_FUNCTION * functions + SECONDS_PER_NODE * nodes
+
+
+class CostHistory:
+    """Seconds every module took in the last run that generated its tests,
+    stored as a JSON file in the state directory.
+
+    Args:
+        path (str): Path to the history file, which is created on ``save``
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: Dict[str, HistoryEntry] = {}
+        try:
+            with open(path, encoding="utf-8") as f:
+                self._entries = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"Warning: Ignoring unreadable cost history {path}: {str(e)}")
+
+    @staticmethod
+    def _key(source_dir: str, module_name: str) -> str:
+        return f"{source_dir}::{module_name}"
+
+    def get(self, source_dir: str, module_name: str) -> Optional[HistoryEntry]:
+        with self._lock:
+            return self._entries.get(self._key(source_dir, module_name))
+
+    def record(
+        self, source_dir: str, module_name: str, seconds: float, static_seconds: float
+    ) -> None:
+        with self._lock:
+            self._entries[self._key(source_dir, module_name)] = {
+                "seconds": round(seconds, 3),
+                "static_seconds": round(static_seconds, 3),
+            }
+
+    def calibration(self) -> float:
+        """Get the median ratio of the actual to the estimated seconds of the
+        modules in the history, 1 if it is empty."""
+        with self._lock:
+            ratios = [
+                entry["seconds"] / entry["static_seconds"]
+                for entry in self._entries.values()
+                if entry["static_seconds"] > 0
+            ]
+        return statistics.median(ratios) if ratios else 1.0
+
+    def save(self) -> None:
+        """Write the history atomically."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with self._lock:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+def estimate_costs(
+    python_modules: Mapping[str, str],
+    source_dir: str,
+    history: Optional[CostHistory] = None,
+) -> Dict[str, float]:
+    """Estimate the seconds of every module, from the last run that
+    generated its tests, or otherwise from its size, scaled by how the size
+    estimates of the other modules compared to their actual seconds.
+
+    Args:
+        python_modules (Mapping[str, str]): Module names mapped to their source code
+        source_dir (str): Absolute path of the source directory
+        history (Optional[CostHistory]): Seconds of the modules in earlier runs
+
+    Returns:
+        Dict[str, float]: Module names mapped to their estimated seconds
+    """
+    calibration = history.calibration() if history is not None else 1.0
+    costs = {}
+    for module_name, code in python_modules.items():
+        entry = history.get(source_dir, module_name) if history else None
+        costs[module_name] = (
+            entry["seconds"] if entry is not None else calibration * static_cost(code)
+        )
+    return costs
+
+
+def longest_first_order(costs: Mapping[str, float]) -> List[str]:
+    """Order modules by their estimated seconds, the most expensive first.
+
+    Args:
+        costs (Mapping[str, float]): Module names mapped to their estimated seconds
+
+    Returns:
+        List[str]: Names of the modules in ``costs``, the first to start first
+    """
+    return sorted(costs, key=lambda module_name: (-costs[module_name], module_name))
+
+
+def simulate_makespan(
+    order: Iterable[str], costs: Mapping[str, float], workers: int
+) -> float:
+    """Simulate the wall time of starting the modules in the given order on
+    a pool of workers, each module on the first worker that is free.
+
+    Args:
+        order (Iterable[str]): Names of the modules in the order they start
+        costs (Mapping[str, float]): Module names mapped to their estimated seconds
+        workers (int): Number of workers
+
+    Returns:
+        float: Seconds until the last module is finished
+    """
+    free_at = [0.0] * max(workers, 1)
+    for module_name in order:
+        start = heapq.heappop(free_at)
+        heapq.heappush(free_at, start + costs[module_name])
+    return max(free_at)
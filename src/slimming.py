@@ -0,0 +1,202 @@
+"""Slimming of generated test modules.
+
+The generated test modules become part of CI, so a passing test module is
+profiled once more with the duration and the coverage of every test, see
+``validation.profile_tests``. Tests that run longer than the time budget, and
+tests whose lines and branches of the source code are all covered by other
+tests as well, are reported, or removed if the module still passes without
+them.
+
+Redundancy is judged by coverage only: a test that checks other results of
+the same code path counts as redundant, which is why tests are only removed
+on request.
+"""
+
+from collections import Counter
+from typing import Dict, List, Optional, Set, Tuple, TypedDict
+
+from metrics import timed
+from repair import remove_definitions
+from validation import TestProfile, profile_tests
+
+DEFAULT_MAX_TEST_SECONDS = 1.0
+
+
+class SlimmingReport(TypedDict):
+    tests: int
+    slow: List[str]
+    redundant: List[str]
+    removed: List[str]
+    seconds_before: float
+    seconds_after: float
+    coverage_before: Optional[float]
+    coverage_after: Optional[float]
+
+
+def _test_costs(profile: TestProfile) -> Dict[str, Tuple[float, Set[str]]]:
+    """Sum the durations and coverage of the tests of every top-level test
+    function or class, which are the parts of a test module that can be
+    removed."""
+    costs: Dict[str, Tuple[float, Set[str]]] = {}
+    covered = profile["covered"] or {}
+    for test in profile["validation"]["tests"]:
+        parts = test["id"].split("::")
+        if len(parts) < 2:
+            continue
+        name = parts[1].split("[")[0]
+        seconds, items = costs.get(name, (0.0, set()))
+        costs[name] = (
+            seconds + test["duration"],
+            items | set(covered.get(test["id"], ())),
+        )
+    return costs
+
+
+def _test_seconds(profile: TestProfile) -> float:
+    return round(sum(test["duration"] for test in profile["validation"]["tests"]), 4)
+
+
+def _coverage_percent(profile: TestProfile) -> Optional[float]:
+    coverage = profile["validation"]["coverage"]
+    return coverage["percent"] if coverage else None
+
+
+def find_slow_tests(
+    costs: Dict[str, Tuple[float, Set[str]]], max_test_seconds: float
+) -> List[str]:
+    """Get the top-level tests that ran longer than the time budget.
+
+    Args:
+        costs (Dict[str, Tuple[float, Set[str]]]): Seconds and covered lines and
+            arcs of every top-level test
+        max_test_seconds (float): Time budget of a test, 0 for no budget
+
+    Returns:
+        List[str]: Names of the slow tests, the slowest first
+    """
+    if not max_test_seconds:
+        return []
+    slow = [name for name, (seconds, _) in costs.items() if seconds > max_test_seconds]
+    return sorted(slow, key=lambda name: (-costs[name][0], name))
+
+
+def find_redundant_tests(
+    costs: Dict[str, Tuple[float, Set[str]]], exclude: Set[str]
+) -> List[str]:
+    """Get top-level tests that can be left out without losing coverage.
+
+    Tests are considered from the slowest to the fastest, and a test is
+    redundant if every line and arc it covers is also covered by another test
+    that is kept, so the fast tests are the ones that stay. A test that covers
+    nothing, e.g. because its coverage was not recorded, is not redundant.
+
+    Args:
+        costs (Dict[str, Tuple[float, Set[str]]]): Seconds and covered lines and
+            arcs of every top-level test
+        exclude (Set[str]): Tests that are left out anyway, e.g. slow tests
+
+    Returns:
+        List[str]: Names of the redundant tests
+    """
+    kept = {name: items for name, (_, items) in costs.items() if name not in exclude}
+    counts: Counter = Counter()
+    for items in kept.values():
+        counts.update(items)
+    redundant = []
+    for name in sorted(kept, key=lambda name: (-costs[name][0], name)):
+        items = kept[name]
+        if items and all(counts[item] > 1 for item in items):
+            counts.subtract(items)
+            redundant.append(name)
+    return redundant
+
+
+@timed("slimming")
+def slim_test_module(
+    test_code: str,
+    source_code: str,
+    module_name: str,
+    max_test_seconds: float = DEFAULT_MAX_TEST_SECONDS,
+    remove: bool = False,
+) -> Tuple[str, Optional[SlimmingReport]]:
+    """Find the slow and redundant tests of a passing test module, and
+    remove them if requested.
+
+    Tests are only removed if the module still passes without them, and never
+    all of them. Redundant tests are not searched for if coverage.py is not
+    installed.
+
+    Args:
+        test_code (str): The test module
+        source_code (str): The Python source code the tests are written for
+        module_name (str): The (dotted) module name the tests import the source code from
+        max_test_seconds (float): Time budget of a top-level test function or
+            class, 0 for no budget
+        remove (bool): Whether to remove the slow and redundant tests
+
+    Returns:
+        Tuple[str, Optional[SlimmingReport]]: The slimmed test module, the
+        given one if nothing was removed, and the report, or None if the test
+        module did not pass
+    """
+    profile = profile_tests(test_code, source_code, module_name)
+    if not profile["validation"]["passed"]:
+        return test_code, None
+
+    costs = _test_costs(profile)
+    slow = find_slow_tests(costs, max_test_seconds)
+    redundant = (
+        find_redundant_tests(costs, set(slow)) if profile["covered"] is not None else []
+    )
+    report: SlimmingReport = {
+        "tests": len(costs),
+        "slow": slow,
+        "redundant": redundant,
+        "removed": [],
+        "seconds_before": _test_seconds(profile),
+        "seconds_after": _test_seconds(profile),
+        "coverage_before": _coverage_percent(profile),
+        "coverage_after": _coverage_percent(profile),
+    }
+    names = set(slow) | set(redundant)
+    if not remove or not names or names >= set(costs):
+        return test_code, report
+
+    slimmed_test_code = remove_definitions(test_code, names)
+    if slimmed_test_code is None:
+        return test_code, report
+    slimmed = profile_tests(slimmed_test_code, source_code, module_name)
+    if not slimmed["validation"]["passed"]:
+        print(
+            f"Warning: Keeping the slow and redundant tests of {module_name}, "
+            "the tests fail without them"
+        )
+        return test_code, report
+    report["removed"] = sorted(names)
+    report["seconds_after"] = _test_seconds(slimmed)
+    report["coverage_after"] = _coverage_percent(slimmed)
+    return slimmed_test_code, report
+
+
+def describe_report(report: SlimmingReport) -> str:
+    """Describe a slimming report in one line."""
+    parts = [
+        f"{len(report['slow'])} slow and {len(report['redundant'])} redundant of "
+        f"{report['tests']} tests"
+    ]
+    if report["removed"]:
+        parts.append(f"removed {', '.join(report['removed'])}")
+        saved = report["seconds_before"] - report["seconds_after"]
+        percent = (
+            100 * saved / report["seconds_before"] if report["seconds_before"] else 0
+        )
+        parts.append(
+            f"test time {report['seconds_before']:.2f} s -> "
+            f"{report['seconds_after']:.2f} s (-{percent:.0f}%)"
+        )
+        if report["coverage_before"] is not None:
+            parts.append(
+                f"coverage {report['coverage_before']:g}% -> "
+                f"{report['coverage_after']:g}%"
+            )
+    return ", ".join(parts)
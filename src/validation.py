@@ -0,0 +1,844 @@
+"""Validation of generated tests.
+
+Tests are run with pytest in a sandbox per call, by the warm worker pool or a
+fresh Python process, and the JUnit XML report is summarized as a
+``ValidationResult``. Every run is bounded by the resource limits set with
+``set_resource_limits``; tests that exceed their time are reported with the
+outcome "timed_out". The same run measures the line and branch coverage of
+the source code if coverage.py is installed.
+
+The outcomes of every run are remembered per top-level test. When the same
+test module is validated again with only some tests edited, as in a repair
+loop, only the edited and the failing tests are rerun, and a partial run that
+passes is confirmed by a run of the whole module.
+
+This module does not depend on langchain, so it can be imported without the
+agent runtime; the agent tool is in ``tools``.
+
+``profile_tests`` runs a test module once more with the coverage of every
+test recorded separately, for the slimming of generated test modules.
+"""
+
+import ast
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from contextlib import contextmanager
+from importlib.metadata import PackageNotFoundError, version
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set, Tuple, TypedDict
+
+from code_analyzer import CodeAnalyzer
+from metrics import timed
+from pytest_pool import (
+    PytestPoolError,
+    ResourceLimits,
+    default_limits,
+    describe_signal,
+    get_pytest_pool,
+    kill_process_group,
+    limited_command,
+    pool_enabled,
+)
+
+SCRATCH_DIR_ENV = "MINERVA_SCRATCH_DIR"
+_TMPFS_DIR = Path("/dev/shm")
+MAX_TRACEBACK_LINES = 30
+TIMEOUT_MESSAGE = "timed out after"
+CURRENT_TEST_FILE = ".current_test"
+COVERAGE_REPORT_FILE = ".coverage.json"
+TEST_COVERAGE_REPORT_FILE = ".test_coverage.json"
+# Outcomes of tests that do not have to be rerun while nothing they depend on
+# changes
+PASSING_OUTCOMES = ("passed", "skipped", "xfailed")
+MAX_MEMO_ENTRIES = 256
+
+_limits: ResourceLimits = default_limits()
+_measure_coverage = True
+_incremental = True
+
+# Records the running test, so it can be named if the whole run is killed,
+# fails every test that runs longer than the test timeout, and measures the
+# coverage of the source code from before the test module is imported,
+# optionally with every test in its own coverage context
+_CONFTEST = """import json
+import signal
+
+import pytest
+
+TEST_TIMEOUT = {test_timeout!r}
+SOURCE_FILES = {source_files!r}
+COVERAGE_REPORT = {coverage_report!r}
+TEST_COVERAGE_REPORT = {test_coverage_report!r}
+
+_coverage = None
+if COVERAGE_REPORT:
+    try:
+        import coverage
+    except ImportError:
+        pass
+    else:
+        _coverage = coverage.Coverage(
+            data_file=None, branch=True, include=SOURCE_FILES, config_file=False
+        )
+        _coverage.start()
+
+
+def pytest_sessionfinish(session, exitstatus):
+    if _coverage is None:
+        return
+    _coverage.stop()
+    try:
+        _coverage.json_report(morfs=SOURCE_FILES, outfile=COVERAGE_REPORT)
+    except Exception:
+        pass
+    if TEST_COVERAGE_REPORT:
+        _write_test_coverage()
+
+
+def _write_test_coverage():
+    # The lines and arcs of the source code every test covered, by node ID
+    data = _coverage.get_data()
+    covered = {{}}
+    for context in data.measured_contexts():
+        if not context:
+            continue
+        data.set_query_context(context)
+        items = covered.setdefault(context, [])
+        for path in data.measured_files():
+            items.extend(f"{{path}}:{{line}}" for line in data.lines(path) or ())
+            items.extend(
+                f"{{path}}:{{start}}->{{end}}" for start, end in data.arcs(path) or ()
+            )
+    with open(TEST_COVERAGE_REPORT, "w") as f:
+        json.dump(covered, f)
+
+
+def _on_timeout(signum, frame):
+    pytest.fail(f"Test {timeout_message} {{TEST_TIMEOUT}} s", pytrace=False)
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_protocol(item, nextitem):
+    with open({current_test_file!r}, "w") as f:
+        f.write(item.nodeid)
+    if _coverage is not None and TEST_COVERAGE_REPORT:
+        _coverage.switch_context(item.nodeid)
+    yield
+
+
+def _with_timeout():
+    if not TEST_TIMEOUT or not hasattr(signal, "SIGALRM"):
+        yield
+        return
+    previous = signal.signal(signal.SIGALRM, _on_timeout)
+    signal.setitimer(signal.ITIMER_REAL, TEST_TIMEOUT)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_setup(item):
+    yield from _with_timeout()
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_call(item):
+    yield from _with_timeout()
+"""
+
+# Source code of the modules being tested, so the agent can validate tests of
+# a part of a large module without passing the whole module back to the tool
+_registered_sources: Dict[str, str] = {}
+_registered_sources_lock = threading.Lock()
+
+
+class TestOutcome(TypedDict):
+    id: str
+    outcome: str
+    duration: float
+
+
+class TestFailure(TypedDict):
+    id: str
+    traceback: str
+
+
+class CoverageSummary(TypedDict):
+    percent: float
+    line_percent: float
+    branch_percent: Optional[float]
+    uncovered_lines: str
+    uncovered_branches: str
+
+
+class ValidationResult(TypedDict):
+    passed: bool
+    summary: Dict[str, int]
+    tests: List[TestOutcome]
+    failures: List[TestFailure]
+    duration: float
+    timed_out: bool
+    coverage: Optional[CoverageSummary]
+    reused: int
+
+
+class TestProfile(TypedDict):
+    validation: ValidationResult
+    # Lines and arcs of the source code covered by every test, by node ID, or
+    # None if coverage.py is not installed
+    covered: Optional[Dict[str, List[str]]]
+
+
+# Outcomes of the top-level tests of earlier runs, keyed by module name, source
+# hash and context hash, then by test name with the hash of the test
+_MemoKey = Tuple[str, str, str]
+_TestMemo = Dict[str, Tuple[str, List[TestOutcome]]]
+_outcome_memo: "OrderedDict[_MemoKey, _TestMemo]" = OrderedDict()
+_outcome_memo_lock = threading.Lock()
+
+
+def set_incremental(enabled: bool) -> None:
+    """Switch between rerunning only edited and failing tests, and rerunning
+    every test in all following validation runs."""
+    global _incremental
+    _incremental = enabled
+
+
+def set_coverage(enabled: bool) -> None:
+    """Switch the coverage measurement of all following validation runs on or
+    off."""
+    global _measure_coverage
+    _measure_coverage = enabled
+
+
+def set_resource_limits(limits: ResourceLimits) -> None:
+    """Set the timeouts and rlimits of all following validation runs."""
+    global _limits
+    _limits = limits
+
+
+def get_resource_limits() -> ResourceLimits:
+    return _limits
+
+
+def register_source(module_name: str, source_code: str) -> None:
+    """Register the source code of a module, which ``validate_tests`` uses
+    when it is called without source code for that module."""
+    with _registered_sources_lock:
+        _registered_sources[module_name] = source_code
+
+
+def get_registered_source(module_name: str) -> str:
+    """Get the registered source code of a module, or an empty string."""
+    with _registered_sources_lock:
+        return _registered_sources.get(module_name, "")
+
+
+def unregister_source(module_name: str) -> None:
+    with _registered_sources_lock:
+        _registered_sources.pop(module_name, None)
+
+
+@contextmanager
+def registered_source(module_name: str, source_code: str) -> Iterator[None]:
+    """Register the source code of a module while the agent writes its tests."""
+    register_source(module_name, source_code)
+    try:
+        yield
+    finally:
+        unregister_source(module_name)
+
+
+def get_scratch_root() -> Path:
+    """Get the directory under which the per-call sandboxes are created.
+
+    The directory can be set with the ``MINERVA_SCRATCH_DIR`` environment
+    variable. Otherwise ``/dev/shm`` is used if it is available, so that test
+    files are kept in memory, with the system temp directory as fallback.
+    """
+    scratch_dir = os.environ.get(SCRATCH_DIR_ENV)
+    if scratch_dir:
+        root = Path(scratch_dir)
+        root.mkdir(parents=True, exist_ok=True)
+        return root
+
+    if _TMPFS_DIR.is_dir() and os.access(_TMPFS_DIR, os.W_OK | os.X_OK):
+        return _TMPFS_DIR
+    return Path(tempfile.gettempdir())
+
+
+@contextmanager
+def sandbox(
+    source_code: str,
+    test_code: str,
+    module_name: str = "source",
+    test_timeout: float = 0.0,
+    measure_coverage: bool = False,
+    per_test_coverage: bool = False,
+) -> Iterator[Path]:
+    """Create an isolated directory containing the source and test module.
+
+    Every call gets its own directory, so any number of validations can run
+    at the same time. The directory is removed when the context exits.
+
+    Args:
+        source_code (str): The Python source code written to ``source.py``
+        test_code (str): The PyTest code written to ``test_source.py``
+        module_name (str): Additional (dotted) module name the source code is
+            written to, so tests can import it under its real name
+        test_timeout (float): Seconds after which a single test fails, 0 for
+            no limit
+        measure_coverage (bool): Whether to write a JSON coverage report of
+            the source code to ``.coverage.json``
+        per_test_coverage (bool): Whether to also write the coverage of every
+            test to ``.test_coverage.json``
+
+    Yields:
+        Path: The sandbox directory
+    """
+    sandbox_dir = Path(tempfile.mkdtemp(prefix="minerva-", dir=get_scratch_root()))
+    try:
+        source_files = [sandbox_dir / "source.py"]
+        if module_name != "source":
+            source_files.append(
+                sandbox_dir.joinpath(*module_name.split(".")).with_suffix(".py")
+            )
+        for source_file in source_files:
+            source_file.parent.mkdir(parents=True, exist_ok=True)
+            source_file.write_text(source_code)
+        (sandbox_dir / "test_source.py").write_text(test_code)
+        (sandbox_dir / "conftest.py").write_text(
+            _CONFTEST.format(
+                test_timeout=test_timeout,
+                timeout_message=TIMEOUT_MESSAGE,
+                current_test_file=str(sandbox_dir / CURRENT_TEST_FILE),
+                source_files=[str(path) for path in source_files],
+                coverage_report=(
+                    str(sandbox_dir / COVERAGE_REPORT_FILE) if measure_coverage else ""
+                ),
+                test_coverage_report=(
+                    str(sandbox_dir / TEST_COVERAGE_REPORT_FILE)
+                    if measure_coverage and per_test_coverage
+                    else ""
+                ),
+            )
+        )
+        yield sandbox_dir
+    finally:
+        shutil.rmtree(sandbox_dir, ignore_errors=True)
+
+
+def _import_names(source_code: str) -> Set[str]:
+    """Get the top-level modules imported by the source code."""
+    try:
+        tree = ast.parse(source_code)
+    except SyntaxError:
+        return set()
+    analyzer = CodeAnalyzer()
+    analyzer.visit(tree)
+    return analyzer.import_names
+
+
+def _run_subprocess(
+    command: List[str], cwd: str, env: Dict[str, str], limits: Optional[ResourceLimits]
+) -> subprocess.CompletedProcess:
+    """Run a command in a new process group with the rlimits, and kill the
+    whole group when the run times out or ends.
+
+    The limits are applied by a wrapper process rather than a ``preexec_fn``,
+    which is unsafe while other threads run test modules in parallel.
+    """
+    timeout = limits["run_timeout"] if limits and limits["run_timeout"] else None
+    with subprocess.Popen(
+        limited_command(command, limits),
+        cwd=cwd,
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        start_new_session=True,
+    ) as process:
+        try:
+            stdout, stderr = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            kill_process_group(process.pid)
+            stdout, stderr = process.communicate()
+            raise subprocess.TimeoutExpired(
+                command, timeout or 0, output=stdout, stderr=stderr
+            )
+        finally:
+            kill_process_group(process.pid)
+    return subprocess.CompletedProcess(command, process.returncode, stdout, stderr)
+
+
+def _run_pytest(
+    sandbox_dir: Path,
+    args: List[str],
+    limits: Optional[ResourceLimits] = None,
+    test_names: Optional[List[str]] = None,
+) -> subprocess.CompletedProcess:
+    """Run pytest on the test module of a sandbox.
+
+    The run is executed by the warm worker pool if it is enabled, and in a
+    fresh Python process otherwise.
+
+    Args:
+        sandbox_dir (Path): The sandbox created by :func:`sandbox`
+        args (List[str]): Additional command line arguments for pytest
+        limits (Optional[ResourceLimits]): Timeout and rlimits of the run
+        test_names (Optional[List[str]]): Top-level test functions and classes
+            to run, all tests of the module if None
+
+    Returns:
+        subprocess.CompletedProcess: The finished pytest process
+
+    Raises:
+        subprocess.TimeoutExpired: If the run timed out
+    """
+    # Use the current Python executable and its environment
+    env = os.environ.copy()
+    # Add the sandbox directory to Python path
+    python_path = env.get("PYTHONPATH", "")
+    env["PYTHONPATH"] = f"{sandbox_dir}{os.pathsep}{python_path}"
+
+    test_path = str(sandbox_dir / "test_source.py")
+    pytest_args = [
+        "-p",
+        "no:cacheprovider",
+        *args,
+        *(
+            [f"{test_path}::{name}" for name in test_names]
+            if test_names
+            else [test_path]
+        ),
+    ]
+
+    if pool_enabled():
+        source_code = (sandbox_dir / "source.py").read_text()
+        preload = _import_names(source_code)
+        if _measure_coverage:
+            # The conftest starts the measurement, the import can be shared
+            preload.add("coverage")
+        try:
+            return get_pytest_pool().run(
+                pytest_args,
+                cwd=str(sandbox_dir),
+                env=env,
+                preload=preload,
+                limits=limits,
+            )
+        except PytestPoolError as e:
+            print(f"Warning: Falling back to a fresh pytest process: {str(e)}")
+
+    return _run_subprocess(
+        [sys.executable, "-m", "pytest", *pytest_args], str(sandbox_dir), env, limits
+    )
+
+
+def _node_id(testcase: ET.Element) -> str:
+    """Build the pytest node ID of a JUnit XML test case."""
+    name = testcase.get("name", "")
+    classname = testcase.get("classname", "")
+    if not classname:
+        return name
+    parts = classname.split(".")
+    return "::".join([f"{parts[0]}.py", *parts[1:], name])
+
+
+def _trim(text: str, max_lines: int = MAX_TRACEBACK_LINES) -> str:
+    """Keep the last lines of a traceback, which contain the actual
+    error."""
+    lines = text.strip().splitlines()
+    if len(lines) <= max_lines:
+        return "\n".join(lines)
+    return "\n".join(["...", *lines[-max_lines:]])
+
+
+def _parse_junit_report(
+    report_path: Path,
+) -> Tuple[List[TestOutcome], List[TestFailure]]:
+    """Read the per-test outcomes and failures from a JUnit XML report."""
+    tests: List[TestOutcome] = []
+    failures: List[TestFailure] = []
+    if not report_path.exists():
+        return tests, failures
+
+    for testcase in ET.parse(report_path).getroot().iter("testcase"):
+        node_id = _node_id(testcase)
+        outcome = "passed"
+        for child in testcase:
+            if child.tag in ("failure", "error"):
+                outcome = "failed" if child.tag == "failure" else "error"
+                if TIMEOUT_MESSAGE in child.get("message", ""):
+                    outcome = "timed_out"
+                details = child.text or child.get("message", "")
+                failures.append({"id": node_id, "traceback": _trim(details)})
+                break
+            if child.tag == "skipped":
+                outcome = (
+                    "xfailed" if child.get("type") == "pytest.xfail" else "skipped"
+                )
+                break
+        tests.append(
+            {
+                "id": node_id,
+                "outcome": outcome,
+                "duration": round(float(testcase.get("time", 0) or 0), 4),
+            }
+        )
+    return tests, failures
+
+
+def _line_ranges(lines: List[int]) -> str:
+    """Format line numbers as ranges, e.g. "3-5, 9"."""
+    ranges: List[str] = []
+    start = previous = None
+    for line in sorted(lines):
+        if previous is not None and line == previous + 1:
+            previous = line
+            continue
+        if start is not None:
+            ranges.append(f"{start}-{previous}" if previous != start else str(start))
+        start = previous = line
+    if start is not None:
+        ranges.append(f"{start}-{previous}" if previous != start else str(start))
+    return ", ".join(ranges)
+
+
+def _parse_coverage_report(report_path: Path) -> Optional[CoverageSummary]:
+    """Summarize the coverage of the source code from a JSON coverage report.
+
+    The source code is written to two files if it has a module name, and the
+    file the tests imported is the one with covered lines.
+    """
+    if not report_path.exists():
+        return None
+    try:
+        files = json.loads(report_path.read_text()).get("files", {})
+    except ValueError:
+        return None
+    if not files:
+        return None
+
+    report = max(files.values(), key=lambda f: f["summary"]["covered_lines"])
+    summary = report["summary"]
+    num_branches = summary.get("num_branches", 0)
+    return {
+        "percent": round(summary["percent_covered"], 1),
+        "line_percent": round(
+            100.0 * summary["covered_lines"] / max(summary["num_statements"], 1), 1
+        ),
+        "branch_percent": (
+            round(100.0 * summary["covered_branches"] / num_branches, 1)
+            if num_branches
+            else None
+        ),
+        "uncovered_lines": _line_ranges(report.get("missing_lines", [])),
+        "uncovered_branches": ", ".join(
+            f"{start}->{end if end > 0 else 'exit'}"
+            for start, end in report.get("missing_branches", [])
+        ),
+    }
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _split_tests(test_code: str) -> Optional[Tuple[str, Dict[str, str]]]:
+    """Hash the top-level test functions and classes of a test module one by
+    one, and everything else, e.g. imports, fixtures and helpers, as the
+    context of the tests.
+
+    Args:
+        test_code (str): The test module
+
+    Returns:
+        Optional[Tuple[str, Dict[str, str]]]: The hash of the context and the
+        hash of every test by name, or None if the module cannot be parsed
+    """
+    try:
+        tree = ast.parse(test_code)
+    except SyntaxError:
+        return None
+    context: List[str] = []
+    tests: Dict[str, str] = {}
+    for node in tree.body:
+        # Line numbers are not part of the dump, so moved tests are unchanged
+        if (
+            isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))
+            and node.name.startswith("test")
+        ) or (isinstance(node, ast.ClassDef) and node.name.startswith("Test")):
+            tests[node.name] = _digest(ast.dump(node))
+        else:
+            context.append(ast.dump(node))
+    return _digest("\n".join(context)), tests
+
+
+def _test_name(node_id: str) -> Optional[str]:
+    """Get the top-level test function or class of a node ID."""
+    parts = node_id.split("::")
+    return parts[1].split("[")[0] if len(parts) > 1 else None
+
+
+def _tests_to_rerun(
+    key: _MemoKey, test_hashes: Dict[str, str]
+) -> Tuple[Optional[List[str]], List[TestOutcome]]:
+    """Select the tests that are new, edited or failed in the previous run of
+    the same context, and collect the outcomes of the others.
+
+    Returns:
+        Tuple[Optional[List[str]], List[TestOutcome]]: The names of the tests to
+        rerun, or None if every test has to run, and the reused outcomes
+    """
+    with _outcome_memo_lock:
+        memo = _outcome_memo.get(key)
+        if memo is None:
+            return None, []
+        _outcome_memo.move_to_end(key)
+        selected: List[str] = []
+        reused: List[TestOutcome] = []
+        for name, test_hash in test_hashes.items():
+            entry = memo.get(name)
+            if (
+                entry is not None
+                and entry[0] == test_hash
+                and entry[1]
+                and all(test["outcome"] in PASSING_OUTCOMES for test in entry[1])
+            ):
+                reused.extend(entry[1])
+            else:
+                selected.append(name)
+    if not selected or not reused:
+        return None, []
+    return selected, reused
+
+
+def _remember_outcomes(
+    key: _MemoKey,
+    test_hashes: Dict[str, str],
+    tests: List[TestOutcome],
+    ran: Optional[List[str]],
+) -> None:
+    """Store the outcomes of the tests that ran, and forget the tests that
+    ran without an outcome, e.g. because the module could not be imported."""
+    outcomes: Dict[str, List[TestOutcome]] = {}
+    for test in tests:
+        name = _test_name(test["id"])
+        if name is not None:
+            outcomes.setdefault(name, []).append(test)
+    with _outcome_memo_lock:
+        memo = _outcome_memo.setdefault(key, {})
+        _outcome_memo.move_to_end(key)
+        for name in ran if ran is not None else test_hashes:
+            if name in outcomes:
+                memo[name] = (test_hashes[name], outcomes[name])
+            else:
+                memo.pop(name, None)
+        while len(_outcome_memo) > MAX_MEMO_ENTRIES:
+            _outcome_memo.popitem(last=False)
+
+
+def _parse_test_coverage_report(report_path: Path) -> Optional[Dict[str, List[str]]]:
+    if not report_path.exists():
+        return None
+    try:
+        return json.loads(report_path.read_text())
+    except ValueError:
+        return None
+
+
+def _run_tests(
+    test_code: str,
+    source_code: str,
+    module_name: str,
+    limits: ResourceLimits,
+    test_names: Optional[List[str]] = None,
+    per_test_coverage: bool = False,
+) -> TestProfile:
+    """Run the given tests of the test code, or all of them, and summarize
+    the result, with the coverage of every test if ``per_test_coverage``."""
+    start = time.perf_counter()
+    timed_out = False
+    current_test = ""
+    with sandbox(
+        source_code,
+        test_code,
+        module_name,
+        limits["test_timeout"],
+        # A partial run does not tell the coverage of the whole module
+        (_measure_coverage or per_test_coverage) and test_names is None,
+        per_test_coverage,
+    ) as sandbox_dir:
+        report_path = sandbox_dir / ".report.xml"
+        try:
+            result = _run_pytest(
+                sandbox_dir,
+                ["-q", "--tb=short", f"--junitxml={report_path}"],
+                limits,
+                test_names,
+            )
+        except subprocess.TimeoutExpired as e:
+            timed_out = True
+            result = subprocess.CompletedProcess(
+                e.cmd, -9, e.output or "", e.stderr or ""
+            )
+            current_test_path = sandbox_dir / CURRENT_TEST_FILE
+            if current_test_path.exists():
+                current_test = current_test_path.read_text().strip()
+        tests, failures = _parse_junit_report(report_path)
+        coverage = _parse_coverage_report(sandbox_dir / COVERAGE_REPORT_FILE)
+        covered = _parse_test_coverage_report(sandbox_dir / TEST_COVERAGE_REPORT_FILE)
+    duration = time.perf_counter() - start
+
+    if timed_out:
+        # The run was killed, so the report of the running test is missing
+        test_id = current_test or "<session>"
+        tests.append(
+            {"id": test_id, "outcome": "timed_out", "duration": round(duration, 4)}
+        )
+        failures.append(
+            {
+                "id": test_id,
+                "traceback": f"Test {test_id} timed out: the test run was stopped "
+                f"after {limits['run_timeout']} s\n"
+                + _trim(result.stdout + result.stderr),
+            }
+        )
+    elif result.returncode != 0 and not failures:
+        # Nothing was collected or pytest itself failed, e.g. on a usage error,
+        # or it was killed for exceeding a resource limit
+        reason = describe_signal(result.returncode)
+        failures.append(
+            {
+                "id": "<session>",
+                "traceback": (f"{reason}\n" if reason else "")
+                + _trim(result.stdout + result.stderr),
+            }
+        )
+
+    validation: ValidationResult = {
+        "passed": result.returncode == 0,
+        "summary": _summarize(tests),
+        "tests": tests,
+        "failures": failures,
+        "duration": round(duration, 3),
+        "timed_out": timed_out or any(t["outcome"] == "timed_out" for t in tests),
+        "coverage": coverage,
+        "reused": 0,
+    }
+    return {"validation": validation, "covered": covered}
+
+
+def _summarize(tests: List[TestOutcome]) -> Dict[str, int]:
+    summary: Dict[str, int] = {}
+    for test in tests:
+        summary[test["outcome"]] = summary.get(test["outcome"], 0) + 1
+    return summary
+
+
+@timed("validation")
+def run_validation(
+    test_code: str, source_code: str, module_name: str = "source"
+) -> ValidationResult:
+    """Run the test code against the source code and summarize the result.
+
+    If the same test module was validated before with the same source code,
+    imports, fixtures and helpers, only the tests that are new, edited or
+    failed are rerun, and the outcomes of the others are reused. A partial
+    run that passes is followed by a run of the whole module, which decides
+    the result.
+
+    Args:
+        test_code (str): The PyTest code written to test the source code
+        source_code (str): The Python source code for which the tests are written
+        module_name (str): The (dotted) module name the tests import the source code from
+
+    Returns:
+        ValidationResult: Pass/fail, per-test outcomes and durations, trimmed
+        tracebacks of the failed tests, including tests that timed out, the
+        coverage of the source code if it was measured, and the number of
+        reused outcomes
+    """
+    limits = _limits
+    start = time.perf_counter()
+    split = _split_tests(test_code) if _incremental else None
+    if split is None:
+        return _run_tests(test_code, source_code, module_name, limits)["validation"]
+
+    context_hash, test_hashes = split
+    key = (
+        module_name,
+        _digest(source_code),
+        _digest(f"{context_hash}:{limits['test_timeout']}"),
+    )
+    test_names, reused = _tests_to_rerun(key, test_hashes)
+    result = _run_tests(test_code, source_code, module_name, limits, test_names)[
+        "validation"
+    ]
+    _remember_outcomes(key, test_hashes, result["tests"], test_names)
+    if test_names is None:
+        return result
+    if result["passed"]:
+        # Tests may depend on each other, so only a full run confirms them
+        result = _run_tests(test_code, source_code, module_name, limits)["validation"]
+        _remember_outcomes(key, test_hashes, result["tests"], None)
+        result["duration"] = round(time.perf_counter() - start, 3)
+        return result
+
+    result["tests"] = result["tests"] + reused
+    result["summary"] = _summarize(result["tests"])
+    result["reused"] = len(reused)
+    return result
+
+
+@timed("validation")
+def profile_tests(
+    test_code: str, source_code: str, module_name: str = "source"
+) -> TestProfile:
+    """Run all tests of the test code with the coverage of every test
+    measured separately, using coverage.py dynamic contexts. No outcomes of
+    earlier runs are reused, so the duration of every test is measured.
+
+    Args:
+        test_code (str): The PyTest code written to test the source code
+        source_code (str): The Python source code for which the tests are written
+        module_name (str): The (dotted) module name the tests import the source code from
+
+    Returns:
+        TestProfile: The validation result, and the lines and arcs of the
+        source code every test covered
+    """
+    return _run_tests(
+        test_code, source_code, module_name, _limits, per_test_coverage=True
+    )
+
+
+def tools_fingerprint() -> str:
+    """Describe the validation tools and the pytest version, so results that
+    depend on them can be invalidated when they change.
+
+    The tools are described by the source of this module and of ``tools``
+    rather than by their schemas, so the fingerprint can be computed without
+    importing langchain.
+    """
+    try:
+        pytest_version = version("pytest")
+    except PackageNotFoundError:
+        pytest_version = ""
+    digest = hashlib.sha256()
+    for name in ("tools.py", "validation.py"):
+        digest.update((Path(__file__).parent / name).read_bytes())
+    return f"pytest={pytest_version};tools={digest.hexdigest()}"
@@ -0,0 +1,6 @@
+import sys
+from pathlib import Path
+
+# The modules of the package are imported by their top-level names, as in
+# ``src/main.py``
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
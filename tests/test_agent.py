@@ -0,0 +1,122 @@
+from typing import List, Optional
+
+import pytest
+from langchain_core.messages import AIMessage, ToolMessage
+
+import agent
+import tools
+from agent import create_agent, final_test_code, run_agent
+from fake_model import ScriptedChatModel
+from validation import CoverageSummary, ValidationResult, registered_source
+
+SOURCE = "def add(a, b):\n    return a + b\n"
+DRAFT = "from calc import add\n\n\ndef test_add():\n    assert add(1, 2) == 3\n"
+FINAL = DRAFT + "\n\ndef test_add_negative():\n    assert add(-1, -2) == -3\n"
+
+
+def _validate(call_id: str, test_code: str) -> AIMessage:
+    return AIMessage(
+        content="",
+        tool_calls=[
+            {
+                "name": "validate_tests",
+                "args": {"test_code": test_code, "module_name": "calc"},
+                "id": call_id,
+            }
+        ],
+    )
+
+
+def _coverage(percent: float) -> CoverageSummary:
+    return {
+        "percent": percent,
+        "line_percent": percent,
+        "branch_percent": None,
+        "uncovered_lines": "",
+        "uncovered_branches": "",
+    }
+
+
+def _result(coverage: Optional[CoverageSummary]) -> ValidationResult:
+    return {
+        "passed": True,
+        "summary": {"passed": 1},
+        "tests": [
+            {"id": "test_calc.py::test_add", "outcome": "passed", "duration": 0.0}
+        ],
+        "failures": [],
+        "duration": 0.1,
+        "timed_out": False,
+        "coverage": coverage,
+        "reused": 0,
+    }
+
+
+def _run(
+    monkeypatch: pytest.MonkeyPatch,
+    target: float,
+    results: List[ValidationResult],
+) -> list:
+    """Run the agent on a script with two validations and a final answer,
+    where the validations return the given results."""
+    pending = list(results)
+    monkeypatch.setattr(tools, "run_validation", lambda *args: pending.pop(0))
+    monkeypatch.setattr(agent, "_coverage_target", target)
+    model = ScriptedChatModel(
+        default_script=[
+            _validate("call_1", DRAFT),
+            _validate("call_2", FINAL),
+            AIMessage(content=FINAL),
+        ]
+    )
+    with registered_source("calc", SOURCE):
+        return run_agent(create_agent(model), "Write tests for calc")
+
+
+def _validations(messages: list) -> int:
+    return sum(isinstance(message, ToolMessage) for message in messages)
+
+
+@pytest.mark.parametrize("percent", [80.0, 95.0])
+def test_coverage_at_or_above_the_target_stops_the_agent(
+    monkeypatch: pytest.MonkeyPatch, percent: float
+) -> None:
+    messages = _run(
+        monkeypatch, 80.0, [_result(_coverage(percent)), _result(_coverage(100.0))]
+    )
+
+    assert _validations(messages) == 1
+    assert isinstance(messages[-1], ToolMessage)
+    assert final_test_code(messages) == DRAFT
+
+
+def test_coverage_below_the_target_does_not_stop_the_agent(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    messages = _run(
+        monkeypatch, 80.0, [_result(_coverage(79.9)), _result(_coverage(90.0))]
+    )
+
+    # The second validation meets the target
+    assert _validations(messages) == 2
+    assert final_test_code(messages) == FINAL
+
+
+def test_missing_coverage_report_does_not_meet_the_target(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    messages = _run(monkeypatch, 80.0, [_result(None), _result(None)])
+
+    assert _validations(messages) == 2
+    assert messages[-1].content == FINAL
+
+
+def test_agent_without_target_waits_for_its_final_answer(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    messages = _run(
+        monkeypatch, 0.0, [_result(_coverage(100.0)), _result(_coverage(100.0))]
+    )
+
+    assert _validations(messages) == 2
+    assert messages[-1].content == FINAL
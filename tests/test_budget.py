@@ -0,0 +1,122 @@
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+import pytest
+
+import generation
+from agent import run_agent
+from budget import ModuleBudget, budget_scope
+from generation import GenerationSettings, generate_test_module
+from metrics import new_module_record
+
+SOURCE = "def add(first, second):\n    return first + second\n"
+
+FAILING_TESTS = """from calculator import add
+
+
+def test_add():
+    assert add(1, 2) == 3
+
+
+def test_add_wrong():
+    assert add(1, 2) == 4
+"""
+
+
+def test_budget_counts_model_turns_and_validation_runs() -> None:
+    budget = ModuleBudget(max_model_turns=2, max_validation_runs=1, deadline=0)
+
+    budget.charge(model_turns=1, validation_runs=1)
+    assert budget.allows("model")
+    assert not budget.allows("validation")
+    assert budget.exhausted_by == "validation runs"
+
+    budget.charge(model_turns=1)
+    assert not budget.allows("model")
+    assert budget.exhausted_by == "model turns"
+
+
+def test_budget_scales_with_units_and_ends_at_the_deadline() -> None:
+    budget = ModuleBudget(max_model_turns=2, max_validation_runs=1, deadline=0.05)
+    budget.scale(3)
+    budget.charge(model_turns=5, validation_runs=2)
+    assert budget.allows("model") and budget.allows("validation")
+    assert budget.recursion_limit() == 2 * 6 + 5
+
+    time.sleep(0.06)
+
+    assert not budget.allows("model")
+    assert budget.exhausted_by == "deadline"
+
+
+def test_unlimited_budget_allows_every_step() -> None:
+    budget = ModuleBudget(max_model_turns=0, max_validation_runs=0, deadline=0)
+    budget.charge(model_turns=1000, validation_runs=1000)
+
+    assert budget.allows("model") and budget.allows("validation")
+    assert budget.recursion_limit() is None
+
+
+class _UnusedGraph:
+    def stream(self, *args: Any, **kwargs: Any) -> Iterator[Dict[str, Any]]:
+        raise AssertionError("the agent must not take a step")
+
+
+def test_agent_does_not_start_on_an_exhausted_budget() -> None:
+    budget = ModuleBudget(max_model_turns=1, max_validation_runs=1, deadline=0)
+    budget.charge(model_turns=1)
+    record = new_module_record("calculator")
+
+    with budget_scope(budget):
+        messages = run_agent(_UnusedGraph(), "Write tests", record)
+
+    assert messages == []
+    assert record["model_calls"] == 0
+    assert budget.exhausted_by == "model turns"
+
+
+def test_exhausted_budget_skips_the_repair_of_candidates(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Any
+) -> None:
+    repairs: List[str] = []
+    budget = ModuleBudget(max_model_turns=2, max_validation_runs=2, deadline=0)
+
+    def generate_candidates(*args: Any) -> str:
+        # The candidates use up the budget, which is scaled by their number
+        budget.charge(model_turns=budget.max_model_turns)
+        return FAILING_TESTS
+
+    def validate(test_code: str, code: str, module_name: str) -> Dict[str, Any]:
+        passed = "xfail" in test_code
+        return {
+            "passed": passed,
+            "summary": {},
+            "tests": [],
+            "failures": (
+                []
+                if passed
+                else [{"id": "test_calculator.py::test_add_wrong", "traceback": ""}]
+            ),
+            "duration": 0.0,
+            "timed_out": False,
+            "coverage": None,
+            "reused": 0,
+        }
+
+    def repair(*args: Any, **kwargs: Any) -> Optional[str]:
+        repairs.append("repair")
+        return None
+
+    monkeypatch.setattr(generation, "_generate_candidates", generate_candidates)
+    monkeypatch.setattr(generation, "run_validation", validate)
+    monkeypatch.setattr(generation, "repair_test_module", repair)
+    settings = GenerationSettings("../src", str(tmp_path), candidates=2)
+
+    test_file_path, status = generate_test_module(
+        None, settings, "calculator", SOURCE, budget=budget
+    )
+
+    assert repairs == []
+    assert status == "partial"
+    assert budget.exhausted_by == "model turns"
+    assert "@pytest.mark.xfail" in open(test_file_path).read()
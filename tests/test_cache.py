@@ -0,0 +1,95 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from cache import GenerationCache, cache_key
+
+PARTS = {
+    "source": "def add(a, b):\n    return a + b\n",
+    "prompt": "Write tests for add",
+    "model": "bedrock",
+    "tools": "validate_tests:1",
+}
+
+
+def _key(**changes: str) -> str:
+    parts = dict(PARTS, **changes)
+    return cache_key(parts["source"], parts["prompt"], parts["model"], parts["tools"])
+
+
+def _entries(cache_dir: Path) -> int:
+    return len(list(cache_dir.glob("*/*.py")))
+
+
+def test_cached_test_module_is_found_by_the_same_parts(tmp_path: Path) -> None:
+    cache = GenerationCache(str(tmp_path))
+    cache.put(_key(), "def test_add(): ...\n")
+
+    assert cache.get(_key()) == "def test_add(): ...\n"
+    assert (cache.hits, cache.misses) == (1, 0)
+
+
+@pytest.mark.parametrize(
+    "part,value",
+    [
+        ("source", "def add(a, b):\n    return b + a\n"),
+        ("prompt", "Write more tests for add"),
+        ("model", "fake"),
+        ("tools", "validate_tests:2"),
+    ],
+)
+def test_changed_part_misses_the_cache(tmp_path: Path, part: str, value: str) -> None:
+    cache = GenerationCache(str(tmp_path))
+    cache.put(_key(), "def test_add(): ...\n")
+
+    assert cache.get(_key(**{part: value})) is None
+    assert (cache.hits, cache.misses) == (0, 1)
+
+
+def test_key_parts_are_not_concatenated() -> None:
+    assert cache_key("ab", "c") != cache_key("a", "bc")
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path: Path) -> None:
+    cache = GenerationCache(str(tmp_path), max_entries=2)
+    cache.put("aa1", "first\n")
+    cache.put("bb2", "second\n")
+    assert cache.get("aa1") == "first\n"
+
+    cache.put("cc3", "third\n")
+
+    assert cache.get("bb2") is None
+    assert cache.get("aa1") == "first\n"
+    assert cache.get("cc3") == "third\n"
+    assert _entries(tmp_path) == 2
+
+
+def test_entries_are_evicted_by_total_size(tmp_path: Path) -> None:
+    cache = GenerationCache(str(tmp_path), max_bytes=25)
+    cache.put("aa1", "x" * 10)
+    cache.put("bb2", "y" * 10)
+    # Replacing an entry only counts its new size
+    cache.put("bb2", "z" * 10)
+    assert _entries(tmp_path) == 2
+
+    cache.put("cc3", "w" * 10)
+
+    assert cache.get("aa1") is None
+    assert cache.get("bb2") == "z" * 10
+    assert _entries(tmp_path) == 2
+
+
+def test_entries_of_earlier_runs_are_evicted_by_age(tmp_path: Path) -> None:
+    earlier = GenerationCache(str(tmp_path))
+    earlier.put("aa1", "old\n")
+    earlier.put("bb2", "recent\n")
+    os.utime(tmp_path / "aa" / "aa1.py", (1_000_000, 1_000_000))
+    os.utime(tmp_path / "bb" / "bb2.py", (2_000_000, 2_000_000))
+
+    cache = GenerationCache(str(tmp_path), max_entries=2)
+    cache.put("cc3", "new\n")
+
+    assert cache.get("aa1") is None
+    assert cache.get("bb2") == "recent\n"
+    assert _entries(tmp_path) == 2
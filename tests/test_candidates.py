@@ -0,0 +1,112 @@
+import threading
+from typing import Dict
+
+import pytest
+from langchain_core.messages import AIMessage
+
+import tools
+from agent import create_agent
+from fake_model import ScriptedChatModel
+from generation import _generate_candidates
+from metrics import new_module_record
+from validation import ValidationResult, registered_source
+
+SOURCE = "def add(a, b):\n    return a + b\n"
+PASSING = "from calc import add\n\n\ndef test_add():\n    assert add(1, 2) == 3\n"
+FAILING = "from calc import add\n\n\ndef test_add():\n    assert add(1, 2) == 4\n"
+FAILING_ROUNDS = 6
+
+
+def _validate(index: int, test_code: str) -> AIMessage:
+    return AIMessage(
+        content="",
+        tool_calls=[
+            {
+                "name": "validate_tests",
+                "args": {"test_code": test_code, "module_name": "calc"},
+                "id": f"call_{index}",
+            }
+        ],
+    )
+
+
+def _fake_validation(monkeypatch: pytest.MonkeyPatch, runs: Dict[str, int]) -> None:
+    lock = threading.Lock()
+
+    def run_validation(
+        test_code: str, source_code: str, module_name: str
+    ) -> ValidationResult:
+        passed = test_code == PASSING
+        with lock:
+            runs[test_code] = runs.get(test_code, 0) + 1
+        return {
+            "passed": passed,
+            "summary": {"passed" if passed else "failed": 1},
+            "tests": [
+                {
+                    "id": "test_calc.py::test_add",
+                    "outcome": "passed" if passed else "failed",
+                    "duration": 0.0,
+                }
+            ],
+            "failures": (
+                []
+                if passed
+                else [{"id": "test_calc.py::test_add", "traceback": "assert 3 == 4"}]
+            ),
+            "duration": 0.0,
+            "timed_out": False,
+            "coverage": None,
+            "reused": 0,
+        }
+
+    monkeypatch.setattr(tools, "run_validation", run_validation)
+
+
+def test_first_passing_candidate_wins_and_cancels_the_others(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    runs: Dict[str, int] = {}
+    _fake_validation(monkeypatch, runs)
+    model = ScriptedChatModel(
+        # The first candidate keeps failing, the second passes right away
+        default_script=[
+            *(_validate(index, FAILING) for index in range(FAILING_ROUNDS)),
+            AIMessage(content=FAILING),
+        ],
+        scripts={"candidate 2": [_validate(0, PASSING), AIMessage(content=PASSING)]},
+        latency=0.05,
+    )
+    record = new_module_record("calc")
+
+    with registered_source("calc", SOURCE):
+        test_code = _generate_candidates(
+            create_agent(model), "Write tests for calc", 2, 2, record
+        )
+
+    assert test_code == PASSING
+    assert runs[PASSING] == 1
+    # The failing candidate stopped after its current step
+    assert runs[FAILING] < FAILING_ROUNDS
+    assert record["validation_runs"] == runs[PASSING] + runs[FAILING]
+
+
+def test_best_draft_wins_if_no_candidate_passes(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    runs: Dict[str, int] = {}
+    _fake_validation(monkeypatch, runs)
+    model = ScriptedChatModel(
+        default_script=[_validate(0, FAILING), AIMessage(content=FAILING)],
+        scripts={"candidate 2": [AIMessage(content="no tests")]},
+    )
+    record = new_module_record("calc")
+
+    with registered_source("calc", SOURCE):
+        test_code = _generate_candidates(
+            create_agent(model), "Write tests for calc", 2, 2, record
+        )
+
+    # Only the first candidate has a validated draft
+    assert test_code == FAILING
+    assert runs == {FAILING: 1}
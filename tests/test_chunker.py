@@ -0,0 +1,65 @@
+import ast
+
+from chunker import merge_test_fragments
+
+FIRST_FRAGMENT = """import pytest
+
+from source import Box
+
+
+@pytest.fixture
+def obj():
+    return Box(1)
+
+
+def test_first(obj):
+    assert obj.obj == 1
+"""
+
+SECOND_FRAGMENT = """import pytest
+
+from source import Box
+
+
+@pytest.fixture
+def obj():
+    return Box(2)
+
+
+def test_second(obj):
+    box = Box(obj=obj.obj)
+    assert obj.obj == 2
+    assert box.obj == obj.obj
+"""
+
+
+def test_merge_renames_conflicting_fixture_but_not_attributes() -> None:
+    merged = merge_test_fragments([FIRST_FRAGMENT, SECOND_FRAGMENT])
+
+    ast.parse(merged)
+    assert "def obj_2():" in merged
+    assert "def test_second(obj_2):" in merged
+    assert "box = Box(obj=obj_2.obj)" in merged
+    assert "assert obj_2.obj == 2" in merged
+    assert "assert box.obj == obj_2.obj" in merged
+    assert "obj_2.obj_2" not in merged
+    # The first fragment keeps its names
+    assert "def test_first(obj):\n    assert obj.obj == 1" in merged
+
+
+def test_merge_keeps_identical_definitions_once() -> None:
+    merged = merge_test_fragments([FIRST_FRAGMENT, FIRST_FRAGMENT])
+
+    assert merged.count("def obj():") == 1
+    assert merged.count("def test_first(obj):") == 1
+    assert merged.count("import pytest") == 1
+
+
+def test_merge_renames_async_definitions_and_non_ascii_lines() -> None:
+    first = 'def helper():\n    return "ä"\n\n\nasync def test_a():\n    assert helper() == "ä"\n'
+    second = 'def helper():\n    return "ö"\n\n\nasync def test_b():\n    assert "ö" == helper()\n'
+
+    merged = merge_test_fragments([first, second])
+
+    assert 'def helper_2():\n    return "ö"' in merged
+    assert 'assert "ö" == helper_2()' in merged
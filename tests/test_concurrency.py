@@ -0,0 +1,93 @@
+from pathlib import Path
+from typing import List
+
+from langchain_core.messages import AIMessage
+
+from fake_model import ScriptedChatModel
+from generation import GenerationSettings
+from metrics import get_stage_timer
+from pipeline import RunSettings, run_pipeline
+
+SOURCE = '''def {name}_total(prices):
+    """Sum the prices of a basket."""
+    return sum(prices)
+'''
+
+TESTS = """import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent / "../pkg"))
+
+from {name} import {name}_total
+
+
+def test_total():
+    assert {name}_total([1, 2]) == {expected}
+"""
+
+# Number of failing validations before the final answer of every module
+FAILED_VALIDATIONS = {"alpha": 0, "beta": 1, "gamma": 3}
+
+
+def _script(name: str, failed_validations: int) -> List[AIMessage]:
+    validate = {
+        "name": "validate_tests",
+        "args": {"test_code": TESTS.format(name=name, expected=4), "module_name": name},
+    }
+    return [
+        AIMessage(content="", tool_calls=[dict(validate, id=f"{name}-{index}")])
+        for index in range(failed_validations)
+    ] + [AIMessage(content=TESTS.format(name=name, expected=3))]
+
+
+def test_concurrent_modules_keep_their_records_and_budgets(tmp_path: Path) -> None:
+    (tmp_path / "pkg").mkdir()
+    for name in FAILED_VALIDATIONS:
+        (tmp_path / "pkg" / f"{name}.py").write_text(SOURCE.format(name=name))
+    model = ScriptedChatModel(
+        scripts={
+            f"def {name}_total": _script(name, failed_validations)
+            for name, failed_validations in FAILED_VALIDATIONS.items()
+        },
+        # The modules take turns, so a shared record or budget would be noticed
+        latency=0.05,
+    )
+    settings = RunSettings(
+        run_id="concurrency",
+        generation=GenerationSettings(
+            budget_limits={
+                "max_model_turns": 0,
+                "max_validation_runs": 2,
+                "deadline": 0,
+            },
+        ),
+        use_state=False,
+        use_cache=False,
+        use_analysis_cache=False,
+        max_concurrency=3,
+        progress=False,
+    )
+
+    get_stage_timer().reset()
+    result = run_pipeline(
+        settings, str(tmp_path / "pkg"), str(tmp_path / "tests"), chat_model=model
+    )
+
+    spans = [span for span in get_stage_timer().spans() if span["name"] == "module"]
+    assert len({span["thread"] for span in spans}) == 3
+    assert max(span["start"] for span in spans) < min(
+        span["start"] + span["seconds"] for span in spans
+    )
+    records = result["records"]
+    # One model call per failed validation plus the final answer, and one
+    # validation run of the final test module
+    for name in ("alpha", "beta"):
+        assert records[name]["status"] == "passed"
+        assert records[name]["model_calls"] == FAILED_VALIDATIONS[name] + 1
+        assert records[name]["validation_runs"] == FAILED_VALIDATIONS[name] + 1
+    # gamma runs out of its own validation runs before the third validation,
+    # and its failing test is marked as expected to fail
+    assert records["gamma"]["status"] == "partial"
+    assert records["gamma"]["model_calls"] == 3
+    assert records["gamma"]["validation_runs"] == 2 + 2
+    assert "xfail" in (tmp_path / "tests" / "test_gamma.py").read_text()
+    assert result["statuses"]["passed"] == 2
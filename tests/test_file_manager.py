@@ -0,0 +1,52 @@
+from pathlib import Path
+
+import pytest
+
+from file_manager import discover_python_modules
+from generation import _test_file_path
+
+MODULE = '''def add(first, second):
+    """Add two numbers."""
+    return first + second
+'''
+
+
+def test_discovery_skips_the_test_directory_and_test_files(tmp_path: Path) -> None:
+    (tmp_path / "calculator.py").write_text(MODULE)
+    (tmp_path / "test_calculator.py").write_text(MODULE)
+    (tmp_path / "calculator_test.py").write_text(MODULE)
+    (tmp_path / "conftest.py").write_text(MODULE)
+    test_dir = tmp_path / "generated"
+    test_dir.mkdir()
+    (test_dir / "checks.py").write_text(MODULE)
+
+    modules = discover_python_modules(str(tmp_path), test_dir=str(test_dir))
+
+    assert set(modules) == {"calculator"}
+
+
+def test_discovery_without_test_directory_walks_all_directories(
+    tmp_path: Path,
+) -> None:
+    (tmp_path / "generated").mkdir()
+    (tmp_path / "generated" / "checks.py").write_text(MODULE)
+
+    assert set(discover_python_modules(str(tmp_path))) == {"generated.checks"}
+
+
+def test_test_file_paths_of_nested_modules_do_not_clash() -> None:
+    assert _test_file_path("tests", "calculator") == "tests/test_calculator.py"
+    assert _test_file_path("tests", "a.b_c") != _test_file_path("tests", "a_b.c")
+
+
+def test_discovery_reports_directories_that_are_not_packages(
+    tmp_path: Path, capsys: pytest.CaptureFixture
+) -> None:
+    (tmp_path / "my-pkg").mkdir()
+    (tmp_path / "my-pkg" / "calculator.py").write_text(MODULE)
+    (tmp_path / "__pycache__").mkdir()
+
+    assert discover_python_modules(str(tmp_path)) == {}
+    output = capsys.readouterr().out
+    assert "Skipping the directory my-pkg" in output
+    assert "__pycache__" not in output
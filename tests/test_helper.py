@@ -0,0 +1,101 @@
+import ast
+import time
+
+from helper import clean_python_code
+
+HEADER = """import pytest
+
+from inventory import Store
+
+
+@pytest.fixture
+def store():
+    return Store(capacity=10)
+"""
+
+TEST_TEMPLATE = '''
+
+@pytest.mark.parametrize("amount,expected", [(1, 9), (5, 5)])
+def test_remove_{index}(store, amount, expected):
+    """Removing items must reduce the stock; it's checked for {index} too."""
+    store.add("item_{index}", 10)
+    store.remove("item_{index}", amount)
+    result = store.stock(
+        "item_{index}",
+    )
+    assert result == expected
+'''
+
+PROSE = "Here's the next group of tests, they're validated against the store:\n"
+
+
+def _code(tests: int) -> str:
+    return HEADER + "".join(TEST_TEMPLATE.format(index=index) for index in range(tests))
+
+
+def _with_prose(tests: int, prose: str, every: int) -> str:
+    return HEADER + "".join(
+        (prose if index % every == 0 else "") + TEST_TEMPLATE.format(index=index)
+        for index in range(tests)
+    )
+
+
+def _test_names(code: str) -> list:
+    return [
+        node.name
+        for node in ast.parse(code).body
+        if isinstance(node, ast.FunctionDef) and node.name.startswith("test_")
+    ]
+
+
+def test_valid_code_is_kept_unchanged() -> None:
+    code = _code(3)
+
+    assert clean_python_code(code) == code
+
+
+def test_fenced_code_is_extracted_from_prose() -> None:
+    code = _code(3)
+    text = f"Here's the test module:\n```python\n{code}```\nIt covers the store."
+
+    assert clean_python_code(text) == code
+
+
+def test_truncated_last_test_is_dropped() -> None:
+    code = _code(3)
+
+    cleaned = clean_python_code(code[: code.rindex('"item_2",')])
+
+    assert _test_names(cleaned) == ["test_remove_0", "test_remove_1"]
+    assert "def store():" in cleaned
+
+
+def test_prose_between_tests_is_dropped() -> None:
+    cleaned = clean_python_code(_with_prose(4, PROSE, every=2))
+
+    assert PROSE.strip() not in cleaned
+    assert len(_test_names(cleaned)) == 4
+
+
+def test_multi_line_decorators_are_kept_with_their_tests() -> None:
+    code = _code(3).replace(
+        '"amount,expected", [(1, 9), (5, 5)])', '"amount,expected", [\n    (1, 9),\n])'
+    )
+
+    cleaned = clean_python_code(code + "That's all.\n")
+
+    assert cleaned.count("@pytest.mark.parametrize") == 3
+    assert len(_test_names(cleaned)) == 3
+
+
+def test_prose_with_unclosed_brackets_is_cleaned_in_linear_time() -> None:
+    # Every unclosed bracket makes the tokenizer read to the end of the text
+    text = _with_prose(400, "Next group (see below:\n", every=1)
+
+    start = time.perf_counter()
+    cleaned = clean_python_code(text)
+    seconds = time.perf_counter() - start
+
+    assert "see below" not in cleaned
+    assert len(_test_names(cleaned)) == 400
+    assert seconds < 5
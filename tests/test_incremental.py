@@ -0,0 +1,78 @@
+from pathlib import Path
+
+from file_manager import discover_python_modules
+from incremental import (
+    build_import_graph,
+    changed_modules_from_manifest,
+    with_dependents,
+)
+
+PRICING = '''from shop.util import round_price
+
+
+def total(prices):
+    """Sum prices and round the result."""
+    return round_price(sum(prices))
+'''
+
+UTIL = """def round_price(price):
+    return round(price, 2)
+"""
+
+
+def _write_package(root: Path) -> None:
+    package = root / "shop"
+    package.mkdir()
+    (package / "__init__.py").write_text("from .pricing import total\n")
+    (package / "pricing.py").write_text(PRICING)
+    (package / "util.py").write_text(UTIL)
+
+
+def _hashes(root: Path) -> dict:
+    return {
+        module_name: info["content_hash"]
+        for module_name, info in discover_python_modules(
+            str(root), include_skipped=True
+        ).items()
+    }
+
+
+def test_skipped_modules_are_discovered_only_on_request(tmp_path: Path) -> None:
+    _write_package(tmp_path)
+
+    assert set(discover_python_modules(str(tmp_path))) == {"shop.pricing"}
+    all_modules = discover_python_modules(str(tmp_path), include_skipped=True)
+    assert set(all_modules) == {"shop.__init__", "shop.pricing", "shop.util"}
+    assert all_modules["shop.util"]["skipped"]
+    assert not all_modules["shop.pricing"]["skipped"]
+
+
+def test_import_graph_covers_skipped_modules_and_packages(tmp_path: Path) -> None:
+    _write_package(tmp_path)
+    all_modules = discover_python_modules(str(tmp_path), include_skipped=True)
+
+    graph = build_import_graph(
+        {name: info["imported_modules"] for name, info in all_modules.items()}
+    )
+
+    assert graph["shop.pricing"] == {"shop.util"}
+    assert graph["shop.__init__"] == {"shop.pricing"}
+
+
+def test_change_to_skipped_module_selects_its_dependents(tmp_path: Path) -> None:
+    _write_package(tmp_path)
+    manifest = _hashes(tmp_path)
+    (tmp_path / "shop" / "util.py").write_text(UTIL.replace("2)", "3)"))
+    all_modules = discover_python_modules(str(tmp_path), include_skipped=True)
+    graph = build_import_graph(
+        {name: info["imported_modules"] for name, info in all_modules.items()}
+    )
+
+    changed = changed_modules_from_manifest(_hashes(tmp_path), manifest)
+
+    assert changed == {"shop.util"}
+    assert with_dependents(changed, graph) == {
+        "shop.util",
+        "shop.pricing",
+        "shop.__init__",
+    }
@@ -0,0 +1,48 @@
+import json
+from pathlib import Path
+
+from main import main
+
+MODULE = '''def add(first, second):
+    """Add two numbers."""
+    return first + second
+'''
+
+
+def test_batch_exports_the_metrics_of_every_pair(tmp_path: Path) -> None:
+    for name in ("first", "second"):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "calculator.py").write_text(MODULE)
+    batch = tmp_path / "batch.json"
+    batch.write_text(
+        json.dumps(
+            [
+                {"source": "first", "tests": "first_tests"},
+                {"source": "second", "tests": "second_tests"},
+            ]
+        )
+    )
+    metrics = tmp_path / "metrics.jsonl"
+    prometheus = tmp_path / "metrics.prom"
+
+    main(
+        [
+            "--batch",
+            str(batch),
+            "--cache-only",
+            "--no-state",
+            "--cache-dir",
+            str(tmp_path / "cache"),
+            "--metrics-jsonl",
+            str(metrics),
+            "--prometheus-textfile",
+            str(prometheus),
+        ]
+    )
+
+    records = [json.loads(line) for line in metrics.read_text().splitlines()]
+    assert sorted(record["source"] for record in records) == [
+        str(tmp_path / "first"),
+        str(tmp_path / "second"),
+    ]
+    assert prometheus.read_text().count("minerva_module_model_calls{") == 2
@@ -0,0 +1,87 @@
+import json
+import re
+import threading
+from pathlib import Path
+
+from metrics import (
+    StageTimer,
+    module_scope,
+    new_module_record,
+    write_chrome_trace,
+    write_jsonl,
+    write_prometheus,
+)
+
+# A sample line: metric name, labels with escaped values, and a number
+SAMPLE = re.compile(
+    r'^[a-z_]+\{(?:[a-z_]+="(?:[^"\\\n]|\\[\\"n])*",?)*\} -?[0-9.e+-]+$'
+)
+
+
+def test_jsonl_has_one_document_per_record(tmp_path: Path) -> None:
+    first = new_module_record("calc", "/src")
+    first["model_calls"] = 3
+    second = new_module_record("shop.basket", "/src")
+    path = tmp_path / "metrics.jsonl"
+
+    write_jsonl(str(path), [first, second])
+
+    lines = path.read_text().splitlines()
+    assert [json.loads(line) for line in lines] == [first, second]
+
+
+def test_prometheus_labels_are_escaped(tmp_path: Path) -> None:
+    record = new_module_record('odd"name\\x', 'C:\\src\n"quoted"')
+    record["status"] = "passed"
+    record["backend"] = "bedrock"
+    path = tmp_path / "metrics.prom"
+
+    write_prometheus(str(path), [record], {"agent": {"count": 2, "seconds": 1.5}})
+
+    lines = path.read_text().splitlines()
+    samples = [line for line in lines if not line.startswith("#")]
+    assert samples
+    assert all(SAMPLE.match(line) for line in samples), samples
+    assert (
+        'source="C:\\\\src\\n\\"quoted\\"",module="odd\\"name\\\\x",status="passed"'
+        in path.read_text()
+    )
+    assert 'minerva_stage_runs{stage="agent"} 2' in lines
+    assert 'minerva_backend_modules{backend="bedrock",status="passed"} 1' in lines
+
+
+def test_chrome_trace_is_valid_trace_event_json(tmp_path: Path) -> None:
+    timer = StageTimer()
+    # Both threads stay alive until both are done, so their IDs differ
+    barrier = threading.Barrier(2)
+
+    def work(module_name: str) -> None:
+        with module_scope(module_name), timer.stage("module"):
+            with timer.stage("validation"):
+                pass
+        barrier.wait()
+
+    threads = [threading.Thread(target=work, args=(name,)) for name in ("a", "b")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    path = tmp_path / "trace.json"
+
+    write_chrome_trace(str(path), timer.spans())
+
+    events = json.loads(path.read_text())["traceEvents"]
+    assert len(events) == 4
+    for event in events:
+        assert event["ph"] == "X"
+        assert isinstance(event["ts"], int) and event["ts"] >= 0
+        assert isinstance(event["dur"], int) and event["dur"] >= 0
+        assert isinstance(event["pid"], int) and isinstance(event["tid"], int)
+    assert {(event["name"], event["args"]["module"]) for event in events} == {
+        ("module", "a"),
+        ("validation", "a"),
+        ("module", "b"),
+        ("validation", "b"),
+    }
+    # Every thread is its own track
+    assert len({event["tid"] for event in events}) == 2
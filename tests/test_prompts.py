@@ -0,0 +1,113 @@
+from typing import List
+
+from langchain_core.messages import (
+    AIMessage,
+    BaseMessage,
+    HumanMessage,
+    SystemMessage,
+    ToolMessage,
+)
+
+from prompts import cached_system_prompt, prune_messages, system_prompt
+
+
+def _round(index: int, calls: int = 1) -> List[BaseMessage]:
+    ids = [f"call_{index}_{call}" for call in range(calls)]
+    return [
+        AIMessage(
+            content="",
+            tool_calls=[
+                {
+                    "name": "validate_tests",
+                    "args": {"test_code": f"draft {index}"},
+                    "id": id_,
+                }
+                for id_ in ids
+            ],
+        ),
+        *(
+            ToolMessage(
+                content=f"result {id_}", tool_call_id=id_, name="validate_tests"
+            )
+            for id_ in ids
+        ),
+    ]
+
+
+def _assert_paired(messages: List[BaseMessage]) -> None:
+    calls = {
+        call["id"]
+        for message in messages
+        if isinstance(message, AIMessage)
+        for call in message.tool_calls
+    }
+    results = {
+        message.tool_call_id for message in messages if isinstance(message, ToolMessage)
+    }
+    assert calls == results
+
+
+def test_pruning_keeps_the_source_and_the_latest_round() -> None:
+    source = HumanMessage(content="Write tests for calc")
+    messages = [source, *_round(1), *_round(2), *_round(3)]
+
+    pruned = prune_messages(messages)
+
+    assert pruned == [source, *messages[-2:]]
+    _assert_paired(pruned)
+
+
+def test_pruning_keeps_every_result_of_parallel_tool_calls() -> None:
+    messages = [HumanMessage(content="Write tests"), *_round(1), *_round(2, calls=3)]
+
+    pruned = prune_messages(messages)
+
+    assert len(pruned) == 5
+    _assert_paired(pruned)
+
+
+def test_pruning_keeps_the_messages_after_the_latest_round() -> None:
+    messages = [
+        HumanMessage(content="Write tests"),
+        *_round(1),
+        *_round(2),
+        AIMessage(content="def test_add(): ..."),
+    ]
+
+    pruned = prune_messages(messages)
+
+    assert pruned[-1].content == "def test_add(): ..."
+    assert len(pruned) == 4
+    _assert_paired(pruned)
+
+
+def test_conversations_without_tool_calls_are_not_pruned() -> None:
+    messages = [HumanMessage(content="Write tests"), AIMessage(content="done")]
+
+    assert prune_messages(messages) == messages
+
+
+def _cache_marks(message: BaseMessage) -> int:
+    if isinstance(message.content, str):
+        return 0
+    return sum("cache_control" in block for block in message.content)
+
+
+def test_only_the_system_prompt_is_marked_for_prompt_caching() -> None:
+    messages = [HumanMessage(content="Write tests for calc"), *_round(1), *_round(2)]
+
+    prompt = cached_system_prompt({"messages": messages})
+
+    assert isinstance(prompt[0], SystemMessage)
+    assert _cache_marks(prompt[0]) == 1
+    assert prompt[1:] == prune_messages(messages)
+    assert all(_cache_marks(message) == 0 for message in prompt[1:])
+
+
+def test_system_prompt_is_not_marked_without_prompt_caching() -> None:
+    messages = [HumanMessage(content="Write tests for calc"), *_round(1)]
+
+    prompt = system_prompt({"messages": messages})
+
+    assert all(_cache_marks(message) == 0 for message in prompt)
+    assert isinstance(prompt[0].content, str)
@@ -0,0 +1,64 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+from pytest_pool import (
+    PytestWorkerPool,
+    _module_files,
+    _modules_changed,
+    default_limits,
+)
+from validation import _run_subprocess
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="rlimits need the resource module")
+def test_fresh_processes_run_with_the_resource_limits() -> None:
+    limits = default_limits()
+    limits["open_files"] = 64
+    command = [
+        sys.executable,
+        "-c",
+        "import resource; print(resource.getrlimit(resource.RLIMIT_NOFILE)[0])",
+    ]
+
+    result = _run_subprocess(command, os.getcwd(), dict(os.environ), limits)
+
+    assert result.returncode == 0
+    assert result.stdout.strip() == "64"
+
+
+def test_changed_module_files_are_noticed(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    module_path = tmp_path / "pool_probe.py"
+    module_path.write_text("VALUE = 1\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.delitem(sys.modules, "pool_probe", raising=False)
+    __import__("pool_probe")
+    loaded = _module_files()
+
+    assert not _modules_changed(loaded)
+    module_path.write_text("VALUE = 22\n")
+    assert _modules_changed(loaded)
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="the pool needs os.fork")
+def test_workers_are_replaced_after_their_runs(tmp_path: Path) -> None:
+    (tmp_path / "test_probe.py").write_text(
+        "import os\n\n\ndef test_worker():\n    print(os.getppid())\n"
+    )
+    pool = PytestWorkerPool(1, max_runs=2)
+    try:
+        workers = []
+        for _ in range(3):
+            result = pool.run(
+                ["-q", "-s", "test_probe.py"], str(tmp_path), env=dict(os.environ)
+            )
+            assert result.returncode == 0
+            workers.append(result.stdout.split()[0])
+    finally:
+        pool.close()
+
+    assert workers[0] == workers[1] != workers[2]
@@ -0,0 +1,32 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from agent import RateLimitedChatModel
+from fake_model import ScriptedChatModel
+from rate_limit import ModelRateLimiter
+
+
+def test_throttled_calls_are_retried_and_back_off_the_concurrency() -> None:
+    backend = ScriptedChatModel(
+        default_script=[AIMessage(content="def test_done(): pass")],
+        latency=0.05,
+        max_concurrent_calls=2,
+    )
+    limiter = ModelRateLimiter(
+        max_concurrency=8, max_retries=50, base_delay=0.01, max_delay=0.05
+    )
+    model = RateLimitedChatModel(model=backend, limiter=limiter)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        replies = list(
+            executor.map(
+                lambda index: model.invoke([HumanMessage(content=f"module {index}")]),
+                range(16),
+            )
+        )
+
+    assert [reply.content for reply in replies] == ["def test_done(): pass"] * 16
+    assert backend.throttled_calls > 0
+    assert limiter.throttled_calls == backend.throttled_calls
+    assert limiter.stats()["concurrency_limit"] < 8
@@ -0,0 +1,166 @@
+from typing import Any, Dict, List
+
+import pytest
+from langchain_core.messages import AIMessage
+
+import repair
+from agent import create_agent
+from fake_model import ScriptedChatModel
+from metrics import new_module_record
+from repair import mark_failing_tests, repair_test_module, splice_test_module
+from validation import ValidationResult
+
+TESTS = """from __future__ import annotations
+
+from calculator import add
+
+
+@pytest.fixture
+def numbers():
+    return (1, 2)
+
+
+def test_add(numbers):
+    assert add(*numbers) == 3
+
+
+@pytest.mark.parametrize("first", [1, 2])
+def test_add_wrong(first):
+    assert add(first, 2) == 4
+
+
+class TestAdd:
+    def test_zero(self):
+        assert add(0, 0) == 1
+"""
+
+
+def _failed(*node_ids: str) -> ValidationResult:
+    return {
+        "passed": False,
+        "summary": {"failed": len(node_ids)},
+        "tests": [],
+        "failures": [{"id": node_id, "traceback": ""} for node_id in node_ids],
+        "duration": 0.0,
+        "timed_out": False,
+        "coverage": None,
+        "reused": 0,
+    }
+
+
+def _xfail_lines(code: str) -> List[int]:
+    return [
+        index
+        for index, line in enumerate(code.splitlines())
+        if line.startswith("@pytest.mark.xfail")
+    ]
+
+
+def test_failing_tests_are_marked_as_expected_to_fail() -> None:
+    validation = _failed(
+        "test_calculator.py::test_add_wrong[1]",
+        "test_calculator.py::test_add_wrong[2]",
+        "test_calculator.py::TestAdd::test_zero",
+    )
+
+    marked = mark_failing_tests(TESTS, validation)
+
+    assert marked is not None
+    lines = marked.splitlines()
+    assert [lines[index + 1] for index in _xfail_lines(marked)] == [
+        '@pytest.mark.parametrize("first", [1, 2])',
+        "class TestAdd:",
+    ]
+    # pytest is imported after the __future__ import, which has to come first
+    assert lines[:2] == ["from __future__ import annotations", "import pytest"]
+    assert lines[lines.index("def test_add(numbers):") - 1] == ""
+
+
+def test_failing_tests_are_removed_on_request() -> None:
+    validation = _failed("test_calculator.py::test_add_wrong[1]")
+
+    slimmed = mark_failing_tests(TESTS, validation, remove=True)
+
+    assert slimmed is not None
+    assert "test_add_wrong" not in slimmed
+    assert "def test_add(numbers):" in slimmed
+    assert "class TestAdd:" in slimmed
+
+
+def test_module_failing_as_a_whole_is_not_marked() -> None:
+    assert mark_failing_tests(TESTS, _failed("test_calculator.py")) is None
+
+
+FIXED_ADD_WRONG = """@pytest.mark.parametrize("first", [1, 2])
+def test_add_wrong(first):
+    assert add(first, 2) == first + 2"""
+
+
+def test_splice_replaces_only_the_fixed_definitions() -> None:
+    fixed = f"import math\n\n\n{FIXED_ADD_WRONG}\n"
+
+    spliced = splice_test_module(TESTS, fixed)
+
+    before, after = TESTS.split("@pytest.mark.parametrize")
+    after = after[after.index("\n\n\nclass TestAdd:") :]
+    # The new import follows the existing ones, everything else is unchanged
+    expected_before = before.replace(
+        "from calculator import add\n", "from calculator import add\nimport math\n"
+    )
+    assert spliced == expected_before + FIXED_ADD_WRONG + after
+
+
+def test_splice_appends_new_definitions() -> None:
+    fixed = """@pytest.fixture
+def zero():
+    return 0
+
+
+class TestAdd:
+    def test_zero(self, zero):
+        assert add(zero, zero) == 0
+"""
+
+    spliced = splice_test_module(TESTS, fixed)
+
+    assert spliced.startswith(TESTS[: TESTS.index("class TestAdd:")])
+    assert spliced.endswith(
+        "class TestAdd:\n    def test_zero(self, zero):\n"
+        "        assert add(zero, zero) == 0\n"
+        "\n\n@pytest.fixture\ndef zero():\n    return 0\n"
+    )
+
+
+def test_repair_sends_and_replaces_only_the_failing_tests(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    prompts: List[Dict[str, Any]] = []
+
+    def repair_prompt(*args: str) -> str:
+        prompts.append(dict(zip(["header", "failing_tests", "tracebacks"], args[3:])))
+        return "Fix the failing tests"
+
+    monkeypatch.setattr(repair, "repair_prompt", repair_prompt)
+    model = ScriptedChatModel(
+        default_script=[AIMessage(content=f"```python\n{FIXED_ADD_WRONG}\n```")]
+    )
+    record = new_module_record("calculator")
+
+    repaired = repair_test_module(
+        create_agent(model),
+        TESTS,
+        _failed("test_calculator.py::test_add_wrong[1]"),
+        "..",
+        "calculator",
+        "def add(first, second):\n    return first + second\n",
+        record,
+    )
+
+    assert repaired is not None
+    assert prompts[0]["failing_tests"].startswith("@pytest.mark.parametrize")
+    assert "def test_add(numbers)" not in prompts[0]["failing_tests"]
+    assert "from calculator import add" in prompts[0]["header"]
+    start = TESTS.index("@pytest.mark.parametrize")
+    end = TESTS.index("\n\n\nclass TestAdd:")
+    assert repaired == TESTS[:start] + FIXED_ADD_WRONG + TESTS[end:]
+    assert record["repair_iterations"] == 1
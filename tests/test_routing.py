@@ -0,0 +1,87 @@
+from pathlib import Path
+
+from langchain_core.messages import AIMessage
+
+from fake_model import ScriptedChatModel
+from pipeline import RunSettings, run_pipeline
+
+SOURCE = '''def total(prices, discount=0.0):
+    """Sum the prices of a basket and apply a discount."""
+    return sum(prices) * (1 - discount)
+'''
+
+TESTS = """import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent / "../pkg"))
+
+from basket import total
+
+
+def test_total():
+    assert total([1, 2]) == {expected}
+"""
+
+
+def test_simple_module_escalates_when_local_tests_fail(tmp_path: Path) -> None:
+    (tmp_path / "pkg").mkdir()
+    (tmp_path / "pkg" / "basket.py").write_text(SOURCE)
+    local_model = ScriptedChatModel(
+        default_script=[AIMessage(content=TESTS.format(expected=4))]
+    )
+    primary_model = ScriptedChatModel(
+        default_script=[AIMessage(content=TESTS.format(expected=3))]
+    )
+    settings = RunSettings(
+        run_id="routing",
+        use_state=False,
+        use_cache=False,
+        use_analysis_cache=False,
+        local_model="local",
+        progress=False,
+    )
+
+    result = run_pipeline(
+        settings,
+        str(tmp_path / "pkg"),
+        str(tmp_path / "tests"),
+        chat_model=primary_model,
+        local_chat_model=local_model,
+    )
+
+    record = result["records"]["basket"]
+    assert record["route"].startswith("local: ")
+    assert record["escalations"] == 1
+    assert record["backend"] == settings.generation.model_name
+    assert record["status"] == "passed"
+    assert result["statuses"]["passed"] == 1
+    assert "== 3" in (tmp_path / "tests" / "test_basket.py").read_text()
+
+
+def test_simple_module_stays_local_when_its_tests_pass(tmp_path: Path) -> None:
+    (tmp_path / "pkg").mkdir()
+    (tmp_path / "pkg" / "basket.py").write_text(SOURCE)
+    local_model = ScriptedChatModel(
+        default_script=[AIMessage(content=TESTS.format(expected=3))]
+    )
+    primary_model = ScriptedChatModel(default_script=[])
+    settings = RunSettings(
+        run_id="routing",
+        use_state=False,
+        use_cache=False,
+        use_analysis_cache=False,
+        local_model="local",
+        progress=False,
+    )
+
+    result = run_pipeline(
+        settings,
+        str(tmp_path / "pkg"),
+        str(tmp_path / "tests"),
+        chat_model=primary_model,
+        local_chat_model=local_model,
+    )
+
+    record = result["records"]["basket"]
+    assert record["escalations"] == 0
+    assert record["backend"] == "local"
+    assert record["status"] == "passed"
@@ -0,0 +1,11 @@
+from scheduler import longest_first_order, simulate_makespan
+
+
+def test_expensive_modules_start_first() -> None:
+    costs = {"small": 1.0, "large": 10.0, "medium": 5.0, "other": 5.0}
+
+    order = longest_first_order(costs)
+
+    assert order == ["large", "medium", "other", "small"]
+    assert simulate_makespan(order, costs, workers=2) == 11.0
+    assert simulate_makespan(sorted(costs, key=costs.get), costs, workers=2) == 15.0
@@ -0,0 +1,40 @@
+from slimming import find_redundant_tests, find_slow_tests
+
+
+def test_tests_covered_by_faster_tests_are_redundant() -> None:
+    costs = {
+        "test_slow_total": (2.0, {"basket.py:3", "basket.py:4"}),
+        "test_add": (0.1, {"basket.py:3"}),
+        "test_total": (0.1, {"basket.py:4"}),
+    }
+
+    assert find_redundant_tests(costs, set()) == ["test_slow_total"]
+
+
+def test_one_of_two_identical_tests_is_kept() -> None:
+    costs = {
+        "test_a": (0.1, {"basket.py:3"}),
+        "test_b": (0.1, {"basket.py:3"}),
+    }
+
+    assert find_redundant_tests(costs, set()) == ["test_a"]
+
+
+def test_tests_without_coverage_are_not_redundant() -> None:
+    costs = {
+        "test_import": (0.1, set()),
+        "test_add": (0.1, {"basket.py:3"}),
+    }
+
+    assert find_redundant_tests(costs, set()) == []
+
+
+def test_excluded_tests_do_not_cover_other_tests() -> None:
+    costs = {
+        "test_slow": (5.0, {"basket.py:3"}),
+        "test_add": (0.1, {"basket.py:3"}),
+    }
+
+    assert find_redundant_tests(costs, {"test_slow"}) == []
+    assert find_slow_tests(costs, 1.0) == ["test_slow"]
+    assert find_slow_tests(costs, 0) == []
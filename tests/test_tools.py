@@ -0,0 +1,53 @@
+import subprocess
+
+import pytest
+from langchain_core.messages import AIMessage, ToolMessage
+
+import tools
+from agent import create_agent, run_agent
+from fake_model import ScriptedChatModel
+from validation import registered_source
+
+SOURCE = "def add(a, b):\n    return a + b\n"
+TESTS = "from calc import add\n\n\ndef test_add():\n    assert add(1, 2) == 3\n"
+
+
+def test_validation_errors_propagate_unchanged(monkeypatch: pytest.MonkeyPatch) -> None:
+    def run_validation(test_code: str, source_code: str, module_name: str) -> None:
+        raise subprocess.SubprocessError("pytest is not installed")
+
+    monkeypatch.setattr(tools, "run_validation", run_validation)
+
+    with pytest.raises(subprocess.SubprocessError, match="^pytest is not installed$"):
+        tools.validate_tests.invoke({"test_code": TESTS, "source_code": SOURCE})
+
+
+def test_agent_reads_validation_errors(monkeypatch: pytest.MonkeyPatch) -> None:
+    def run_validation(test_code: str, source_code: str, module_name: str) -> None:
+        raise PermissionError("sandbox is read-only")
+
+    monkeypatch.setattr(tools, "run_validation", run_validation)
+    model = ScriptedChatModel(
+        default_script=[
+            AIMessage(
+                content="",
+                tool_calls=[
+                    {
+                        "name": "validate_tests",
+                        "args": {"test_code": TESTS, "module_name": "calc"},
+                        "id": "call_1",
+                    }
+                ],
+            ),
+            AIMessage(content=TESTS),
+        ]
+    )
+
+    with registered_source("calc", SOURCE):
+        messages = run_agent(create_agent(model), "Write tests for calc")
+
+    errors = [m for m in messages if isinstance(m, ToolMessage)]
+    assert len(errors) == 1
+    assert errors[0].status == "error"
+    assert "sandbox is read-only" in errors[0].content
+    assert messages[-1].content == TESTS
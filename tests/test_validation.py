@@ -0,0 +1,119 @@
+import ast
+from typing import Iterator, List, Optional
+
+import pytest
+
+import validation
+from validation import run_validation
+
+SOURCE = "def add(first, second):\n    return first + second\n"
+
+TESTS = """from source import add
+
+
+def test_add():
+    assert add(1, 2) == 3
+
+
+def test_add_negative():
+    assert add(-1, -2) == -3
+"""
+
+
+@pytest.fixture
+def runs(monkeypatch: pytest.MonkeyPatch) -> Iterator[List[Optional[List[str]]]]:
+    """Replace pytest runs by a fake that fails the tests asserting False, and
+    record the tests selected by every run, None for all of them."""
+    calls: List[Optional[List[str]]] = []
+
+    def run_tests(
+        test_code: str,
+        source_code: str,
+        module_name: str,
+        limits: validation.ResourceLimits,
+        test_names: Optional[List[str]] = None,
+        per_test_coverage: bool = False,
+    ) -> validation.TestProfile:
+        calls.append(test_names)
+        tests = [
+            {
+                "id": f"test_{module_name}.py::{node.name}",
+                "outcome": (
+                    "failed" if "assert False" in ast.unparse(node) else "passed"
+                ),
+                "duration": 0.01,
+            }
+            for node in ast.parse(test_code).body
+            if isinstance(node, ast.FunctionDef)
+            and (test_names is None or node.name in test_names)
+        ]
+        passed = all(test["outcome"] == "passed" for test in tests)
+        return {
+            "validation": {
+                "passed": passed,
+                "summary": validation._summarize(tests),
+                "tests": tests,
+                "failures": [],
+                "duration": 0.01,
+                "timed_out": False,
+                "coverage": None,
+                "reused": 0,
+            },
+            "covered": None,
+        }
+
+    monkeypatch.setattr(validation, "_run_tests", run_tests)
+    monkeypatch.setattr(validation, "_incremental", True)
+    validation._outcome_memo.clear()
+    yield calls
+    validation._outcome_memo.clear()
+
+
+def test_unchanged_tests_are_reused_and_edited_tests_rerun(
+    runs: List[Optional[List[str]]],
+) -> None:
+    run_validation(TESTS, SOURCE)
+    edited = TESTS.replace("assert add(-1, -2) == -3", "assert False")
+
+    result = run_validation(edited, SOURCE)
+
+    assert runs == [None, ["test_add_negative"]]
+    assert not result["passed"]
+    assert result["reused"] == 1
+    assert {test["id"]: test["outcome"] for test in result["tests"]} == {
+        "test_source.py::test_add": "passed",
+        "test_source.py::test_add_negative": "failed",
+    }
+
+
+def test_passing_partial_run_is_confirmed_by_a_full_run(
+    runs: List[Optional[List[str]]],
+) -> None:
+    run_validation(TESTS, SOURCE)
+    edited = TESTS.replace("add(-1, -2) == -3", "add(-2, -2) == -4")
+
+    result = run_validation(edited, SOURCE)
+
+    assert runs == [None, ["test_add_negative"], None]
+    assert result["passed"]
+    assert result["summary"] == {"passed": 2}
+
+
+@pytest.mark.parametrize(
+    "source, tests",
+    [
+        (SOURCE.replace("first + second", "second + first"), TESTS),
+        (SOURCE, TESTS.replace("from source import add", "from source import *")),
+    ],
+    ids=["source changed", "context changed"],
+)
+def test_changed_source_or_context_reruns_every_test(
+    runs: List[Optional[List[str]]], source: str, tests: str
+) -> None:
+    run_validation(TESTS, SOURCE)
+    edited = tests.replace("assert add(-1, -2) == -3", "assert False")
+
+    result = run_validation(edited, source)
+
+    assert runs == [None, None]
+    assert result["reused"] == 0